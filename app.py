@@ -1,10 +1,11 @@
 from flask import Flask, request, jsonify, send_file, render_template
 import os
-import shutil
 from datetime import datetime
 import logging
+import threading
 from flask_cors import CORS
-from util.file_operations import get_all_subdirs, clear_directory, check_and_extract_archive, get_subdirs
+from util.file_operations import get_all_subdirs, clear_directory, check_and_extract_archive, get_subdirs, \
+    move_to_trash, reap_trash
 from util.markdown_operations import convert_markdown_to_pdf, convert_markdown_to_html, \
     convert_md_to_docx_with_toc_and_template
 from util.utils import generate_unique_urlid
@@ -97,10 +98,10 @@ def cleanup():
 
     if os.path.exists(directory_path):
         try:
-            # 删除目录
-            shutil.rmtree(directory_path)
-            shutil.rmtree(directory_path_out)
-            shutil.rmtree(directory_path_template)
+            # 目录移入回收目录，由后台线程删除
+            move_to_trash(directory_path)
+            move_to_trash(directory_path_out)
+            move_to_trash(directory_path_template)
             # 从全局字典中删除相关条目
             if urlid in uploaded_md_filename:
                 del uploaded_md_filename[urlid]
@@ -228,4 +229,12 @@ def convert_file():
 
 if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO)
-    app.run(debug=True)
+    # 后台删除移入回收目录的文件。debug 模式的重载器会运行一个监视进程和一个处理请求的子进程（环境变量
+    # WERKZEUG_RUN_MAIN 为 'true'），回收线程只在子进程中启动，避免两个进程同时删除同一个回收目录
+    stop_event = threading.Event()
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        threading.Thread(target=reap_trash, args=(stop_event,), name='trash-reaper', daemon=True).start()
+    try:
+        app.run(debug=True)
+    finally:
+        stop_event.set()
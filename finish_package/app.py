@@ -1,338 +1,1454 @@
-from flask import Flask, request, jsonify, send_file, render_template, url_for, after_this_request
-import os
-from templates import config
-import logging
-from logging.handlers import RotatingFileHandler  # 日志文件旋转处理器
-from flask_cors import CORS  # 跨域资源共享
-from util.file_operations import get_all_subdirs, clear_directory, check_and_extract_archive, get_subdirs
-from util.markdown_operations import convert_markdown_to_pdf, convert_markdown_to_html, convert_md_to_docx_with_toc_and_template
-from util.utils import generate_unique_urlid
-from util.generate import generate_latex_document_pdf, generate_parameter, create_template_with_headers
-import shutil
-from datetime import datetime, timedelta  # 日期和时间处理
-from werkzeug.utils import secure_filename  # 文件名安全处理
-import schedule  # 任务调度
-import time
-import threading  # 线程处理
-import portalocker
-import traceback
-
-
-# 创建Flask应用实例，指定静态文件和模板文件的目录
-app = Flask(__name__, static_folder="templates/assets", template_folder="templates")
-CORS(app)  # 允许跨域资源共享
-
-# 存储上传的 Markdown 文件名
-uploaded_md_filename = {}
-
-# 配置日志记录
-if not os.path.exists('logs'):  # 如果日志目录不存在，创建日志目录
-    os.makedirs('logs')
-
-# 配置日志文件旋转处理器
-log_handler = RotatingFileHandler('logs/application.log', maxBytes=1000000, backupCount=5)
-log_handler.setLevel(logging.INFO)  # 设置日志记录级别为INFO
-log_format = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')  # 设置日志格式
-log_handler.setFormatter(log_format)
-app.logger.addHandler(log_handler)  # 将处理器添加到Flask应用的日志记录器中
-
-def setup_logger(name):
-    """
-    创建和配置单独的日志记录器。
-    """
-    logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
-    handler = RotatingFileHandler(f'logs/{name}.log', maxBytes=1000000, backupCount=5)
-    handler.setFormatter(log_format)
-    logger.addHandler(handler)
-    return logger
-
-# 创建多个日志记录器，用于不同的日志记录
-index_logger = setup_logger('index')
-upload_logger = setup_logger('upload')
-convert_logger = setup_logger('convert')
-download_logger = setup_logger('download')
-
-@app.route('/')
-def index():
-    """
-    渲染主页模板。
-    """
-    index_logger.info("Rendering index page")
-    return render_template('index.html')
-
-
-def add_uploaded_file_record(urlid, md_filename):
-    try:
-        with open('uploaded_files.txt', 'a') as f:
-            portalocker.lock(f, portalocker.LOCK_EX)  # 排他锁
-            f.write(f"{urlid},{md_filename}\n")
-            portalocker.unlock(f)  # 释放锁
-    except Exception as e:
-        upload_logger.error(f"Error while adding uploaded file record: {e}")
-        upload_logger.error(traceback.format_exc())
-
-def get_md_filename(urlid):
-    md_filename = None
-    try:
-        with open('uploaded_files.txt', 'r') as f:
-            portalocker.lock(f, portalocker.LOCK_SH)  # 共享锁
-            lines = f.readlines()  # 读取所有行
-            for line in lines:
-                line_urlid, line_md_filename = line.strip().split(',')
-                if line_urlid == urlid:
-                    md_filename = line_md_filename
-                    break
-            f.seek(0)  # 重置文件指针位置
-            portalocker.unlock(f)  # 释放锁
-    except Exception as e:
-        convert_logger.error(f"Error while getting markdown filename: {e}")
-        convert_logger.error(traceback.format_exc())
-    return md_filename
-
-
-
-@app.route('/upload', methods=['POST'])
-def upload_file():
-    """
-    处理文件上传，解压缩文件并返回唯一标识符（urlid）。
-
-    请求:
-        POST /upload
-
-    返回:
-        包含上传和解压状态及唯一标识符的 JSON 响应。
-    """
-    if 'file' not in request.files:
-        upload_logger.error("No file part in the request")
-        return jsonify({"error": "未指定文件"}), 400
-
-    file = request.files['file']
-
-    if file.filename == '':
-        upload_logger.error("No selected file")
-        return jsonify({"error": "未选择文件"}), 400
-
-    urlid = request.form.get('urlid', generate_unique_urlid())  # 获取或生成唯一标识符
-    extract_to = os.path.join(os.getcwd(), urlid)  # 解压目标路径
-
-    if not os.path.exists(extract_to):
-        os.makedirs(extract_to, exist_ok=True)
-    else:
-        clear_directory(extract_to)  # 清空目标目录
-
-    temp_dir = os.path.join(os.getcwd(), 'temp')  # 临时目录
-    os.makedirs(temp_dir, exist_ok=True)
-
-    zip_path = os.path.join(temp_dir, secure_filename(file.filename))  # 安全处理后的文件路径
-    file.save(zip_path)  # 保存上传文件
-
-    result = check_and_extract_archive(zip_path, extract_to)  # 解压文件
-    os.remove(zip_path)  # 删除临时压缩文件
-
-    if result:
-        try:
-            md_file_name = next(file for file in os.listdir(extract_to) if file.endswith('.md'))  # 获取Markdown文件名
-            uploaded_md_filename[urlid] = md_file_name
-            str_name = uploaded_md_filename[urlid].split(".")
-            upload_logger.info(f"File uploaded and extracted successfully: {md_file_name}, urlid: {urlid}")
-
-            add_uploaded_file_record(urlid=urlid, md_filename=md_file_name)  # 记录上传的文件信息
-
-            return jsonify({"success": f"文件已上传并解压至 {extract_to}", "urlid": urlid, "name": str_name[0]}), 200
-        except StopIteration:
-            upload_logger.error("No valid .md file found in the archive")
-            return jsonify({"error": "未找到有效的 .md 文件"}), 400
-    else:
-        upload_logger.error("File extraction failed")
-        return jsonify({"error": "解压失败"}), 400
-
-@app.route('/convert', methods=['POST'])
-def convert_file():
-    """
-    根据请求将 Markdown 文件转换为指定格式（pdf、html、docx）。
-
-    请求:
-        POST /convert
-
-    返回:
-        生成的文件或错误信息。
-    """
-    try:
-        if 'output_format' not in request.form:
-            convert_logger.error("No output format specified")
-            return jsonify({"error": "未指定格式"}), 400
-
-        output_format = request.form['output_format']
-
-        if output_format not in ['pdf', 'html', 'docx']:
-            convert_logger.error("Invalid format specified")
-            return jsonify({"error": "格式无效"}), 400
-
-        title = request.form.get('title', 'Document Title')  # 获取文档标题
-        version = request.form.get('version', '版本号: 1.0')  # 获取版本号
-        statement = request.form.get('statement', '')  # 获取声明
-        left_header = request.form.get('left_header', 'Left Header')  # 获取左侧页眉
-        right_header = request.form.get('right_header', 'Right Header')  # 获取右侧页眉
-        cover_footer = request.form.get('cover_footer', 'Cover Footer')  # 获取封面页脚
-
-        urlid = request.form.get('urlid')
-        extract_to = os.path.join(os.getcwd(), urlid)  # 解压目录
-        output_directory = os.path.join(os.getcwd(), f'{urlid}_out')  # 输出目录
-        template_directory = os.path.join(os.getcwd(), f'{urlid}_template')  # 模板目录
-        os.makedirs(output_directory, exist_ok=True)
-        os.makedirs(template_directory, exist_ok=True)
-
-        resource_paths = get_all_subdirs(extract_to)  # 获取所有子目录
-        resource_paths.append(os.path.abspath(extract_to))
-        imgs_dir = get_subdirs(extract_to)
-
-        if imgs_dir:
-            resource_paths.append(os.path.join(extract_to, imgs_dir[0]))
-
-        md_filename = get_md_filename(urlid=urlid)
-        if md_filename is None:
-            convert_logger.error("No markdown file found for the given URLID")
-            return jsonify({"error": "未找到与urlid相关的Markdown文件"}), 400
-
-        input_file = os.path.join(extract_to, md_filename)  # 输入文件路径
-        output_file = os.path.join(output_directory, os.path.basename(input_file).replace(".md", f".{output_format}"))  # 输出文件路径
-
-        logo_file = request.files.get('logo')  # 获取Logo文件
-        logo_path = None
-        if logo_file:
-            logo_path = os.path.join(extract_to, 'logo.png')
-            logo_file.save(logo_path)
-            logo_path = logo_path.replace("\\", "/")
-
-        parameter = generate_parameter(title=title, version=version, statement=statement)  # 生成参数
-
-        if output_format == "pdf":
-            tex_path = generate_latex_document_pdf(
-                left_header=left_header,
-                right_header=right_header,
-                cover_footer=cover_footer,
-                urlid=template_directory,
-            )
-            convert_markdown_to_pdf(
-                input_file=input_file,
-                title=parameter["title"],
-                version=parameter["version"],
-                date=parameter["date"],
-                output_file=output_file,
-                header_file=os.path.join(os.getcwd(), tex_path),
-                logo_path=logo_path,
-                resource_paths=resource_paths,
-                statement=parameter["statement"]
-            )
-        elif output_format == "html":
-            convert_markdown_to_html(
-                input_file=input_file,
-                output_file=output_file,
-                resource_paths=resource_paths,
-                title=parameter["title"]
-            )
-        elif output_format == "docx":
-            template_file_path = os.path.join(template_directory, 'template_with_headers.docx')
-            create_template_with_headers(
-                template_path=template_file_path,
-                left_header=left_header,
-                right_header=right_header,
-            )
-            convert_md_to_docx_with_toc_and_template(
-                md_file_path=input_file,
-                docx_file_path=output_file,
-                template_file_path=template_file_path,
-                title=title,
-                version=version,
-                date=datetime.now().strftime("%Y-%m-%d"),
-                left_header=left_header,
-                right_header=right_header,
-                statement=statement,
-                resource_paths=resource_paths,
-                logo_path=logo_path
-            )
-
-        if not os.path.exists(output_file):
-            convert_logger.error(f"{output_format.upper()} file not created")
-            return jsonify({"error": f"{output_format.upper()} 文件未创建"}), 500
-
-        download_link = url_for('download_file', urlid=urlid, filename=os.path.basename(output_file), _external=True)  # 生成下载链接
-        convert_logger.info(f"File converted successfully: {output_file}")
-        return jsonify({"download_link": download_link}), 200
-
-    except Exception as e:
-        convert_logger.error(f"Internal server error: {e}")
-        return jsonify({"error": "内部服务器错误"}), 500
-
-@app.route('/download/<urlid>/<filename>')
-def download_file(urlid, filename):
-    """
-    下载指定文件。
-
-    请求:
-        GET /download/<urlid>/<filename>
-
-    返回:
-        下载文件。
-    """
-    # os.remove('temp')
-    output_directory = os.path.join(os.getcwd(), f'{urlid}_out')
-    file_path = os.path.join(output_directory, filename)
-
-    if os.path.exists(file_path):
-        download_logger.info(f"File downloaded: {file_path}")
-        return send_file(file_path, as_attachment=True)
-    else:
-        download_logger.error(f"File not found: {file_path}")
-        return jsonify({"error": "文件未找到"}), 404
-
-def delete_previous_day_directories():
-    """
-    删除前一天的URL目录。
-    """
-    previous_day = (datetime.now() - timedelta(1)).strftime('%Y%m%d')
-    script_dir = os.path.dirname(os.path.abspath(__file__))  # 获取当前脚本所在目录
-    # base_dir = os.path.dirname(script_dir)  # 获取上一级目录
-    print(script_dir)
-    app.logger.info(f"Checking for directories to delete for date: {previous_day} in base directory: {script_dir}")
-
-    # 遍历基础目录中的所有目录
-    for dir_name in os.listdir(script_dir):
-        dir_path = os.path.join(script_dir, dir_name)
-        # 如果目录名以前一天的日期开头，并且是一个目录，则删除它
-        if os.path.isdir(dir_path) and dir_name.startswith(previous_day):
-            try:
-                shutil.rmtree(dir_path)
-                app.logger.info(f"Deleted directory: {dir_path}")
-            except Exception as e:
-                app.logger.error(f"Failed to delete {dir_path}: {e}")
-        else:
-            app.logger.info(f"Skipping directory: {dir_path}")
-
-def schedule_tasks(stop_event):
-    """
-    安排定时任务。
-    """
-    schedule.every().day.at("01:00").do(delete_previous_day_directories)  # 每天凌晨1点删除前一天的目录
-    app.logger.info("Scheduled daily directory cleanup at 01:00 AM.")
-
-    while not stop_event.is_set():
-        schedule.run_pending()
-        time.sleep(1)
-
-if __name__ == '__main__':
-    logging.basicConfig(level=logging.INFO)
-
-    # 创建一个停止事件
-    stop_event = threading.Event()
-
-    # 启动后台线程运行定时任务
-    task_thread = threading.Thread(target=schedule_tasks, args=(stop_event,), daemon=True)
-    task_thread.start()
-
-    try:
-        app.run(host=config.HOST, port=config.PORT, debug=config.DEBUG, use_reloader=False)
-    finally:
-        stop_event.set()  # 停止后台线程
-        task_thread.join()  # 确保后台线程在应用关闭时正确退出
+from flask import Flask, request, jsonify, send_file, render_template, url_for, after_this_request, g
+import os
+import re
+import json
+import hmac
+import random
+import mimetypes
+from urllib.parse import quote, unquote
+from templates import config
+import logging
+from flask_cors import CORS  # 跨域资源共享
+from util.file_operations import get_all_subdirs, check_and_extract_archive, get_subdirs, \
+    get_content_addressed_path
+from util.markdown_operations import convert_markdown_to_pdf_async, convert_markdown_to_html_async, \
+    convert_md_to_docx_with_toc_and_template_async, convert_markdown_to_html_site_async
+from util.job_operations import run_conversion, cancel_conversions, start_speculative_conversion, \
+    configure_scheduler, configure_shared_state, hash_flight_key, ConversionCancelledError
+from util.distributed_queue import configure_queue, submit_job, wait_for_result, cancel_jobs
+from util.object_store import put_object, get_object, put_bytes, get_bytes, get_object_mtime, delete_objects, \
+    configure_s3
+from util.storage import configure_storage, get_upload_dir, get_template_dir, get_output_dir, get_temp_dir, \
+    delete_urlid_dirs, delete_expired_sessions, is_valid_urlid, get_session_size, get_storage_roots, move_to_trash, \
+    reap_trash, scan_cache_entries, delete_cache_entries
+from util.session_store import record_upload, get_upload, delete_upload, prune_session_store, record_session_access, \
+    get_expired_sessions, get_session_usage, get_least_recent_sessions
+from util.leader_election import run_as_leader
+from util.cost_model import get_document_features, estimate_cost, record_cost
+from util.rate_limit import consume_tokens, settle_tokens, prune_token_buckets
+from util.process_operations import ProcessLimitError
+from util.metrics import configure_metrics, generate_metrics, time_stage, observe_upload, observe_conversion, \
+    observe_request, count_cache_result, count_served_bytes, set_storage_bytes
+from util.tracing import start_timeline, clear_timeline, get_timeline, span, add_spans, export_spans, \
+    summarize_timeline, format_server_timing
+from util.profiling import load_profiling_state, save_profiling_state, should_profile, start_profile, stop_profile, \
+    save_profile, list_profiles
+from util.log_operations import start_log_listener, bind_log_context, clear_log_context
+from util.utils import generate_unique_urlid, get_cached_file_hash, compute_file_hash, touch_access_time
+from util.generate import generate_latex_document_pdf, generate_parameter, create_template_with_headers
+from util.compress_operations import choose_precompressed, parse_accept_encoding
+from util.static_assets import build_static_manifest
+import shutil
+from datetime import datetime, timedelta  # 日期和时间处理
+from werkzeug.utils import secure_filename  # 文件名安全处理
+from werkzeug.security import safe_join  # 路径安全拼接
+from werkzeug.middleware.proxy_fix import ProxyFix  # 从 X-Forwarded-For 取得客户端地址
+import schedule  # 任务调度
+import time
+import threading  # 线程处理
+import hashlib
+import math
+import base64
+import portalocker  # 同一节点的多个进程只由一个解压对象存储中的压缩包
+from functools import partial
+
+
+# 创建Flask应用实例，指定模板文件的目录；静态资源由 serve_static_asset 按清单提供
+app = Flask(__name__, static_folder=None, template_folder="templates")
+app.config['USE_X_SENDFILE'] = config.DOWNLOAD_OFFLOAD == 'x-sendfile'  # 由前置服务器发送文件内容
+CORS(app)  # 允许跨域资源共享
+if config.PROXY_FIX_X_FOR:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=config.PROXY_FIX_X_FOR)  # 位于反向代理之后
+
+# 配置日志记录：各记录器只把记录放入队列，由后台线程写入 logs 下的文件并轮转，日志 I/O 不阻塞请求；
+# 各 worker 进程共享这些文件，写入和轮转由文件锁串行。
+# 各接口的记录器写入同名文件，Flask 应用和 util 模块的日志写入 application.log
+LOG_FILES = ['index', 'upload', 'convert', 'download', 'cleanup', 'slow_request']
+log_handler = start_log_listener('logs', {name: name for name in LOG_FILES}, json_format=config.LOG_FORMAT == 'json')
+log_handler.setLevel(config.LOG_LEVEL)
+app.logger.setLevel(config.LOG_LEVEL)
+app.logger.addHandler(log_handler)  # 将处理器添加到Flask应用的日志记录器中
+util_logger = logging.getLogger('util')
+util_logger.setLevel(config.LOG_LEVEL)
+util_logger.addHandler(log_handler)
+
+def setup_logger(name):
+    """
+    创建和配置单独的日志记录器，写入 logs/<name>.log。
+    """
+    logger = logging.getLogger(name)
+    logger.setLevel(config.LOG_LEVEL)
+    logger.addHandler(log_handler)
+    return logger
+
+# 创建多个日志记录器，用于不同的日志记录
+index_logger = setup_logger('index')
+upload_logger = setup_logger('upload')
+convert_logger = setup_logger('convert')
+download_logger = setup_logger('download')
+cleanup_logger = setup_logger('cleanup')
+# 处理时间超过 SLOW_REQUEST_SECONDS 的请求，每行为一个请求的 JSON 时间线
+slow_request_logger = setup_logger('slow_request')
+
+# 启动时生成页面引用的静态资源清单并预压缩，旧版本构建遗留的资源不在清单中
+static_manifest = build_static_manifest(
+    index_path=os.path.join(app.root_path, 'templates', 'index.html'),
+    assets_dir=os.path.join(app.root_path, 'templates', 'assets'),
+    cache_dir=os.path.join(os.getcwd(), config.STATIC_CACHE_DIR),
+)
+app.logger.info(f"Static asset manifest built with {len(static_manifest)} files")
+
+# 上传记录、已完成的转换和取消广播保存在多个工作进程共享的数据库中
+session_db = os.path.join(os.getcwd(), config.SESSION_DB)
+configure_shared_state(session_db)
+
+# 转换作业按预计最短作业优先调度，预计值由成本模型根据实测的子进程资源使用不断修正；
+# CONVERSION_WORKERS 为整个节点的并发转换数，由各工作进程平分（gunicorn.conf.py 设置 APP_WORKER_PROCESSES）
+worker_processes = int(os.environ.get('APP_WORKER_PROCESSES', '1'))
+configure_scheduler(max(1, config.CONVERSION_WORKERS // worker_processes), config.SCHEDULER_AGING_RATE)
+cost_model_path = os.path.join(os.getcwd(), config.COST_MODEL_DB)
+rate_limit_db = os.path.join(os.getcwd(), config.RATE_LIMIT_DB)
+
+# 解压目录、模板目录和临时文件位于 SCRATCH_DIR（可以是 tmpfs），转换输出位于 OUTPUT_DIR，
+# 都按 <根目录>/<日期>/<分片>/<urlid> 存放
+scratch_root, output_root = configure_storage(config.SCRATCH_DIR, config.OUTPUT_DIR)
+
+# 会话在最后一次访问 SESSION_TTL 秒后过期，由后台任务按过期索引持续删除；同一会话在 SESSION_TOUCH_SECONDS 内
+# 的多次访问只更新一次索引。本进程最近更新过的会话：urlid -> time.monotonic()
+SESSION_TOUCH_SECONDS = 60
+_session_touches = {}
+_session_touches_lock = threading.Lock()
+
+# 删除的目录先移入回收目录，由后台线程每 TRASH_REAP_SECONDS 秒检查一次并限速删除
+TRASH_REAP_SECONDS = 5
+
+# 各会话共享的缓存目录：优化后的图片和 linked 模式的内容哈希资源，与会话目录计入同一磁盘预算；
+# cache_usage 为上一次扫描得到的总大小（字节），由后台任务更新
+cache_dirs = [os.path.join(os.getcwd(), config.IMAGE_CACHE_DIR), os.path.join(os.getcwd(), config.ASSET_STORE_DIR)]
+cache_usage = 0
+
+# 上传的压缩包和转换输出保存在对象存储（目录或 S3 兼容存储）中，本地目录只作为缓存，丢失后按需取回；
+# 分布式模式下各主机通过对象存储共享文件，总是使用
+object_store = config.OBJECT_STORE
+if not object_store.startswith('s3://'):
+    object_store = os.path.join(os.getcwd(), object_store)
+configure_s3(config.S3_ENDPOINT_URL, config.S3_REGION)
+use_object_store = config.DISTRIBUTED_MODE or config.USE_OBJECT_STORE
+
+# 分布式模式：转换作业放入多台主机共享的队列，由任意主机上的工作节点转换
+if config.DISTRIBUTED_MODE:
+    configure_queue(config.REDIS_URL, config.REDIS_KEY_PREFIX, config.DISTRIBUTED_JOB_TIMEOUT,
+                    config.DISTRIBUTED_RESULT_TTL)
+
+# 监控指标：多进程部署时各进程写入 METRICS_DIR，/metrics 合并输出；直接运行 app.py 时先删除上次运行留下的文件
+metrics_enabled = config.METRICS_ENABLED and configure_metrics(
+    os.path.join(os.getcwd(), config.METRICS_DIR) if config.METRICS_DIR else None, reset=__name__ == '__main__')
+
+# 按需性能分析：采样开关保存在所有工作进程共享的文件中，由 /admin/profiling 修改
+profiling_state_file = os.path.join(os.getcwd(), config.PROFILE_STATE_FILE)
+profile_dir = os.path.join(os.getcwd(), config.PROFILE_DIR)
+
+# /convert 的响应状态码对应的转换结果，用于 md2doc_conversion_duration_seconds 的 outcome 标签
+CONVERSION_OUTCOMES = {200: 'success', 400: 'invalid', 409: 'cancelled', 422: 'limit', 429: 'rate_limited',
+                       500: 'failed', 504: 'timeout'}
+
+@app.before_request
+def start_request_timer():
+    """
+    记录请求开始的时间，并开始记录本请求的时间线。
+    """
+    g.request_started = time.perf_counter()
+    start_timeline()
+    clear_log_context(request_id=request.headers.get('X-Request-ID') or os.urandom(6).hex(), endpoint=request.endpoint)
+
+@app.teardown_request
+def clear_request_log_context(error):
+    """
+    请求结束后清除日志上下文，工作线程之后记录的日志不再带有本请求的字段。最先注册，在其他清理函数之后运行。
+    """
+    clear_log_context()
+
+@app.after_request
+def record_request_metrics(response):
+    """
+    记录请求的处理耗时和发送的字节数。交由前置服务器发送的文件按文件大小计入。
+    """
+    if not metrics_enabled:
+        return response
+    endpoint = request.endpoint or 'unknown'
+    observe_request(endpoint, response.status_code, time.perf_counter() - g.get('request_started', time.perf_counter()))
+    if response.status_code in (200, 206):
+        size = response.content_length
+        accel_path = response.headers.get('X-Accel-Redirect')
+        if accel_path:
+            try:
+                size = os.path.getsize(os.path.join(os.getcwd(),
+                                                    unquote(accel_path[len(config.X_ACCEL_REDIRECT_PREFIX):])))
+            except OSError:
+                size = None
+        if size:
+            count_served_bytes(endpoint, response.content_encoding or 'identity', size)
+    return response
+
+@app.after_request
+def record_request_timeline(response):
+    """
+    在 TIMELINE_HEADER 打开时通过 Server-Timing 响应头返回本请求各步骤的时间线；
+    处理时间超过 SLOW_REQUEST_SECONDS 时把时间线写入慢请求日志。
+    """
+    timeline = get_timeline()
+    if timeline is None:
+        return response
+    clear_timeline()  # 工作线程会被下一个请求复用
+    duration = time.perf_counter() - timeline['started']
+    slow = config.SLOW_REQUEST_SECONDS is not None and duration >= config.SLOW_REQUEST_SECONDS
+    if not timeline['spans'] or not (config.TIMELINE_HEADER or slow):
+        return response
+    spans = export_spans(timeline)
+    if config.TIMELINE_HEADER:
+        response.headers['Server-Timing'] = format_server_timing(spans)
+    if slow:
+        details = dict(
+            summarize_timeline(timeline),
+            method=request.method,
+            path=request.path,
+            status=response.status_code,
+            duration_ms=round(duration * 1000, 1),
+            spans=spans,
+        )
+        message = f"Slow request {request.method} {request.path} took {duration:.1f}s"
+        if config.LOG_FORMAT != 'json':
+            message += ' ' + json.dumps(details, ensure_ascii=False)  # 文本格式不输出结构化字段
+        slow_request_logger.warning(message, extra=details)
+    return response
+
+@app.before_request
+def start_request_profile():
+    """
+    管理员打开采样开关后，按 sample_percent 对 /convert 和 /upload 请求进行 CPU 和内存分析。
+    """
+    if config.ADMIN_TOKEN is None or not should_profile(load_profiling_state(profiling_state_file), request.endpoint,
+                                                       random.random() * 100):
+        return
+    g.profile = start_profile(config.PROFILE_SAMPLE_INTERVAL)
+
+@app.after_request
+def record_profile_status(response):
+    """
+    记录被分析请求的响应状态码，与分析结果一起保存。
+    """
+    if 'profile' in g:
+        g.profile_status = response.status_code
+    return response
+
+@app.teardown_request
+def save_request_profile(error):
+    """
+    请求结束（包括抛出异常）后停止性能分析，保存折叠的调用栈和分配内存最多的代码行。
+    """
+    profile = g.pop('profile', None)
+    if profile is None:
+        return
+    result = stop_profile(profile)
+    name = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{request.endpoint}-{os.getpid()}-{os.urandom(3).hex()}"
+    metadata = {
+        'method': request.method,
+        'path': request.path,
+        'endpoint': request.endpoint,
+        'status': g.get('profile_status'),
+        'error': repr(error) if error is not None else None,
+        'urlid': request.form.get('urlid'),
+        'output_format': request.form.get('output_format'),
+    }
+    try:
+        save_profile(profile_dir, name, result, metadata, config.PROFILE_MAX_FILES)
+    except OSError as e:
+        app.logger.error(f"Failed to save profile {name}: {e}")
+
+def check_admin_token():
+    """
+    校验请求头 X-Admin-Token。
+
+    返回:
+        未配置 ADMIN_TOKEN 时返回 404 响应，令牌不正确时返回 403 响应，校验通过时返回 None。
+    """
+    if config.ADMIN_TOKEN is None:
+        return jsonify({"error": "未启用管理接口"}), 404
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', '').encode(), config.ADMIN_TOKEN.encode()):
+        return jsonify({"error": "管理令牌不正确"}), 403
+    return None
+
+@app.route('/admin/profiling', methods=['GET', 'POST'])
+def admin_profiling():
+    """
+    查看或修改性能分析的采样开关，所有工作进程共享。
+
+    请求:
+        GET /admin/profiling
+        POST /admin/profiling，JSON 或表单参数：sample_percent（0~100，为 0 时关闭）、
+            duration（持续秒数，默认 PROFILE_DEFAULT_SECONDS，最长 PROFILE_MAX_SECONDS）、
+            endpoints（采样的视图函数名，默认 convert_file 和 upload_file）。
+        请求头 X-Admin-Token 为 ADMIN_TOKEN。
+
+    返回:
+        当前的采样开关和已保存的分析结果名（从新到旧）。
+    """
+    denied = check_admin_token()
+    if denied is not None:
+        return denied
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or request.form
+        try:
+            sample_percent = min(max(float(data.get('sample_percent', 0)), 0), 100)
+            duration = min(float(data.get('duration', config.PROFILE_DEFAULT_SECONDS)), config.PROFILE_MAX_SECONDS)
+        except (TypeError, ValueError):
+            return jsonify({"error": "sample_percent 和 duration 必须是数字"}), 400
+        endpoints = data.get('endpoints') or ['convert_file', 'upload_file']
+        if isinstance(endpoints, str):
+            endpoints = endpoints.split(',')
+        state = {'sample_percent': sample_percent, 'until': time.time() + duration, 'endpoints': list(endpoints)}
+        save_profiling_state(profiling_state_file, state)
+        app.logger.warning(f"Profiling set to {sample_percent}% of {endpoints} for {duration:.0f}s")
+    return jsonify({"state": load_profiling_state(profiling_state_file), "profiles": list_profiles(profile_dir)})
+
+@app.route('/admin/profiles/<filename>')
+def admin_profile_file(filename):
+    """
+    下载保存的分析结果：<name>.folded 为折叠的调用栈（CPU 微秒数），可交给 flamegraph.pl 或 speedscope 生成火焰图；
+    <name>.json 为请求信息、耗时和分配内存最多的代码行。
+
+    请求:
+        GET /admin/profiles/<filename>，请求头 X-Admin-Token 为 ADMIN_TOKEN。
+
+    返回:
+        分析结果文件。
+    """
+    denied = check_admin_token()
+    if denied is not None:
+        return denied
+    file_path = safe_join(profile_dir, filename)
+    if file_path is None or not filename.endswith(('.folded', '.json')) or not os.path.isfile(file_path):
+        return jsonify({"error": "文件未找到"}), 404
+    return send_file(file_path, mimetype='application/json' if filename.endswith('.json') else 'text/plain',
+                     max_age=0)
+
+
+@app.route('/metrics')
+def metrics():
+    """
+    以 Prometheus 文本格式输出监控指标。
+
+    请求:
+        GET /metrics
+
+    返回:
+        指标文本；未启用监控指标时返回 404。
+    """
+    output = generate_metrics()
+    if output is None:
+        return jsonify({"error": "未启用监控指标"}), 404
+    body, content_type = output
+    return app.response_class(body, content_type=content_type)
+
+@app.route('/')
+def index():
+    """
+    渲染主页模板。
+    """
+    index_logger.info("Rendering index page")
+    response = app.make_response(render_template('index.html'))
+    response.headers['Cache-Control'] = 'no-cache'  # 页面本身每次都校验，发布新版本后立即引用新的资源
+    return response
+
+
+def get_resource_paths(extract_to):
+    """
+    获取 pandoc 查找图片等资源的路径列表：解压目录的所有子目录、解压目录本身和第一个子目录。
+    """
+    with span('get_all_subdirs'):
+        resource_paths = get_all_subdirs(extract_to)  # 获取所有子目录
+    resource_paths.append(os.path.abspath(extract_to))
+    imgs_dir = get_subdirs(extract_to)
+
+    if imgs_dir:
+        resource_paths.append(os.path.join(extract_to, imgs_dir[0]))
+    return resource_paths
+
+def get_features(urlid, input_file, resource_paths):
+    """
+    获取上传文档的成本特征，缓存在模板目录中；提取失败时返回 None，不影响上传和转换。
+    """
+    try:
+        template_directory = get_template_dir(urlid)
+        return get_document_features(input_file, resource_paths, os.path.join(template_directory, 'features.json'))
+    except Exception as e:
+        upload_logger.error(f"Error while extracting document features: {e}")
+        return None
+
+def get_client():
+    """
+    识别发起请求的客户端：请求头 X-API-Key 为已配置的密钥时按密钥，否则按 IP 地址。
+
+    返回:
+        tuple: (客户端标识, 权重)。
+    """
+    api_key = config.API_KEYS.get(request.headers.get('X-API-Key', ''))
+    if api_key:
+        return f"key:{api_key['name']}", float(api_key.get('weight', 1))
+    return f"ip:{request.remote_addr}", 1.0
+
+def check_rate_limit(client, weight, bucket, amount, rate, burst):
+    """
+    从客户端的令牌桶中扣除用量，速率为 None 时不限制。权重同时放大补充速度和容量。
+
+    返回:
+        float: 需要等待的秒数；为 0 时已扣除。
+    """
+    if rate is None:
+        return 0.0
+    return consume_tokens(rate_limit_db, client, bucket, amount, rate * weight, burst * weight)
+
+def rate_limited_response(retry_after):
+    """
+    生成 429 响应，Retry-After 为令牌补足所需的秒数。
+    """
+    retry_after = math.ceil(retry_after)
+    response = jsonify({"error": "请求过于频繁，请稍后再试", "retry_after": retry_after})
+    response.headers['Retry-After'] = str(retry_after)
+    return response, 429
+
+def touch_session(urlid, measure=False):
+    """
+    记录会话被访问，顺延其过期时间，并作为淘汰时的最近使用时间。
+
+    参数:
+        urlid (str): 上传文件的唯一标识符。
+        measure (bool): 是否重新统计会话目录的大小（上传、解压和转换完成后）。
+    """
+    now = time.monotonic()
+    with _session_touches_lock:
+        if not measure and now - _session_touches.get(urlid, -SESSION_TOUCH_SECONDS) < SESSION_TOUCH_SECONDS:
+            return
+        if len(_session_touches) > 10000:
+            _session_touches.clear()
+        _session_touches[urlid] = now
+    try:
+        record_session_access(session_db, urlid, config.SESSION_TTL, get_session_size(urlid) if measure else None)
+    except Exception as e:
+        app.logger.error(f"Failed to record access to session {urlid}: {e}")
+
+def publish_package(urlid, zip_path):
+    """
+    将上传的压缩包存入对象存储，其他节点处理该 urlid 的请求或本节点的解压目录丢失时按需取回。
+    """
+    package_hash = compute_file_hash(zip_path)
+    put_object(object_store, f'packages/{urlid}.zip', zip_path)
+    put_bytes(object_store, f'packages/{urlid}.sha256', package_hash.encode('ascii'))
+    template_directory = get_template_dir(urlid)
+    os.makedirs(template_directory, exist_ok=True)
+    with open(os.path.join(template_directory, 'package.sha256'), 'w') as f:
+        f.write(package_hash)  # 本节点已解压该版本，无需再取回
+
+def ensure_local_package(urlid):
+    """
+    确保本节点已解压 urlid 最新上传的压缩包，本节点没有（如 tmpfs 上的目录在重启后丢失）或版本已过期时从对象存储取回并解压。
+
+    返回:
+        bool: 对象存储中是否有该 urlid 的有效压缩包。
+    """
+    package_hash = get_bytes(object_store, f'packages/{urlid}.sha256')
+    if package_hash is None:
+        return False
+    package_hash = package_hash.decode('ascii')
+    template_directory = get_template_dir(urlid)
+    marker_path = os.path.join(template_directory, 'package.sha256')
+    os.makedirs(template_directory, exist_ok=True)
+    with portalocker.Lock(marker_path + '.lock', timeout=60):
+        try:
+            with open(marker_path, 'r') as f:
+                if f.read() == package_hash and get_upload(session_db, urlid) is not None and \
+                        os.path.isdir(get_upload_dir(urlid)):
+                    return True
+        except OSError:
+            pass
+
+        extract_to = get_upload_dir(urlid)
+        os.makedirs(extract_to, exist_ok=True)
+        zip_path = os.path.join(get_temp_dir(), f'{urlid}.zip')
+        if not get_object(object_store, f'packages/{urlid}.zip', zip_path):
+            return False
+        try:
+            with span('check_and_extract_archive'):
+                if not check_and_extract_archive(zip_path, extract_to):
+                    return False
+        finally:
+            os.remove(zip_path)
+        md_file_name = next((name for name in os.listdir(extract_to) if name.endswith('.md')), None)
+        if md_file_name is None:
+            return False
+        record_upload(session_db, urlid, md_file_name)
+        with open(marker_path, 'w') as f:
+            f.write(package_hash)
+    touch_session(urlid, measure=True)
+    return True
+
+def fetch_shared_file(key, file_path, immutable=False):
+    """
+    从对象存储取回其他节点生成或本节点已丢失的文件及其 .gz/.br 预压缩版本：本节点没有该文件或对象存储中的版本更新时下载。
+
+    参数:
+        key (str): 对象键。
+        file_path (str): 本节点的文件路径。
+        immutable (bool): 文件按内容哈希命名，本节点已有时不再检查对象存储。
+    """
+    try:
+        for suffix in ('', '.gz', '.br'):
+            path = file_path + suffix
+            if immutable and os.path.exists(path):
+                continue
+            remote_mtime = get_object_mtime(object_store, key + suffix)
+            if remote_mtime is None or (os.path.exists(path) and os.path.getmtime(path) >= remote_mtime):
+                continue
+            get_object(object_store, key + suffix, path)
+    except ValueError:
+        pass  # 文件名不能作为对象键，按文件不存在处理
+
+def publish_conversion_outputs(urlid, output_file, asset_url_prefix):
+    """
+    转换完成后，将输出文件及其预压缩版本、多页站点的所有文件和 linked 模式引用的资源存入对象存储；
+    对象存储中修改时间相同的文件（已由之前的请求存入）不再上传。
+    """
+    output_directory = os.path.dirname(output_file)
+    paths = [output_file + suffix for suffix in ('', '.gz', '.br')]
+    site_dir = os.path.splitext(output_file)[0]
+    if output_file.endswith('_site.zip') and os.path.isdir(site_dir):
+        paths += [os.path.join(root, name) for root, _, files in os.walk(site_dir) for name in files]
+    for path in paths:
+        if os.path.exists(path):
+            relative_path = os.path.relpath(path, output_directory).replace(os.sep, '/')
+            key = f'outputs/{urlid}/{relative_path}'
+            if get_object_mtime(object_store, key) != os.path.getmtime(path):
+                put_object(object_store, key, path)
+
+    if output_file.endswith('.html'):
+        with open(output_file, 'r', encoding='utf-8', errors='replace') as f:
+            html = f.read()
+        asset_store_dir = os.path.join(os.getcwd(), config.ASSET_STORE_DIR)
+        for name in set(re.findall(re.escape(asset_url_prefix) + r'([0-9a-f]{64}\.[a-z0-9]+)', html)):
+            asset_path = get_content_addressed_path(name, asset_store_dir)
+            for suffix in ('', '.gz', '.br'):
+                # 资源内容与名称一一对应，已上传过的不再上传
+                if os.path.exists(asset_path + suffix) and get_object_mtime(object_store, f'assets/{name}{suffix}') is None:
+                    put_object(object_store, f'assets/{name}{suffix}', asset_path + suffix)
+
+def run_distributed_conversion(urlid, output_format, flight_key, options, logo_data, asset_url_prefix, estimate=None,
+                               on_measured=None, client='', weight=1.0):
+    """
+    分布式模式下将转换作业放入共享队列，等待任意节点上的工作节点（worker.py）完成。
+
+    转换键相同的请求共享同一个作业和结果；同一 urlid、同一输出格式的新请求会取消旧作业。
+    队列按 预计 CPU 秒数 + SCHEDULER_AGING_RATE × 提交时间 从小到大取出，与单机模式的排队顺序一致。
+
+    参数:
+        urlid (str): 上传文件的唯一标识符。
+        output_format (str): 输出格式。
+        flight_key (tuple): 转换键。
+        options (dict): 转换参数，工作节点据此重新生成转换计划。
+        logo_data (bytes): Logo图片内容。
+        asset_url_prefix (str): linked 模式下资源的访问URL前缀。
+        estimate (float): 预计 CPU 秒数。
+        on_measured (callable): 本请求提交的作业运行了子进程时调用，参数为实测的资源使用和转换是否成功。
+        client (str): 提交作业的客户端标识。
+        weight (float): 客户端权重。
+
+    返回:
+        bool: 是否已生成输出文件。
+
+    异常:
+        ConversionCancelledError: 作业被取消。
+        ProcessLimitError: 转换超出资源限制。
+        TimeoutError: 超过 DISTRIBUTED_JOB_TIMEOUT 秒仍未完成。
+    """
+    job_id = hash_flight_key(flight_key)
+    bind_log_context(job_id=job_id)
+    payload = {
+        'urlid': urlid,
+        'output_format': output_format,
+        'options': options,
+        'logo': base64.b64encode(logo_data).decode('ascii') if logo_data else None,
+        'asset_url_prefix': asset_url_prefix,
+        'estimate': estimate,
+        'client': client,
+        'weight': weight,
+    }
+    priority = (estimate or 0.0) + config.SCHEDULER_AGING_RATE * time.time()
+    submitted = submit_job(job_id, payload, priority, supersede_key=f'{urlid}:{output_format}')
+    if not submitted:
+        count_cache_result(output_format, 'shared')  # 相同的作业正在排队、运行或已有结果；新作业由工作节点记录
+    with span('distributed_conversion', submitted=submitted):
+        result = wait_for_result(job_id, config.DISTRIBUTED_JOB_TIMEOUT)
+        if submitted and result is not None and result.get('timeline'):
+            add_spans(result['timeline'], result['started_at'])  # 工作节点上各步骤的时间线
+    if result is None:
+        raise TimeoutError(f"Conversion {output_format} for {urlid} did not finish within {config.DISTRIBUTED_JOB_TIMEOUT}s")
+    if submitted and on_measured is not None and result.get('usage'):
+        on_measured(result['usage'], result['status'] == 'done')
+    if result['status'] == 'cancelled':
+        raise ConversionCancelledError(f"Conversion {output_format} for {urlid} was cancelled")
+    if result['status'] == 'limit':
+        raise ProcessLimitError([result['stage']], result['limit'], result['value'])
+    return result['status'] == 'done'
+
+
+@app.route('/upload', methods=['POST'])
+def upload_file():
+    """
+    处理文件上传，解压缩文件并返回唯一标识符（urlid）。
+
+    请求:
+        POST /upload
+
+    返回:
+        包含上传和解压状态及唯一标识符的 JSON 响应。
+    """
+    if 'file' not in request.files:
+        upload_logger.error("No file part in the request")
+        return jsonify({"error": "未指定文件"}), 400
+
+    file = request.files['file']
+
+    if file.filename == '':
+        upload_logger.error("No selected file")
+        return jsonify({"error": "未选择文件"}), 400
+
+    client, weight = get_client()
+    retry_after = check_rate_limit(client, weight, 'upload_bytes', request.content_length or 0,
+                                   config.UPLOAD_BYTES_PER_SECOND, config.UPLOAD_BYTES_BURST)
+    if retry_after:
+        upload_logger.warning(f"Upload rate limited for client {client}, retry after {retry_after:.1f}s")
+        return rate_limited_response(retry_after)
+
+    urlid = request.form.get('urlid', generate_unique_urlid())  # 获取或生成唯一标识符
+    if not is_valid_urlid(urlid):
+        upload_logger.error(f"Invalid urlid for upload: {urlid}")
+        return jsonify({"error": "urlid无效"}), 400
+    bind_log_context(urlid=urlid)
+    touch_session(urlid)  # 先登记到过期索引，之后创建的目录一定会被删除
+    extract_to = get_upload_dir(urlid)  # 解压目标路径
+
+    cancelled = cancel_conversions(urlid, get_output_dir(urlid))  # 重新上传时终止基于旧文件的转换
+    if config.DISTRIBUTED_MODE:
+        cancelled += cancel_jobs(urlid)  # 同时终止其他节点上的转换
+    if cancelled:
+        upload_logger.info(f"Cancelled {cancelled} running conversions for urlid: {urlid}")
+
+    move_to_trash(extract_to, scratch_root)  # 重新上传时旧文件移入回收目录，不等待删除
+    os.makedirs(extract_to, exist_ok=True)
+
+    zip_path = os.path.join(get_temp_dir(), secure_filename(file.filename))  # 安全处理后的文件路径
+    file.save(zip_path)  # 保存上传文件
+    upload_size = os.path.getsize(zip_path)
+
+    with time_stage('extract'), span('check_and_extract_archive'):
+        result = check_and_extract_archive(zip_path, extract_to)  # 解压文件
+    if result and use_object_store:
+        with time_stage('publish'):
+            publish_package(urlid, zip_path)  # 存入对象存储，由其他节点或本节点在解压目录丢失后按需取回
+    os.remove(zip_path)  # 删除临时压缩文件
+    observe_upload(upload_size, 'success' if result else 'invalid')
+
+    if result:
+        try:
+            md_file_name = next(file for file in os.listdir(extract_to) if file.endswith('.md'))  # 获取Markdown文件名
+            str_name = md_file_name.split(".")
+            upload_logger.info(f"File uploaded and extracted successfully: {md_file_name}, urlid: {urlid}")
+
+            record_upload(session_db, urlid, md_file_name)  # 记录上传的文件信息，所有工作进程可见
+            touch_session(urlid, measure=True)
+            features = get_features(urlid, os.path.join(extract_to, md_file_name), get_resource_paths(extract_to))
+            estimate = None
+            if features is not None:
+                # 各输出格式的预计 CPU 秒数和峰值内存，前端可据此提示等待时间
+                estimate = {output_format: estimate_cost(features, output_format, cost_model_path)
+                            for output_format in ('pdf', 'html', 'docx')}
+            if config.SPECULATIVE_RENDER and not config.DISTRIBUTED_MODE:
+                start_speculative_renders(urlid, get_asset_url_prefix(), client, weight)  # 在用户填写转换参数期间预渲染
+
+            return jsonify({"success": f"文件已上传并解压至 {extract_to}", "urlid": urlid, "name": str_name[0],
+                            "estimate": estimate}), 200
+        except StopIteration:
+            upload_logger.error("No valid .md file found in the archive")
+            return jsonify({"error": "未找到有效的 .md 文件"}), 400
+    else:
+        upload_logger.error("File extraction failed")
+        return jsonify({"error": "解压失败"}), 400
+
+def get_asset_url_prefix():
+    """
+    linked 模式下资源的访问URL前缀：相对站点根目录的 /cas/（应用部署在子路径下时包含该路径），不包含主机名，
+    通过不同主机名访问时页面中的链接相同，转换键也相同。
+    """
+    return request.script_root + '/cas/'
+
+def plan_conversion(urlid, output_format, options, logo_data=None, asset_url_prefix='/cas/', speculative=False):
+    """
+    根据转换参数确定输出文件和转换键，并生成准备函数。/convert 和预渲染共用，保证相同参数得到相同的转换键。
+
+    参数:
+        urlid (str): 上传文件的唯一标识符。
+        output_format (str): 输出格式（pdf、html、docx）。
+        options (dict): 转换参数：title、version、statement、left_header、right_header、cover_footer、
+            html_mode、split_level。
+        logo_data (bytes): Logo图片内容。
+        asset_url_prefix (str): linked 模式下资源的访问URL前缀。
+        speculative (bool): 是否为预渲染，预渲染的子进程以低优先级运行。
+
+    返回:
+        tuple: (输出文件路径, 转换键, 准备函数, 预计资源使用, 记录实测资源使用的函数)；
+        找不到Markdown文件时返回 None，无法提取文档特征时后两项为 None。
+    """
+    title = options['title']
+    version = options['version']
+    statement = options['statement']
+    left_header = options['left_header']
+    right_header = options['right_header']
+    cover_footer = options['cover_footer']
+    html_mode = options['html_mode']
+    split_level = options['split_level']
+
+    extract_to = get_upload_dir(urlid)  # 解压目录
+    output_directory = get_output_dir(urlid)  # 输出目录
+    template_directory = get_template_dir(urlid)  # 模板目录
+    os.makedirs(output_directory, exist_ok=True)
+    os.makedirs(template_directory, exist_ok=True)
+
+    resource_paths = get_resource_paths(extract_to)
+
+    md_filename = get_upload(session_db, urlid)
+    if md_filename is None:
+        return None
+
+    input_file = os.path.join(extract_to, md_filename)  # 输入文件路径
+    output_file = os.path.join(output_directory, os.path.basename(input_file).replace(".md", f".{output_format}"))  # 输出文件路径
+    if output_format == "html" and html_mode == "site":
+        output_file = os.path.join(output_directory, os.path.basename(input_file).replace(".md", "_site.zip"))  # 多页站点打包文件
+
+    logo_path = None
+    if logo_data:
+        logo_path = os.path.join(extract_to, 'logo.png').replace("\\", "/")
+
+    parameter = generate_parameter(title=title, version=version, statement=statement)  # 生成参数
+    image_cache_dir = os.path.join(os.getcwd(), config.IMAGE_CACHE_DIR)  # 优化后图片的缓存目录
+    limits = config.CONVERSION_LIMITS.get(output_format)  # 转换子进程的资源限制
+    if speculative:
+        limits = dict(limits or {}, nice=config.SPECULATIVE_NICE)  # 预渲染以低优先级运行
+
+    # 转换键：上传内容哈希、输出格式和影响该格式输出的参数都相同的请求共享同一个转换
+    if output_format == "html":
+        output_params = (parameter["title"], html_mode, split_level if html_mode == "site" else None,
+                         asset_url_prefix if html_mode == "linked" else None)
+    else:
+        output_params = (title, version, statement, left_header, right_header,
+                         cover_footer if output_format == "pdf" else None,
+                         hashlib.sha256(logo_data).hexdigest() if logo_data else None)
+    flight_key = (urlid, compute_file_hash(input_file), output_format) + output_params
+
+    estimate = None
+    record_measured = None
+    features = get_features(urlid, input_file, resource_paths)
+    if features is not None:
+        estimate = estimate_cost(features, output_format, cost_model_path)
+
+        def record_measured(usage, succeeded):
+            """
+            用成功转换实测的资源使用修正成本模型。
+            """
+            if succeeded:
+                record_cost(features, output_format, usage, cost_model_path)
+
+    def prepare_conversion():
+        """
+        保存Logo、生成页眉模板，返回启动转换协程的函数。只在需要启动新转换时调用。
+        """
+        if logo_data:
+            with open(logo_path, 'wb') as f:
+                f.write(logo_data)
+
+        if output_format == "pdf":
+            with span('generate_latex_document_pdf'):
+                tex_path = generate_latex_document_pdf(
+                    left_header=left_header,
+                    right_header=right_header,
+                    cover_footer=cover_footer,
+                    urlid=template_directory,
+                )
+            return partial(
+                convert_markdown_to_pdf_async,
+                input_file=input_file,
+                title=parameter["title"],
+                version=parameter["version"],
+                date=parameter["date"],
+                output_file=output_file,
+                header_file=os.path.join(os.getcwd(), tex_path),
+                logo_path=logo_path,
+                resource_paths=resource_paths,
+                statement=parameter["statement"],
+                image_dpi=config.IMAGE_TARGET_DPI,
+                image_cache_dir=image_cache_dir,
+                image_workers=config.IMAGE_WORKERS,
+                limits=limits
+            )
+        elif output_format == "html" and html_mode == "site":
+            return partial(
+                convert_markdown_to_html_site_async,
+                input_file=input_file,
+                output_file=output_file,
+                resource_paths=resource_paths,
+                title=parameter["title"],
+                split_level=int(split_level),
+                minify=config.HTML_MINIFY,
+                precompress=config.HTML_PRECOMPRESS,
+                limits=limits
+            )
+        elif output_format == "html":
+            return partial(
+                convert_markdown_to_html_async,
+                input_file=input_file,
+                output_file=output_file,
+                resource_paths=resource_paths,
+                title=parameter["title"],
+                html_mode=html_mode,
+                asset_store_dir=os.path.join(os.getcwd(), config.ASSET_STORE_DIR),
+                asset_url_prefix=asset_url_prefix,
+                minify=config.HTML_MINIFY,
+                precompress=config.HTML_PRECOMPRESS,
+                limits=limits
+            )
+        elif output_format == "docx":
+            template_file_path = os.path.join(template_directory, 'template_with_headers.docx')
+            with span('create_template_with_headers'):
+                create_template_with_headers(
+                    template_path=template_file_path,
+                    left_header=left_header,
+                    right_header=right_header,
+                )
+            return partial(
+                convert_md_to_docx_with_toc_and_template_async,
+                md_file_path=input_file,
+                docx_file_path=output_file,
+                template_file_path=template_file_path,
+                title=title,
+                version=version,
+                date=datetime.now().strftime("%Y-%m-%d"),
+                left_header=left_header,
+                right_header=right_header,
+                statement=statement,
+                resource_paths=resource_paths,
+                logo_path=logo_path,
+                image_dpi=config.IMAGE_TARGET_DPI,
+                image_cache_dir=image_cache_dir,
+                image_workers=config.IMAGE_WORKERS,
+                limits=limits
+            )
+
+    return output_file, flight_key, prepare_conversion, estimate, record_measured
+
+
+def start_speculative_renders(urlid, asset_url_prefix, client, weight):
+    """
+    上传解压完成后，按 SPECULATIVE_OPTIONS 在后台以低优先级预渲染 SPECULATIVE_FORMATS 中的格式。
+
+    参数:
+        urlid (str): 上传文件的唯一标识符。
+        asset_url_prefix (str): linked 模式下资源的访问URL前缀。
+        client (str): 上传文件的客户端标识，预渲染与其转换一起公平排队。
+        weight (float): 客户端权重。
+    """
+    options = dict(config.SPECULATIVE_OPTIONS, html_mode=config.HTML_MODE, split_level=str(config.HTML_SPLIT_LEVEL))
+    for output_format in config.SPECULATIVE_FORMATS:
+        logo_data = None
+        if output_format != 'html':
+            # PDF/DOCX 草稿使用默认Logo
+            with open(os.path.join(app.root_path, 'templates', 'logo.png'), 'rb') as f:
+                logo_data = f.read()
+        plan = plan_conversion(urlid, output_format, options, logo_data, asset_url_prefix, speculative=True)
+        if plan is not None:
+            output_file, flight_key, prepare_conversion, estimate, record_measured = plan
+            start_speculative_conversion(urlid, output_format, flight_key, output_file, prepare_conversion,
+                                         estimate=estimate and estimate['cpu_seconds'], on_measured=record_measured,
+                                         client=client, weight=weight)
+            upload_logger.info(f"Queued speculative {output_format} render for urlid: {urlid}")
+
+def settle_conversion_tokens(client, weight, delta):
+    """
+    结算预扣的转换配额：delta 为正时退还，为负时补扣。
+    """
+    if config.CONVERT_CPU_PER_SECOND is None:
+        return
+    try:
+        settle_tokens(rate_limit_db, client, 'convert_cpu', delta, config.CONVERT_CPU_PER_SECOND * weight,
+                      config.CONVERT_CPU_BURST * weight)
+    except Exception as e:
+        convert_logger.error(f"Error while settling conversion tokens for client {client}: {e}")
+
+@app.route('/convert', methods=['POST'])
+def convert_file():
+    """
+    根据请求将 Markdown 文件转换为指定格式（pdf、html、docx）。
+
+    请求:
+        POST /convert
+
+    返回:
+        生成的文件或错误信息。
+    """
+    try:
+        if 'output_format' not in request.form:
+            convert_logger.error("No output format specified")
+            return jsonify({"error": "未指定格式"}), 400
+
+        output_format = request.form['output_format']
+        bind_log_context(output_format=output_format)
+
+        if output_format not in ['pdf', 'html', 'docx']:
+            convert_logger.error("Invalid format specified")
+            return jsonify({"error": "格式无效"}), 400
+
+        started = time.perf_counter()
+
+        @after_this_request
+        def record_conversion(response):
+            observe_conversion(output_format, CONVERSION_OUTCOMES.get(response.status_code, 'error'),
+                               time.perf_counter() - started)
+            return response
+
+        title = request.form.get('title', 'Document Title')  # 获取文档标题
+        version = request.form.get('version', '版本号: 1.0')  # 获取版本号
+        statement = request.form.get('statement', '')  # 获取声明
+        left_header = request.form.get('left_header', 'Left Header')  # 获取左侧页眉
+        right_header = request.form.get('right_header', 'Right Header')  # 获取右侧页眉
+        cover_footer = request.form.get('cover_footer', 'Cover Footer')  # 获取封面页脚
+        html_mode = request.form.get('html_mode', config.HTML_MODE)  # 获取HTML输出模式
+
+        if html_mode not in ['linked', 'self_contained', 'site']:
+            convert_logger.error("Invalid HTML mode specified")
+            return jsonify({"error": "HTML输出模式无效"}), 400
+
+        split_level = request.form.get('split_level', str(config.HTML_SPLIT_LEVEL))  # 获取多页站点的拆分标题级别
+        if split_level not in ['1', '2']:
+            convert_logger.error("Invalid split level specified")
+            return jsonify({"error": "拆分级别无效"}), 400
+
+        urlid = request.form.get('urlid')
+        if not is_valid_urlid(urlid):
+            convert_logger.error(f"Invalid urlid for conversion: {urlid}")
+            return jsonify({"error": "未找到与urlid相关的Markdown文件"}), 400
+        bind_log_context(urlid=urlid)
+        touch_session(urlid)
+        if use_object_store and not ensure_local_package(urlid):
+            convert_logger.error("No uploaded package found for the given URLID")
+            return jsonify({"error": "未找到与urlid相关的Markdown文件"}), 400
+        options = {
+            'title': title,
+            'version': version,
+            'statement': statement,
+            'left_header': left_header,
+            'right_header': right_header,
+            'cover_footer': cover_footer,
+            'html_mode': html_mode,
+            'split_level': split_level,
+        }
+        logo_file = request.files.get('logo')  # 获取Logo文件
+        logo_data = logo_file.read() if logo_file else None
+
+        with time_stage('preflight', output_format):
+            plan = plan_conversion(urlid, output_format, options, logo_data, get_asset_url_prefix())
+        if plan is None:
+            convert_logger.error("No markdown file found for the given URLID")
+            return jsonify({"error": "未找到与urlid相关的Markdown文件"}), 400
+        output_file, flight_key, prepare_conversion, estimate, record_measured = plan
+
+        # 按预计 CPU 秒数预扣客户端的转换配额，子进程结束后按实测值结算；没有启动子进程时全部退还
+        client, weight = get_client()
+        reserved = estimate['cpu_seconds'] if estimate else 1.0
+        retry_after = check_rate_limit(client, weight, 'convert_cpu', reserved,
+                                       config.CONVERT_CPU_PER_SECOND, config.CONVERT_CPU_BURST)
+        if retry_after:
+            convert_logger.warning(f"Conversion rate limited for client {client}, retry after {retry_after:.1f}s")
+            return rate_limited_response(retry_after)
+        settled = []
+
+        def on_measured(usage, succeeded):
+            """
+            修正成本模型，并按实测的 CPU 秒数结算预扣的配额。
+            """
+            if record_measured is not None:
+                record_measured(usage, succeeded)
+            settle_conversion_tokens(client, weight, reserved - usage['cpu_seconds'])
+            settled.append(usage['cpu_seconds'])
+
+        # 同一 urlid 的同一输出格式只保留最新的转换，旧的转换会被终止；相同的请求共享正在进行的转换或预渲染的结果；
+        # 同时运行的转换数有限，排队的转换在客户端之间公平分配，同一客户端的转换按预计 CPU 时间从短到长运行
+        try:
+            if config.DISTRIBUTED_MODE:
+                # 由任意节点上的工作节点转换，输出存入对象存储，下载请求可以由任意节点处理
+                created = run_distributed_conversion(urlid, output_format, flight_key, options, logo_data,
+                                                     get_asset_url_prefix(),
+                                                     estimate=estimate and estimate['cpu_seconds'],
+                                                     on_measured=on_measured, client=client, weight=weight)
+            else:
+                run_conversion(urlid, output_format, flight_key, output_file, prepare_conversion,
+                               estimate=estimate and estimate['cpu_seconds'], on_measured=on_measured,
+                               client=client, weight=weight)
+                created = os.path.exists(output_file)
+                if created and use_object_store:
+                    publish_conversion_outputs(urlid, output_file, get_asset_url_prefix())
+        finally:
+            if not settled:
+                settle_conversion_tokens(client, weight, reserved)
+
+        touch_session(urlid, measure=True)  # 输出计入会话目录的大小
+        if not created:
+            convert_logger.error(f"{output_format.upper()} file not created")
+            return jsonify({"error": f"{output_format.upper()} 文件未创建"}), 500
+
+        if not config.DISTRIBUTED_MODE:
+            get_cached_file_hash(output_file)  # 转换完成时计算内容哈希，下载时直接用作 ETag
+        download_link = url_for('download_file', urlid=urlid, filename=os.path.basename(output_file), _external=True)  # 生成下载链接
+        convert_logger.info(f"File converted successfully: {output_file}",
+                            extra={'duration_ms': round((time.perf_counter() - started) * 1000, 1)})
+        if output_format == "html" and html_mode == "site":
+            site_index = os.path.basename(os.path.splitext(output_file)[0]) + '/index.html'
+            view_link = url_for('view_file', urlid=urlid, filename=site_index, _external=True)  # 在线浏览链接
+            return jsonify({"download_link": download_link, "view_link": view_link, "estimate": estimate}), 200
+        return jsonify({"download_link": download_link, "estimate": estimate}), 200
+
+    except ConversionCancelledError as e:
+        convert_logger.info(f"Conversion cancelled: {e}")
+        return jsonify({"error": "转换已取消"}), 409
+    except ProcessLimitError as e:
+        convert_logger.error(f"Conversion exceeded resource limit: {e}")
+        return jsonify({"error": "转换超出资源限制", **e.to_dict()}), 422
+    except TimeoutError as e:
+        convert_logger.error(f"Distributed conversion timed out: {e}")
+        return jsonify({"error": "转换超时"}), 504
+    except Exception as e:
+        convert_logger.error(f"Internal server error: {e}")
+        return jsonify({"error": "内部服务器错误"}), 500
+
+@app.route('/cleanup', methods=['POST'])
+def cleanup():
+    """
+    处理清理请求：终止与 urlid 相关的转换，并删除其上传、输出和模板目录。
+
+    页面关闭时可通过 navigator.sendBeacon 发送，请求体为 JSON 格式的 {"urlid": ...}。
+
+    请求:
+        POST /cleanup
+
+    返回:
+        包含清理状态的 JSON 响应。
+    """
+    data = request.get_json(force=True, silent=True) or {}
+    urlid = data.get('urlid') or request.form.get('urlid')
+    if not is_valid_urlid(urlid):
+        cleanup_logger.error(f"Invalid urlid for cleanup: {urlid}")
+        return jsonify({"error": "未指定urlid"}), 400
+    bind_log_context(urlid=urlid)
+
+    cancelled = cancel_conversions(urlid, get_output_dir(urlid))
+    delete_urlid_dirs(urlid)
+    delete_upload(session_db, urlid)
+    if config.DISTRIBUTED_MODE:
+        # 其他节点上的作业在 1 秒内终止；其他节点本地的解压和输出目录在其过期索引中过期后由后台清理任务删除
+        cancelled += cancel_jobs(urlid)
+    if use_object_store:
+        delete_objects(object_store, f'packages/{urlid}')
+        delete_objects(object_store, f'outputs/{urlid}/')
+    cleanup_logger.info(f"Cleaned up urlid: {urlid}, cancelled {cancelled} running conversions")
+    return jsonify({"success": f"与 {urlid} 相关的转换已终止，目录已删除"}), 200
+
+def make_accel_redirect_response(file_path, etag, mimetype=None, as_attachment=False, download_name=None,
+                                 max_age=None):
+    """
+    生成 X-Accel-Redirect 响应，由前置的 nginx 直接发送文件内容（零拷贝，支持断点续传），
+    Python 工作线程不再参与文件传输。
+
+    参数:
+        file_path (str): 文件路径，必须位于应用工作目录下。
+        etag (str): 强 ETag。
+        mimetype (str): 文件类型。
+        as_attachment (bool): 是否以附件形式下载。
+        download_name (str): 下载文件名。
+        max_age (int): 缓存时间（秒）。
+
+    返回:
+        Response: 响应对象。
+    """
+    relative_path = os.path.relpath(file_path, os.getcwd()).replace(os.sep, '/')
+    response = app.response_class(mimetype=mimetype or mimetypes.guess_type(file_path)[0] or 'application/octet-stream')
+    response.headers['X-Accel-Redirect'] = config.X_ACCEL_REDIRECT_PREFIX + quote(relative_path)
+
+    download_name = download_name or (os.path.basename(file_path) if as_attachment else None)
+    if download_name:
+        try:
+            download_name.encode('ascii')
+            name_params = {'filename': download_name}
+        except UnicodeEncodeError:
+            # 非 ASCII 文件名按 RFC 5987 编码
+            name_params = {
+                'filename': download_name.encode('ascii', 'ignore').decode() or 'download',
+                'filename*': f"UTF-8''{quote(download_name, safe='!#$&+^`|')}",
+            }
+        response.headers.set('Content-Disposition', 'attachment' if as_attachment else 'inline', **name_params)
+
+    response.set_etag(etag)
+    response.last_modified = int(os.path.getmtime(file_path))
+    if max_age is not None:
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+    return response.make_conditional(request)
+
+
+def is_under_working_directory(file_path):
+    """
+    判断文件是否位于应用工作目录下。X-Accel-Redirect 只能指向 nginx 中配置的工作目录，
+    OUTPUT_DIR 位于其他位置（如 tmpfs）时由应用直接发送。
+    """
+    return not os.path.relpath(file_path, os.getcwd()).startswith(os.pardir)
+
+
+def send_negotiated_file(file_path, etag=None, **kwargs):
+    """
+    发送文件，客户端支持时直接发送转换时生成的 .br/.gz 预压缩版本。
+
+    响应带有基于内容哈希的强 ETag 和 Last-Modified，支持 If-None-Match、If-Modified-Since
+    条件请求以及 Range 断点续传；配置了 DOWNLOAD_OFFLOAD 时交由前置服务器发送文件内容。
+
+    参数:
+        file_path (str): 原文件路径。
+        etag (str): 原文件的 ETag，为 None 时使用所发送文件的内容哈希。
+        kwargs: 传递给 send_file 的其他参数。
+
+    返回:
+        Response: 响应对象。
+    """
+    send_path, encoding = choose_precompressed(file_path, request.headers.get('Accept-Encoding'))
+    if encoding is not None:
+        # 预压缩文件的类型和下载文件名沿用原文件
+        kwargs.setdefault('mimetype', mimetypes.guess_type(file_path)[0] or 'application/octet-stream')
+        kwargs.setdefault('download_name', os.path.basename(file_path))
+
+    # 不同编码的内容不同，ETag 也必须不同
+    if etag is None:
+        etag = get_cached_file_hash(send_path)
+    elif encoding is not None:
+        etag = f"{etag}-{encoding}"
+
+    if config.DOWNLOAD_OFFLOAD == 'x-accel-redirect' and is_under_working_directory(send_path):
+        response = make_accel_redirect_response(send_path, etag, **kwargs)
+    else:
+        response = send_file(send_path, etag=etag, **kwargs)
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+@app.route('/download/<urlid>/<filename>')
+def download_file(urlid, filename):
+    """
+    下载指定文件。
+
+    请求:
+        GET /download/<urlid>/<filename>
+
+    返回:
+        下载文件。
+    """
+    # os.remove('temp')
+    if not is_valid_urlid(urlid):
+        return jsonify({"error": "文件未找到"}), 404
+    output_directory = get_output_dir(urlid)
+    file_path = os.path.join(output_directory, filename)
+    if use_object_store:
+        fetch_shared_file(f'outputs/{urlid}/{filename}', file_path)  # 输出可能由其他节点生成或已从本节点的缓存中丢失
+
+    if os.path.exists(file_path):
+        touch_session(urlid)
+        download_logger.info(f"File downloaded: {file_path}")
+        return send_negotiated_file(file_path, as_attachment=True)
+    else:
+        download_logger.error(f"File not found: {file_path}")
+        return jsonify({"error": "文件未找到"}), 404
+
+@app.route('/assets/<path:filename>')
+def serve_static_asset(filename):
+    """
+    提供页面使用的静态资源（JS、CSS、字体、图片）。
+
+    资源文件名中带有内容哈希，因此可以让浏览器永久缓存；客户端支持时发送预压缩版本。
+
+    请求:
+        GET /assets/<filename>
+
+    返回:
+        资源文件。
+    """
+    entry = static_manifest.get(filename)
+    if entry is None:
+        return jsonify({"error": "文件未找到"}), 404
+
+    accepted = parse_accept_encoding(request.headers.get('Accept-Encoding'))
+    send_path, encoding, etag = entry['path'], None, entry['etag']
+    for candidate, compressed_path in entry['encodings'].items():
+        if accepted.get(candidate, accepted.get('*', 0.0)) > 0:
+            send_path, encoding, etag = compressed_path, candidate, f"{entry['etag']}-{candidate}"
+            break
+
+    response = send_file(send_path, mimetype=entry['mimetype'], etag=etag, max_age=config.ASSET_MAX_AGE)
+    response.headers['Cache-Control'] = f'public, max-age={config.ASSET_MAX_AGE}, immutable'
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+@app.route('/favicon.ico')
+def favicon():
+    """
+    提供网站图标。
+    """
+    return send_file(os.path.join(app.root_path, 'templates', 'favicon.ico'), max_age=config.FAVICON_MAX_AGE)
+
+@app.route('/view/<urlid>/<path:filename>')
+def view_file(urlid, filename):
+    """
+    在浏览器中直接浏览输出目录中的文件（如多页HTML站点的页面）。
+
+    请求:
+        GET /view/<urlid>/<filename>
+
+    返回:
+        文件内容。
+    """
+    if not is_valid_urlid(urlid):
+        return jsonify({"error": "文件未找到"}), 404
+    output_directory = get_output_dir(urlid)
+    file_path = safe_join(output_directory, filename)
+    if file_path is not None and use_object_store:
+        fetch_shared_file(f'outputs/{urlid}/{filename}', file_path)
+    if file_path is None or not os.path.isfile(file_path):
+        return jsonify({"error": "文件未找到"}), 404
+    touch_session(urlid)
+    return send_negotiated_file(file_path)
+
+@app.route('/cas/<name>')
+def serve_asset(name):
+    """
+    提供按内容哈希命名的HTML资源（图片、CSS）。
+
+    资源内容与名称一一对应，因此可以让浏览器永久缓存。
+
+    请求:
+        GET /cas/<name>
+
+    返回:
+        资源文件。
+    """
+    if not re.fullmatch(r'[0-9a-f]{64}\.[a-z0-9]+', name):
+        return jsonify({"error": "文件未找到"}), 404
+
+    file_path = get_content_addressed_path(name, os.path.join(os.getcwd(), config.ASSET_STORE_DIR))
+    if use_object_store:
+        fetch_shared_file(f'assets/{name}', file_path, immutable=True)
+    if not os.path.exists(file_path):
+        return jsonify({"error": "文件未找到"}), 404
+    touch_access_time(file_path)  # 被页面引用的资源不会因长期未使用而被清理
+
+    response = send_negotiated_file(file_path, etag=name.split('.')[0], max_age=config.ASSET_MAX_AGE)
+    response.headers['Cache-Control'] = f'public, max-age={config.ASSET_MAX_AGE}, immutable'
+    return response
+
+def delete_session(urlid):
+    """
+    删除过期或被淘汰的会话：终止其转换，删除解压、输出和模板目录、上传记录，以及对象存储中的压缩包和转换输出
+    （上传记录删除后会话已无法再使用，副本不再有用）。
+    """
+    cancel_conversions(urlid, get_output_dir(urlid))
+    delete_urlid_dirs(urlid)
+    delete_upload(session_db, urlid)
+    if use_object_store:
+        delete_objects(object_store, f'packages/{urlid}')
+        delete_objects(object_store, f'outputs/{urlid}/')
+
+def sweep_storage(stop_event):
+    """
+    持续清理会话目录：先删除已过期的会话，再在会话目录与缓存目录的总大小超过 STORAGE_BUDGET_MB 时按最近最少使用的顺序淘汰
+    STORAGE_MIN_IDLE 秒内未访问的会话（比这些会话更久未使用的缓存文件已由 sweep_caches 先删除）。删除以每秒最多 STORAGE_DELETES_PER_SECOND 个会话的速度进行，
+    每次最多删除一个检查间隔内允许的数量；会话目录移入回收目录，文件由 reap_trash_until_stopped 限速删除。
+    """
+    limit = max(1, int(config.STORAGE_DELETES_PER_SECOND * config.STORAGE_SWEEP_SECONDS))
+    try:
+        candidates = [(urlid, 'expired') for urlid in get_expired_sessions(session_db, limit)]
+        if config.STORAGE_BUDGET_MB is not None and len(candidates) < limit:
+            excess = get_session_usage(session_db) + cache_usage - config.STORAGE_BUDGET_MB * 1024 * 1024
+            expired = {urlid for urlid, _ in candidates}
+            for urlid, size, _ in get_least_recent_sessions(session_db, config.STORAGE_MIN_IDLE, limit):
+                if excess <= 0 or len(candidates) >= limit:
+                    break
+                if urlid not in expired:
+                    candidates.append((urlid, 'evicted'))
+                excess -= size  # 已过期的会话也会在本次删除
+    except Exception as e:
+        app.logger.error(f"Failed to read the session expiry index: {e}")
+        return
+
+    for urlid, reason in candidates:
+        if stop_event.is_set():
+            return
+        try:
+            delete_session(urlid)
+            app.logger.info(f"Deleted {reason} session: {urlid}")
+        except Exception as e:
+            app.logger.error(f"Failed to delete session {urlid}: {e}")
+        stop_event.wait(1 / config.STORAGE_DELETES_PER_SECOND)
+
+def sweep_caches(stop_event):
+    """
+    清理图片缓存和共享资源目录：删除超过 CACHE_TTL 秒未使用的文件；设置了 STORAGE_BUDGET_MB 且会话目录与缓存的总大小
+    超出预算时，按最近最少使用的顺序删除 STORAGE_MIN_IDLE 秒内未使用、且比最久未访问的可淘汰会话更早使用的缓存文件，
+    会话与缓存文件统一按最后使用时间淘汰，其余超出部分由 sweep_storage 淘汰会话。删除速度不超过每秒 TRASH_DELETES_PER_SECOND 个文件。
+    """
+    global cache_usage
+    now = time.time()
+    try:
+        entries = scan_cache_entries(cache_dirs)
+        cache_usage = sum(size for _, size, _ in entries)
+        excess = 0
+        evict_before = now - config.STORAGE_MIN_IDLE
+        if config.STORAGE_BUDGET_MB is not None:
+            excess = get_session_usage(session_db) + cache_usage - config.STORAGE_BUDGET_MB * 1024 * 1024
+            oldest = get_least_recent_sessions(session_db, config.STORAGE_MIN_IDLE, 1)
+            if oldest:
+                evict_before = min(evict_before, oldest[0][2])
+    except Exception as e:
+        app.logger.error(f"Failed to scan cache directories: {e}")
+        return
+
+    expire_before = now - config.CACHE_TTL
+    candidates = []
+    for entry in entries:  # 最久未使用的在前
+        last_used, size, _ = entry
+        if last_used < expire_before or (excess > 0 and last_used < evict_before):
+            candidates.append(entry)
+            excess -= size
+        else:
+            break
+    if candidates:
+        freed = delete_cache_entries(candidates, stop_event, config.TRASH_DELETES_PER_SECOND)
+        cache_usage -= freed
+        app.logger.info(f"Deleted {len(candidates)} cached files ({freed} bytes)")
+
+def delete_stale_session_directories():
+    """
+    兜底清理：删除创建超过 SESSION_MAX_LIFETIME 秒的日期目录（过期索引中没有登记的目录，如索引丢失或旧版本遗留）。
+    """
+    before_date = (datetime.now() - timedelta(seconds=config.SESSION_MAX_LIFETIME)).strftime('%Y%m%d')
+    try:
+        deleted = delete_expired_sessions(before_date, config.SESSION_MAX_LIFETIME)
+    except Exception as e:
+        app.logger.error(f"Failed to delete stale session directories: {e}")
+        return
+    for path in deleted:
+        app.logger.info(f"Deleted stale directory: {path}")
+
+def prune_shared_state():
+    """
+    删除一天内没有使用的客户端令牌桶、过期的上传记录（其目录已被删除）和一小时前的取消广播。
+    """
+    try:
+        pruned = prune_token_buckets(rate_limit_db, 24 * 3600)
+        prune_session_store(session_db, config.SESSION_MAX_LIFETIME, 3600)
+        app.logger.info(f"Pruned {pruned} idle token buckets and expired session records")
+    except Exception as e:
+        app.logger.error(f"Failed to prune shared state: {e}")
+
+def reap_trash_until_stopped(stop_event):
+    """
+    回收线程：每 TRASH_REAP_SECONDS 秒删除各存储根目录的回收目录中的文件，每秒最多 TRASH_DELETES_PER_SECOND 个，
+    直到 stop_event 被设置。
+    """
+    while not stop_event.is_set():
+        try:
+            deleted = reap_trash(get_storage_roots(), stop_event, config.TRASH_DELETES_PER_SECOND)
+            if deleted:
+                app.logger.info(f"Reaped {deleted} trashed files and directories")
+        except Exception as e:
+            app.logger.error(f"Failed to reap trash: {e}")
+        stop_event.wait(TRASH_REAP_SECONDS)
+
+def record_storage_usage():
+    """
+    记录会话目录和缓存目录占用的空间，以及存储根目录所在文件系统的剩余空间，供 /metrics 输出。
+    """
+    try:
+        set_storage_bytes('sessions', get_session_usage(session_db))
+        set_storage_bytes('caches', cache_usage)
+        set_storage_bytes('scratch_free', shutil.disk_usage(scratch_root).free)
+        set_storage_bytes('output_free', shutil.disk_usage(output_root).free)
+    except Exception as e:
+        app.logger.error(f"Failed to record storage usage: {e}")
+
+def schedule_tasks(stop_event):
+    """
+    安排定时任务，在两次任务之间休眠到下一个任务的时间；同时启动回收线程，删除移入回收目录的文件。
+    """
+    reaper_thread = threading.Thread(target=reap_trash_until_stopped, args=(stop_event,), name='trash-reaper',
+                                     daemon=True)
+    reaper_thread.start()
+    schedule.every(config.STORAGE_SWEEP_SECONDS).seconds.do(sweep_storage, stop_event)  # 持续删除过期和被淘汰的会话
+    app.logger.info(f"Scheduled session expiry every {config.STORAGE_SWEEP_SECONDS}s.")
+    sweep_caches(stop_event)  # 启动时先扫描一次，sweep_storage 需要缓存的大小
+    schedule.every(config.CACHE_SWEEP_SECONDS).seconds.do(sweep_caches, stop_event)  # 清理未使用的缓存文件
+    schedule.every().hour.do(delete_stale_session_directories)  # 每小时兜底清理超过最长保留时间的目录
+    schedule.every().hour.do(prune_shared_state)  # 每小时清理空闲的令牌桶和过期的会话记录
+    if metrics_enabled:
+        schedule.every(config.STORAGE_SWEEP_SECONDS).seconds.do(record_storage_usage)  # 磁盘使用指标
+
+    try:
+        while not stop_event.is_set():
+            schedule.run_pending()
+            idle_seconds = schedule.idle_seconds()
+            stop_event.wait(1 if idle_seconds is None else min(max(idle_seconds, 0), 60))
+    finally:
+        schedule.clear()
+        reaper_thread.join()
+
+def start_scheduler(stop_event):
+    """
+    启动运行定时任务的后台线程。每个工作进程都会启动，但只有取得 SCHEDULER_LOCK_FILE 锁的进程运行定时任务，
+    该进程退出后由其他进程接替。
+
+    返回:
+        threading.Thread: 后台线程。
+    """
+    lock_path = os.path.join(os.getcwd(), config.SCHEDULER_LOCK_FILE)
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    task_thread = threading.Thread(target=run_as_leader, args=(lock_path, schedule_tasks, stop_event),
+                                   name='scheduler', daemon=True)
+    task_thread.start()
+    return task_thread
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+
+    # 创建一个停止事件
+    stop_event = threading.Event()
+
+    # 启动后台线程运行定时任务
+    task_thread = start_scheduler(stop_event)
+
+    try:
+        app.run(host=config.HOST, port=config.PORT, debug=config.DEBUG, use_reloader=False)
+    finally:
+        stop_event.set()  # 停止后台线程
+        task_thread.join()  # 确保后台线程在应用关闭时正确退出
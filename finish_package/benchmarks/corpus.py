@@ -0,0 +1,207 @@
+import os
+import random
+import zipfile
+
+try:
+    from PIL import Image, ImageDraw
+except ImportError:  # 未安装 Pillow 时只能生成不含图片的文档
+    Image = None
+    ImageDraw = None
+
+
+# 预置的测试文档：size_kb 为 Markdown 正文的目标大小，heading_depth 为最深的标题级别，
+# table_density、code_density 为每节包含表格、代码块的概率，cjk_ratio 为正文中中文的比例，
+# image_count 为图片数，image_size 为图片的宽和高（像素）
+CORPUS = {
+    'small': dict(size_kb=20, heading_depth=3, table_density=0.1, code_density=0.1, cjk_ratio=0.7,
+                  image_count=2, image_size=(800, 600)),
+    'medium': dict(size_kb=200, heading_depth=4, table_density=0.2, code_density=0.2, cjk_ratio=0.7,
+                   image_count=10, image_size=(1600, 1000)),
+    'large': dict(size_kb=1000, heading_depth=5, table_density=0.2, code_density=0.2, cjk_ratio=0.7,
+                  image_count=40, image_size=(2400, 1600)),
+    'tables': dict(size_kb=200, heading_depth=3, table_density=0.8, code_density=0.05, cjk_ratio=0.7,
+                   image_count=0, image_size=(800, 600)),
+    'code': dict(size_kb=200, heading_depth=3, table_density=0.05, code_density=0.8, cjk_ratio=0.3,
+                 image_count=0, image_size=(800, 600)),
+    'images': dict(size_kb=50, heading_depth=2, table_density=0.05, code_density=0.05, cjk_ratio=0.7,
+                   image_count=60, image_size=(3000, 2000)),
+    'latin': dict(size_kb=200, heading_depth=4, table_density=0.2, code_density=0.2, cjk_ratio=0.0,
+                  image_count=10, image_size=(1600, 1000)),
+}
+
+# 正文使用的常用汉字和英文单词
+CJK_CHARACTERS = (
+    '的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后'
+    '多定行学法所民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好应开它合'
+    '还因由其些然前外天政四日那社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质气第向道命此变条只'
+    '没结解问意建月公无系军很情者最立代想已通并提直题党程展五果料象员革位入常文总次品式活设及管特件长求老头基资边'
+    '流路级少图山统接知较将组见计别她手角期根论运农指几九区强放决西被干做必战先回则任取据处队南给色光门即保治北造'
+    '百规热领七海口东导器压志世金增争济阶油思术极交受联什认六共权收证改清己美再采转更单风切打白教速花带安场身车例'
+    '真务具万每目至达走积示议声报斗完类八离华名确才科张信马节话米整空元况今集温传土许步群广石记需段研界拉林律叫且'
+)
+LATIN_WORDS = (
+    'the conversion pipeline renders markdown documents into portable output formats while preserving headings '
+    'tables code blocks images and cross references across every section of the generated report so that readers '
+    'can navigate the structure quickly and reviewers can compare revisions with confidence during release planning'
+).split()
+
+# 代码块的语言和示例代码行
+CODE_SAMPLES = {
+    'python': ['def handle(request):', '    data = request.get_json()', '    result = process(data)',
+               '    if result is None:', '        raise ValueError("empty result")', '    return {"status": "ok"}',
+               'for index, item in enumerate(items):', '    print(index, item)'],
+    'bash': ['set -euo pipefail', 'for file in *.md; do', '  pandoc "$file" -o "${file%.md}.pdf"', 'done',
+             'tar -czf archive.tar.gz output/', 'echo "done"'],
+    'json': ['{', '  "name": "md2doc",', '  "version": "1.0.0",', '  "formats": ["pdf", "html", "docx"]', '}'],
+}
+
+
+def generate_sentence(rng, cjk_ratio):
+    """
+    生成一个句子：按 cjk_ratio 的概率为中文句子，否则为英文句子。
+    """
+    if rng.random() < cjk_ratio:
+        return ''.join(rng.choice(CJK_CHARACTERS) for _ in range(rng.randint(12, 40))) + '。'
+    words = [rng.choice(LATIN_WORDS) for _ in range(rng.randint(8, 24))]
+    return ' '.join(words).capitalize() + '. '
+
+
+def generate_paragraph(rng, cjk_ratio):
+    """
+    生成一个由 2~6 个句子组成的段落，偶尔包含加粗、斜体和行内代码。
+    """
+    sentences = [generate_sentence(rng, cjk_ratio) for _ in range(rng.randint(2, 6))]
+    if rng.random() < 0.3:
+        index = rng.randrange(len(sentences))
+        sentences[index] = f"**{sentences[index].strip()}**"
+    if rng.random() < 0.2:
+        sentences.append(f" `{rng.choice(LATIN_WORDS)}_{rng.randint(1, 99)}()` ")
+    return ''.join(sentences)
+
+
+def generate_table(rng, cjk_ratio):
+    """
+    生成一个 Markdown 管道表格：2~6 列、3~12 行。
+    """
+    columns = rng.randint(2, 6)
+    header = [generate_sentence(rng, cjk_ratio)[:rng.randint(2, 8)].strip() or 'x' for _ in range(columns)]
+    lines = ['| ' + ' | '.join(header) + ' |', '|' + '---|' * columns]
+    for _ in range(rng.randint(3, 12)):
+        cells = [str(rng.randint(0, 100000)) if rng.random() < 0.4 else
+                 generate_sentence(rng, cjk_ratio)[:rng.randint(4, 20)].strip() for _ in range(columns)]
+        lines.append('| ' + ' | '.join(cell.replace('|', ' ') for cell in cells) + ' |')
+    return '\n'.join(lines)
+
+
+def generate_code_block(rng):
+    """
+    生成一个 5~30 行的围栏代码块。
+    """
+    language = rng.choice(sorted(CODE_SAMPLES))
+    lines = [rng.choice(CODE_SAMPLES[language]) for _ in range(rng.randint(5, 30))]
+    return f"```{language}\n" + '\n'.join(lines) + "\n```"
+
+
+def generate_image(path, size, rng):
+    """
+    生成一张 PNG 图片：渐变背景上随机分布的矩形和线条，压缩率接近真实的截图和示意图。
+
+    参数:
+        path (str): 图片路径。
+        size (tuple): 宽和高（像素）。
+        rng (random.Random): 随机数生成器。
+
+    异常:
+        RuntimeError: 未安装 Pillow。
+    """
+    if Image is None:
+        raise RuntimeError("Generating images requires Pillow (pip install Pillow)")
+    width, height = size
+    gradient = Image.linear_gradient('L').resize((width, height))
+    image = Image.merge('RGB', (gradient, gradient.rotate(90, expand=False).resize((width, height)),
+                                Image.new('L', (width, height), rng.randint(120, 255))))
+    draw = ImageDraw.Draw(image)
+    for _ in range(rng.randint(10, 40)):
+        x, y = rng.randrange(width), rng.randrange(height)
+        box = (x, y, min(width, x + rng.randint(20, width // 3)), min(height, y + rng.randint(20, height // 3)))
+        color = tuple(rng.randint(0, 255) for _ in range(3))
+        if rng.random() < 0.5:
+            draw.rectangle(box, fill=color)
+        else:
+            draw.line(box, fill=color, width=rng.randint(1, 6))
+    image.save(path, format='PNG')
+
+
+def generate_package(directory, size_kb=200, heading_depth=4, table_density=0.2, code_density=0.2, cjk_ratio=0.7,
+                     image_count=10, image_size=(1600, 1000), seed=0):
+    """
+    按上传压缩包的目录结构生成测试文档：directory/test.md 和 directory/imgs/image<N>/figure<N>.png。
+    相同的参数和 seed 总是生成相同的文档。
+
+    参数:
+        directory (str): 输出目录。
+        size_kb (int): Markdown 正文的目标大小（KB）。
+        heading_depth (int): 最深的标题级别（1~6）。
+        table_density (float): 每节包含表格的概率。
+        code_density (float): 每节包含代码块的概率。
+        cjk_ratio (float): 正文句子中中文句子的比例。
+        image_count (int): 图片数，均匀分布在各节中。
+        image_size (tuple): 图片的宽和高（像素）。
+        seed (int): 随机数种子。
+
+    返回:
+        str: Markdown 文件路径。
+    """
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    target = size_kb * 1024
+    heading_depth = max(1, min(heading_depth, 6))
+    blocks = []
+    size = 0
+    level = 1
+    section = 0
+    images_written = 0
+    while size < target or images_written < image_count:
+        section += 1
+        # 标题级别每次最多加深一级，与真实文档的目录结构一致
+        level = rng.randint(1, min(level + 1, heading_depth))
+        section_blocks = [f"{'#' * level} {section} {generate_sentence(rng, cjk_ratio)[:rng.randint(4, 16)].strip()}"]
+        for _ in range(rng.randint(1, 4)):
+            section_blocks.append(generate_paragraph(rng, cjk_ratio))
+        if rng.random() < table_density:
+            section_blocks.append(generate_table(rng, cjk_ratio))
+        if rng.random() < code_density:
+            section_blocks.append(generate_code_block(rng))
+        # 剩余图片按剩余篇幅均匀分布，正文已达到目标大小后每节一张
+        remaining = max(target - size, 1)
+        while images_written < image_count and \
+                (size >= target or rng.random() < (image_count - images_written) * 2048 / remaining):
+            images_written += 1
+            image_dir = os.path.join(directory, 'imgs', f'image{images_written}')
+            os.makedirs(image_dir, exist_ok=True)
+            generate_image(os.path.join(image_dir, f'figure{images_written}.png'), image_size, rng)
+            section_blocks.append(f"![图 {images_written}](imgs/image{images_written}/figure{images_written}.png)")
+            if size >= target:
+                break
+        text = '\n\n'.join(section_blocks)
+        blocks.append(text)
+        size += len(text.encode('utf-8'))
+    md_path = os.path.join(directory, 'test.md')
+    with open(md_path, 'w', encoding='utf-8') as f:
+        f.write('\n\n'.join(blocks) + '\n')
+    return md_path
+
+
+def zip_package(directory, zip_path):
+    """
+    将 generate_package 生成的目录打包为可直接上传的 ZIP 文件，test.md 位于压缩包根目录。
+
+    参数:
+        directory (str): 文档目录。
+        zip_path (str): ZIP 文件路径。
+    """
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for root, _, files in os.walk(directory):
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                archive.write(path, os.path.relpath(path, directory))
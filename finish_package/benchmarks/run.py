@@ -0,0 +1,325 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.corpus import CORPUS, generate_package, zip_package
+
+
+# 项目根目录：转换函数按当前目录查找 templates/styles.css 等资源
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+FORMATS = ('pdf', 'html', 'docx')
+
+# 与基线比较的指标及判定退化的最小绝对增量，避免很小的数值因测量噪声被误判
+COMPARED_METRICS = {
+    'wall_seconds': 0.05,
+    'cpu_seconds': 0.05,
+    'peak_rss_mb': 5.0,
+    'output_kb': 1.0,
+}
+
+# 封面、页眉等参数，与前端未填写表单时的默认值一致，使各次测量的输出可比
+DOCUMENT = {
+    'title': 'Benchmark',
+    'version': '1.0',
+    'date': '2024-01-01',
+    'statement': '',
+    'left_header': 'Benchmark',
+    'right_header': 'md2doc',
+    'cover_footer': '',
+}
+
+
+def convert(output_format, input_file, output_file, resource_paths, work_dir):
+    """
+    按 app.plan_conversion 的方式调用 util/markdown_operations 中的转换函数。
+
+    参数:
+        output_format (str): pdf、html 或 docx。
+        input_file (str): Markdown 文件路径。
+        output_file (str): 输出文件路径。
+        resource_paths (list): 资源文件路径列表。
+        work_dir (str): 模板、图片缓存和共享资源目录所在的临时目录。
+    """
+    from templates import config
+    from util.generate import generate_latex_document_pdf, create_template_with_headers
+    from util.markdown_operations import convert_markdown_to_pdf, convert_markdown_to_html, \
+        convert_md_to_docx_with_toc_and_template
+
+    logo_path = os.path.join(PACKAGE_ROOT, 'templates', 'logo.png')
+    image_cache_dir = os.path.join(work_dir, 'images')
+    if output_format == 'pdf':
+        tex_path = generate_latex_document_pdf(DOCUMENT['left_header'], DOCUMENT['right_header'],
+                                               DOCUMENT['cover_footer'], work_dir)
+        convert_markdown_to_pdf(input_file, DOCUMENT['title'], DOCUMENT['version'], DOCUMENT['date'], output_file,
+                                header_file=tex_path, logo_path=logo_path, resource_paths=resource_paths,
+                                statement=DOCUMENT['statement'], image_dpi=config.IMAGE_TARGET_DPI,
+                                image_cache_dir=image_cache_dir, image_workers=config.IMAGE_WORKERS)
+    elif output_format == 'html':
+        convert_markdown_to_html(input_file, output_file, resource_paths=resource_paths, title=DOCUMENT['title'],
+                                 html_mode=config.HTML_MODE, asset_store_dir=os.path.join(work_dir, 'assets'),
+                                 minify=config.HTML_MINIFY, precompress=config.HTML_PRECOMPRESS)
+    elif output_format == 'docx':
+        template_file_path = os.path.join(work_dir, 'template_with_headers.docx')
+        create_template_with_headers(template_file_path, DOCUMENT['left_header'], DOCUMENT['right_header'])
+        convert_md_to_docx_with_toc_and_template(input_file, output_file, template_file_path, DOCUMENT['title'],
+                                                 DOCUMENT['version'], DOCUMENT['date'], DOCUMENT['left_header'],
+                                                 DOCUMENT['right_header'], DOCUMENT['statement'], resource_paths,
+                                                 logo_path, image_dpi=config.IMAGE_TARGET_DPI,
+                                                 image_cache_dir=image_cache_dir, image_workers=config.IMAGE_WORKERS)
+    else:
+        raise ValueError(f"Unsupported output format: {output_format}")
+
+
+def run_case(zip_path, output_format):
+    """
+    在新的子进程中解压测试文档并转换一次，图片缓存等均为空（冷启动），常驻内存的峰值只包含本次转换。
+
+    参数:
+        zip_path (str): 测试文档的 ZIP 文件路径。
+        output_format (str): pdf、html 或 docx。
+
+    返回:
+        dict: wall_seconds（耗时）、cpu_seconds（本进程及所有子进程的 CPU 时间）、peak_rss_mb（本进程与子进程中
+            最大的常驻内存峰值）、output_kb（输出文件大小）、status（ok 或 failed）、error 和 stages（各步骤的耗时，秒）。
+    """
+    os.chdir(PACKAGE_ROOT)
+    from util.file_operations import check_and_extract_archive, get_all_subdirs, get_subdirs
+    from util.process_operations import process_usage, new_usage
+    from util.tracing import start_timeline, export_spans
+
+    work_dir = tempfile.mkdtemp(prefix='md2doc-bench-')
+    try:
+        extract_to = os.path.join(work_dir, 'upload')
+        os.makedirs(extract_to)
+        check_and_extract_archive(zip_path, extract_to)
+        input_file = os.path.join(extract_to, 'test.md')
+        # 资源路径与 app.get_resource_paths 相同
+        resource_paths = get_all_subdirs(extract_to)
+        resource_paths.append(os.path.abspath(extract_to))
+        subdirs = get_subdirs(extract_to)
+        if subdirs:
+            resource_paths.append(os.path.join(extract_to, subdirs[0]))
+        output_file = os.path.join(work_dir, f'output.{output_format}')
+
+        usage = new_usage()
+        process_usage.set(usage)
+        timeline = start_timeline()
+        error = None
+        before = resource.getrusage(resource.RUSAGE_SELF)
+        started = time.perf_counter()
+        try:
+            convert(output_format, input_file, output_file, resource_paths, work_dir)
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+        wall_seconds = time.perf_counter() - started
+        after = resource.getrusage(resource.RUSAGE_SELF)
+
+        stages = {}
+        for record in export_spans(timeline):
+            if record['parent'] is None and record['duration_ms'] is not None:
+                stages[record['name']] = round(stages.get(record['name'], 0) + record['duration_ms'] / 1000, 3)
+        succeeded = error is None and os.path.exists(output_file)
+        if error is None and not succeeded:
+            error = 'no output file'
+        return {
+            'status': 'ok' if succeeded else 'failed',
+            'error': error,
+            'wall_seconds': round(wall_seconds, 3),
+            'cpu_seconds': round(after.ru_utime + after.ru_stime - before.ru_utime - before.ru_stime +
+                                 usage['cpu_seconds'], 3),
+            'peak_rss_mb': round(max(after.ru_maxrss / 1024, usage['peak_memory_mb']), 1),  # Linux 上单位为 KB
+            'output_kb': round(os.path.getsize(output_file) / 1024, 1) if succeeded else 0.0,
+            'stages': stages,
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def measure(zip_path, output_format, repeat):
+    """
+    转换 repeat 次，每次使用新的子进程（spawn，不继承父进程已导入的模块和内存），取各指标的中位数。
+
+    返回:
+        dict: run_case 的结果，数值为中位数；任何一次失败时返回该次的结果。
+    """
+    runs = []
+    context = multiprocessing.get_context('spawn')
+    for _ in range(repeat):
+        with context.Pool(1, maxtasksperchild=1) as pool:
+            result = pool.apply(run_case, (zip_path, output_format))
+        if result['status'] != 'ok':
+            return result
+        runs.append(result)
+    summary = dict(runs[0], runs=repeat)
+    for metric in COMPARED_METRICS:
+        summary[metric] = round(statistics.median(run[metric] for run in runs), 3)
+    summary['stages'] = {name: round(statistics.median(run['stages'].get(name, 0) for run in runs), 3)
+                         for name in runs[0]['stages']}
+    return summary
+
+
+def get_environment():
+    """
+    返回:
+        dict: 影响测量结果的环境信息，保存在基线中，比较时不一致会给出提示。
+    """
+    def tool_version(command):
+        try:
+            output = subprocess.run([command, '--version'], capture_output=True, text=True, timeout=30).stdout
+        except (OSError, subprocess.SubprocessError):
+            return None
+        return output.splitlines()[0] if output else None
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'pandoc': tool_version('pandoc'),
+        'xelatex': tool_version('xelatex'),
+    }
+
+
+def load_baseline(path):
+    """
+    返回:
+        dict: 基线文件的内容；文件不存在时返回 None。
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_baseline(path, results, environment):
+    """
+    保存基线，已有基线中本次未测量的文档和格式保持不变。
+    """
+    baseline = load_baseline(path) or {'results': {}}
+    for corpus, formats in results.items():
+        for output_format, result in formats.items():
+            if result['status'] == 'ok':
+                baseline['results'].setdefault(corpus, {})[output_format] = \
+                    {metric: result[metric] for metric in COMPARED_METRICS}
+    baseline['environment'] = environment
+    baseline['recorded_at'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def compare(results, baseline, tolerance):
+    """
+    将测量结果与基线比较。
+
+    参数:
+        results (dict): 文档名 -> 格式 -> measure 的结果。
+        baseline (dict): load_baseline 读取的基线。
+        tolerance (float): 允许的相对增长，如 0.1 表示超过基线 10% 视为退化。
+
+    返回:
+        list: 退化的指标，每项为 (文档名, 格式, 指标, 基线值, 测量值)；转换失败而基线中成功的也计入。
+    """
+    regressions = []
+    for corpus, formats in results.items():
+        for output_format, result in formats.items():
+            expected = baseline['results'].get(corpus, {}).get(output_format)
+            if expected is None:
+                continue
+            if result['status'] != 'ok':
+                regressions.append((corpus, output_format, 'status', 'ok', result['status']))
+                continue
+            for metric, minimum_delta in COMPARED_METRICS.items():
+                value, reference = result[metric], expected.get(metric)
+                if reference is not None and value > reference * (1 + tolerance) and value - reference > minimum_delta:
+                    regressions.append((corpus, output_format, metric, reference, value))
+    return regressions
+
+
+def format_row(corpus, output_format, result, expected):
+    """
+    返回:
+        str: 报告中的一行；有基线时在各指标后附上相对基线的变化。
+    """
+    if result['status'] != 'ok':
+        return f"{corpus:<8} {output_format:<5} FAILED  {result['error']}"
+    cells = []
+    for metric in COMPARED_METRICS:
+        cell = f"{result[metric]:>9}"
+        if expected is not None:
+            reference = expected.get(metric)
+            cell += f" ({(result[metric] / reference - 1) * 100:+5.1f}%)" if reference else ' ' * 9
+        cells.append(cell)
+    return f"{corpus:<8} {output_format:<5} " + '  '.join(cells)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark end-to-end conversions on a synthetic corpus.')
+    parser.add_argument('--corpus', nargs='+', default=['small', 'medium'], choices=sorted(CORPUS),
+                        help='documents to convert (default: small medium)')
+    parser.add_argument('--formats', nargs='+', default=list(FORMATS), choices=FORMATS)
+    parser.add_argument('--repeat', type=int, default=3, help='conversions per case, the median is reported')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the corpus generator')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline file to compare against')
+    parser.add_argument('--save-baseline', action='store_true', help='record the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed relative growth (default: 0.1)')
+    parser.add_argument('--output', help='write the full results as JSON to this file')
+    parser.add_argument('--keep-corpus', help='generate the corpus into this directory and keep it')
+    args = parser.parse_args(argv)
+
+    corpus_dir = args.keep_corpus or tempfile.mkdtemp(prefix='md2doc-corpus-')
+    environment = get_environment()
+    baseline = load_baseline(args.baseline)
+    if baseline and baseline.get('environment') != environment:
+        print(f"Warning: baseline was recorded in a different environment: {baseline.get('environment')}",
+              file=sys.stderr)
+
+    results = {}
+    try:
+        width = 18 if baseline else 9  # 有基线时各指标后附有变化百分比
+        print(f"{'corpus':<8} {'fmt':<5} " + '  '.join(f"{metric:>{width}}" for metric in COMPARED_METRICS))
+        for corpus in args.corpus:
+            package_dir = os.path.join(corpus_dir, corpus)
+            shutil.rmtree(package_dir, ignore_errors=True)
+            generate_package(package_dir, seed=args.seed, **CORPUS[corpus])
+            zip_path = os.path.join(corpus_dir, f'{corpus}.zip')
+            zip_package(package_dir, zip_path)
+            results[corpus] = {}
+            for output_format in args.formats:
+                result = measure(zip_path, output_format, args.repeat)
+                results[corpus][output_format] = result
+                expected = baseline and baseline['results'].get(corpus, {}).get(output_format)
+                print(format_row(corpus, output_format, result, expected), flush=True)
+    finally:
+        if not args.keep_corpus:
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'environment': environment, 'results': results}, f, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        save_baseline(args.baseline, results, environment)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+    if baseline is None:
+        return 0
+    regressions = compare(results, baseline, args.tolerance)
+    for corpus, output_format, metric, reference, value in regressions:
+        print(f"Regression: {corpus} {output_format} {metric} {reference} -> {value}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
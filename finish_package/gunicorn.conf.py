@@ -0,0 +1,63 @@
+# gunicorn 配置：gunicorn -c gunicorn.conf.py wsgi:app
+# 平滑重启（重新加载代码和配置，正在进行的转换在 graceful_timeout 内完成后旧进程才退出）：
+#     kill -HUP $(cat logs/gunicorn.pid)
+import multiprocessing
+import os
+from templates import config as app_config  # 不能命名为 config，gunicorn 会将其视为配置项
+
+bind = f"{app_config.HOST}:{app_config.PORT}"
+
+# 工作进程数，默认每个 CPU 核心一个；每个进程用 WORKER_THREADS 个线程处理请求，转换在进程内的事件循环中运行
+workers = app_config.WORKER_PROCESSES or multiprocessing.cpu_count()
+worker_class = 'gthread'
+threads = app_config.WORKER_THREADS
+
+# gthread 工作进程的心跳与请求线程无关，长时间的转换不会触发 timeout
+timeout = 60
+graceful_timeout = app_config.GRACEFUL_TIMEOUT
+
+# 定期替换工作进程，释放长期运行累积的内存
+max_requests = 1000
+max_requests_jitter = 100
+
+pidfile = 'logs/gunicorn.pid'
+accesslog = 'logs/access.log'
+errorlog = 'logs/gunicorn.log'
+
+
+def prepare_workers(server):
+    """
+    在主进程中完成所有工作进程共用的准备工作，再由主进程创建工作进程：
+    各工作进程平分 CONVERSION_WORKERS 个转换槽位；静态资源预压缩较慢，只在主进程中生成一次缓存，
+    工作进程启动时直接使用。
+    """
+    os.environ['APP_WORKER_PROCESSES'] = str(server.cfg.workers)
+    if app_config.METRICS_DIR:
+        # 上次运行的工作进程留下的指标文件不再计入
+        from util.metrics import remove_dead_process_files
+        metrics_dir = os.path.join(os.getcwd(), app_config.METRICS_DIR)
+        os.makedirs(metrics_dir, exist_ok=True)
+        remove_dead_process_files(metrics_dir)
+    from util.static_assets import build_static_manifest
+    root_path = os.path.dirname(os.path.abspath(__file__))
+    build_static_manifest(
+        index_path=os.path.join(root_path, 'templates', 'index.html'),
+        assets_dir=os.path.join(root_path, 'templates', 'assets'),
+        cache_dir=os.path.join(os.getcwd(), app_config.STATIC_CACHE_DIR),
+    )
+
+
+on_starting = prepare_workers
+on_reload = prepare_workers
+
+
+def remove_worker_metrics(server, worker):
+    """
+    工作进程退出后，其等待和运行中的作业数不再计入 /metrics。
+    """
+    if app_config.METRICS_DIR:
+        from util.metrics import mark_process_dead
+        mark_process_dead(worker.pid, os.path.join(os.getcwd(), app_config.METRICS_DIR))
+
+
+child_exit = remove_worker_metrics
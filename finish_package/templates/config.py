@@ -4,3 +4,157 @@ LOG_LEVEL = logging.INFO
 HOST = '0.0.0.0'
 PORT = 8888
 DEBUG = True
+
+# 图片优化：按版心宽度和目标 DPI 缩小 PDF/DOCX 中的图片，IMAGE_TARGET_DPI 为 None 时关闭；
+# PDF 中 xelatex 不支持的图片格式（WebP、SVG、GIF 等）会转换后缓存到 IMAGE_CACHE_DIR，各会话共享
+IMAGE_TARGET_DPI = 150
+IMAGE_CACHE_DIR = 'cache/images'
+IMAGE_WORKERS = 4
+
+# HTML 输出：'self_contained' 将图片和 CSS 以 base64 内嵌到单个文件，下载后可离线查看；
+# 'linked' 页面中以 /cas/<内容哈希> 链接引用图片和 CSS，文件更小，但只能通过本服务查看；
+# 'site' 按标题拆分为带目录和上一页/下一页导航的多页站点
+# 请求中可通过 html_mode 字段覆盖
+HTML_MODE = 'self_contained'
+ASSET_STORE_DIR = 'cache/assets'
+ASSET_MAX_AGE = 365 * 24 * 3600  # 内容哈希资源永不变化，可长期缓存
+HTML_SPLIT_LEVEL = 2  # 'site' 模式按一级或二级标题拆分为多个页面
+HTML_MINIFY = True  # 压缩输出的 HTML 和 styles.css
+HTML_PRECOMPRESS = True  # 转换时生成 .gz/.br 预压缩文件，下载时按 Accept-Encoding 发送
+
+# 文件下载：None 由应用直接发送；'x-accel-redirect' 由前置 nginx 发送（需将 X_ACCEL_REDIRECT_PREFIX
+# 配置为 internal location 并指向应用工作目录）；'x-sendfile' 由支持 X-Sendfile 的服务器发送
+DOWNLOAD_OFFLOAD = None
+X_ACCEL_REDIRECT_PREFIX = '/protected/'
+
+# 页面静态资源：启动时按 index.html 的引用生成清单，预压缩文件缓存在 STATIC_CACHE_DIR
+STATIC_CACHE_DIR = 'cache/static'
+FAVICON_MAX_AGE = 24 * 3600
+
+# 转换子进程的资源限制，按输出格式配置（'html' 同时用于多页站点），某项为 None 时不限制：
+# timeout 为每个子进程的墙钟超时（秒），超时后终止整个进程组；cpu_seconds 为 RLIMIT_CPU（秒）；
+# memory_mb 为 xelatex 的 RLIMIT_AS（pandoc 启动时会保留大量虚拟地址空间，不适用）；
+# pandoc_heap_mb 为 pandoc 的 +RTS -M 堆上限
+CONVERSION_LIMITS = {
+    'pdf': {'timeout': 300, 'cpu_seconds': 240, 'memory_mb': 2048, 'pandoc_heap_mb': 1024},
+    'html': {'timeout': 120, 'cpu_seconds': 90, 'memory_mb': None, 'pandoc_heap_mb': 1024},
+    'docx': {'timeout': 180, 'cpu_seconds': 120, 'memory_mb': None, 'pandoc_heap_mb': 1024},
+}
+
+# 预渲染：上传解压后立即在后台按 SPECULATIVE_OPTIONS 转换 SPECULATIVE_FORMATS 中的格式（'html'，可加 'pdf' 草稿），
+# 之后参数相同的转换请求直接返回结果。预渲染逐个运行、等到没有正式转换时才开始，子进程的 nice 值为 SPECULATIVE_NICE
+# SPECULATIVE_OPTIONS 与前端未填写表单时提交的空值一致；PDF 草稿使用 templates/logo.png
+SPECULATIVE_RENDER = False
+SPECULATIVE_FORMATS = ['html']
+SPECULATIVE_OPTIONS = {'title': '', 'version': '', 'statement': '', 'left_header': '', 'right_header': '',
+                       'cover_footer': ''}
+SPECULATIVE_NICE = 19
+
+# 转换调度：整个节点同时运行转换子进程的作业数为 CONVERSION_WORKERS（多进程部署时由各工作进程平分），其余作业按成本模型预计的 CPU 时间从短到长排队，
+# 每等待一秒预计值抵扣 SCHEDULER_AGING_RATE 秒，避免大文档一直被插队；
+# 成本模型根据 Markdown 大小、标题/表格/代码块数量、图片数量和像素预测 CPU 时间和峰值内存，
+# 每次转换成功后用子进程实测的资源使用更新，保存在 SQLite 数据库 COST_MODEL_DB 中，多个工作进程共享
+CONVERSION_WORKERS = 4
+SCHEDULER_AGING_RATE = 0.5
+COST_MODEL_DB = 'cache/cost_model.sqlite3'
+
+# 按客户端限流和公平排队：请求头 X-API-Key 为 API_KEYS 中的密钥时按密钥识别客户端，否则按 IP 地址；
+# 密钥的 weight 同时放大该客户端的令牌补充速度、令牌桶容量和排队份额。应用位于反向代理之后时，
+# 将 PROXY_FIX_X_FOR 设为代理层数，从 X-Forwarded-For 取得客户端地址。
+# 上传按字节数限流，转换按 CPU 秒数限流（提交时按预计值预扣，结束后按实测值结算），速率为 None 时不限制；
+# 令牌桶保存在 SQLite 数据库 RATE_LIMIT_DB 中，多个工作进程共享
+API_KEYS = {}  # 例如 {'密钥': {'name': 'ci', 'weight': 4}}
+PROXY_FIX_X_FOR = 0
+RATE_LIMIT_DB = 'cache/rate_limit.sqlite3'
+UPLOAD_BYTES_PER_SECOND = 1024 * 1024
+UPLOAD_BYTES_BURST = 200 * 1024 * 1024
+CONVERT_CPU_PER_SECOND = 0.5
+CONVERT_CPU_BURST = 600
+
+# 生产部署（gunicorn -c gunicorn.conf.py wsgi:app）：WORKER_PROCESSES 为工作进程数，None 时每个 CPU 核心一个，
+# 每个进程 WORKER_THREADS 个请求线程；平滑重启时旧进程最多等待 GRACEFUL_TIMEOUT 秒完成正在进行的转换。
+# 上传记录、已完成的转换和取消广播保存在 SQLite 数据库 SESSION_DB 中，各工作进程共享；
+# 定时任务只在取得 SCHEDULER_LOCK_FILE 锁的一个进程中运行
+WORKER_PROCESSES = None
+WORKER_THREADS = 8
+GRACEFUL_TIMEOUT = 600
+SESSION_DB = 'cache/session.sqlite3'
+SCHEDULER_LOCK_FILE = 'cache/scheduler.lock'
+
+# 分布式模式（多台主机位于负载均衡之后）：Web 节点把转换作业放入 REDIS_URL 的共享队列，由任意主机上的工作节点
+# （python worker.py）取出转换；上传的压缩包和转换输出保存在 OBJECT_STORE（各主机挂载的共享目录或 S3 兼容存储），
+# 任意节点都能处理转换、下载和清理请求。单机测试可以用 python -m util.mini_redis 代替 Redis。
+# 作业排队加运行超过 DISTRIBUTED_JOB_TIMEOUT 秒时返回 504；成功的结果保留 DISTRIBUTED_RESULT_TTL 秒，相同的请求直接使用
+DISTRIBUTED_MODE = False
+REDIS_URL = 'redis://127.0.0.1:6379/0'
+REDIS_KEY_PREFIX = 'md2doc:'
+DISTRIBUTED_JOB_TIMEOUT = 900
+DISTRIBUTED_RESULT_TTL = 24 * 3600
+
+# 存储：SCRATCH_DIR 为解压目录、模板目录和临时文件的根目录，OUTPUT_DIR 为转换输出目录的根目录，
+# 每次上传的目录按 <根目录>/<日期>/<分片>/<urlid> 存放；
+# '' 为工作目录，'tmpfs' 为内存文件系统 /dev/shm 下的目录（没有 /dev/shm 时为工作目录），其他值为目录路径（相对于工作目录）。
+# OBJECT_STORE 保存上传的压缩包和转换输出：目录（本地磁盘或各主机挂载的共享目录），或 S3 兼容存储
+# 's3://<bucket>/<前缀>'（需要安装 boto3；MinIO 等自建服务在 S3_ENDPOINT_URL 中填写地址，
+# 密钥通过 AWS_ACCESS_KEY_ID、AWS_SECRET_ACCESS_KEY 环境变量提供）。分布式模式总是使用对象存储；
+# 单机模式下 USE_OBJECT_STORE 为 True 时也使用，本地目录只作为缓存，丢失（如 tmpfs 在重启后清空）时从对象存储取回
+SCRATCH_DIR = 'storage'
+OUTPUT_DIR = 'storage'
+OBJECT_STORE = 'cache/object_store'
+USE_OBJECT_STORE = False
+S3_ENDPOINT_URL = None
+S3_REGION = None
+
+# 会话清理：每次上传的目录在最后一次访问（上传、转换、下载）SESSION_TTL 秒后过期，由后台任务每 STORAGE_SWEEP_SECONDS 秒
+# 按过期索引删除；本节点所有会话目录的总大小超过 STORAGE_BUDGET_MB 时，按最近最少使用的顺序淘汰 STORAGE_MIN_IDLE 秒内
+# 未访问的会话（None 时不限制）。删除速度不超过每秒 STORAGE_DELETES_PER_SECOND 个会话；删除会话时对象存储中的副本一并删除；
+# 创建超过 SESSION_MAX_LIFETIME 秒的日期目录无论是否仍在使用都会被删除（兜底清理过期索引中没有登记的目录）
+SESSION_TTL = 24 * 3600
+SESSION_MAX_LIFETIME = 7 * 24 * 3600
+STORAGE_BUDGET_MB = None
+STORAGE_MIN_IDLE = 600
+STORAGE_DELETES_PER_SECOND = 5
+STORAGE_SWEEP_SECONDS = 10
+
+# 缓存清理：IMAGE_CACHE_DIR 和 ASSET_STORE_DIR 中超过 CACHE_TTL 秒未使用的文件由后台任务每 CACHE_SWEEP_SECONDS 秒删除；
+# 缓存与会话目录计入同一个 STORAGE_BUDGET_MB，超出时与会话一起按最近最少使用的顺序淘汰。
+# linked 模式的页面在会话存续期间引用共享资源，CACHE_TTL 不应小于 SESSION_MAX_LIFETIME
+CACHE_TTL = SESSION_MAX_LIFETIME
+CACHE_SWEEP_SECONDS = 300
+
+# 删除的会话目录（清理、过期、重新上传时的旧文件）先改名移入各存储根目录下的 trash 目录，请求不等待删除；
+# 后台每秒最多删除 TRASH_DELETES_PER_SECOND 个文件和目录，把磁盘 I/O 平摊到较长的时间内
+TRASH_DELETES_PER_SECOND = 1000
+
+# 监控指标：/metrics 以 Prometheus 文本格式输出上传大小、各阶段（解压、预处理、pandoc、xelatex、DOCX 合并/目录/页眉、
+# 排队等待）的耗时、转换缓存命中、发送字节数和磁盘使用，按输出格式和结果分类（需要安装 prometheus_client）。
+# 多进程部署时各进程的指标写入 METRICS_DIR 后合并输出，gunicorn 启动时删除已退出进程留下的文件；
+# 只运行 worker.py 的主机可设置 WORKER_METRICS_PORT，由工作节点单独提供指标。/metrics 不需要认证，应在反向代理中限制访问
+METRICS_ENABLED = True
+METRICS_DIR = 'cache/metrics'
+WORKER_METRICS_PORT = None
+
+# 请求时间线：记录解压、生成模板、排队、每个 pandoc/xelatex 子进程（CPU 时间、最大常驻内存）、DOCX 合并等步骤的开始时间和耗时。
+# TIMELINE_HEADER 为 True 时通过 Server-Timing 响应头返回（浏览器开发者工具的 Timing 面板可查看，只应在排查问题时打开）；
+# 处理时间超过 SLOW_REQUEST_SECONDS 秒的请求写入 logs/slow_request.log，设为 None 时不记录
+TIMELINE_HEADER = False
+SLOW_REQUEST_SECONDS = 10
+
+# 按需性能分析：设置 ADMIN_TOKEN 后，管理员可以通过 POST /admin/profiling（请求头 X-Admin-Token）在不重新部署的情况下
+# 打开采样开关，按百分比对 /convert 和 /upload 请求进行 CPU 采样（每 PROFILE_SAMPLE_INTERVAL 秒一次，按线程实际消耗的 CPU
+# 时间加权）和 tracemalloc 内存分析，持续 duration 秒后自动关闭。每个被分析的请求在 PROFILE_DIR 中保存火焰图使用的
+# 折叠调用栈和分配内存最多的代码行，只保留最新的 PROFILE_MAX_FILES 个。tracemalloc 开启期间整个进程的内存分配都会变慢，
+# 采样比例不宜过高。ADMIN_TOKEN 为 None 时关闭管理接口
+ADMIN_TOKEN = None
+PROFILE_STATE_FILE = 'cache/profiling.json'
+PROFILE_DIR = 'logs/profiles'
+PROFILE_SAMPLE_INTERVAL = 0.005
+PROFILE_DEFAULT_SECONDS = 600
+PROFILE_MAX_SECONDS = 3600
+PROFILE_MAX_FILES = 200
+
+# 日志：各日志记录器只把记录放入内存队列，由后台线程写入 logs 下的文件并按大小轮转，日志 I/O 不阻塞请求。
+# LOG_FORMAT 为 'json' 时每行一个 JSON，除时间、级别和消息外还包含 request_id、urlid、output_format、job_id（分布式作业）、
+# stage 和 duration_ms（各阶段耗时）等字段；为 'text' 时使用原来的文本格式。LOG_LEVEL（见文件开头）为 logging.DEBUG 时
+# 还会记录资源路径等调试信息
+LOG_FORMAT = 'json'
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 测试按应用的方式导入 util 和 templates，需要项目目录在导入路径中
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
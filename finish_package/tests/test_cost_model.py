@@ -0,0 +1,89 @@
+import random
+
+import pytest
+
+from util import cost_model
+from util.cost_model import FEATURE_NAMES, PRIOR_COEFFICIENTS, SAMPLE_DECAY, estimate_cost, feature_vector, \
+    fit_coefficients, new_statistics, record_cost, solve_linear_system, update_statistics
+
+
+def test_solve_linear_system():
+    matrix = [[2.0, 1.0, -1.0], [-3.0, -1.0, 2.0], [-2.0, 1.0, 2.0]]
+    assert solve_linear_system(matrix, [8.0, -11.0, -3.0]) == pytest.approx([2.0, 3.0, -1.0])
+
+
+def test_solve_linear_system_needs_pivoting():
+    # 第一列的第一个元素为 0，不交换行无法消元
+    assert solve_linear_system([[0.0, 1.0], [1.0, 0.0]], [2.0, 3.0]) == pytest.approx([3.0, 2.0])
+
+
+def test_solve_linear_system_singular():
+    assert solve_linear_system([[1.0, 2.0], [2.0, 4.0]], [1.0, 2.0]) is None
+
+
+def test_fit_without_samples_returns_prior():
+    prior = PRIOR_COEFFICIENTS['pdf']['cpu_seconds']
+    assert fit_coefficients(new_statistics(), 'cpu_seconds', prior) == prior
+
+
+def random_features(rng):
+    return {'size_kb': rng.uniform(1, 500), 'headings': rng.randint(0, 200), 'tables': rng.randint(0, 50),
+            'code_blocks': rng.randint(0, 50), 'images': rng.randint(0, 40), 'image_megapixels': rng.uniform(0, 100)}
+
+
+def test_fit_moves_from_prior_towards_measurements():
+    rng = random.Random(0)
+    truth = [2.0, 0.01, 0.02, 0.1, 0.05, 0.5, 0.2]
+    prior = PRIOR_COEFFICIENTS['pdf']['cpu_seconds']
+    statistics = new_statistics()
+    for _ in range(300):
+        vector = feature_vector(random_features(rng))
+        cpu_seconds = sum(w * x for w, x in zip(truth, vector))
+        update_statistics(statistics, vector, {'cpu_seconds': cpu_seconds, 'peak_memory_mb': 100.0})
+    coefficients = fit_coefficients(statistics, 'cpu_seconds', prior)
+    fitted_error = prior_error = 0.0
+    for _ in range(50):
+        vector = feature_vector(random_features(rng))
+        actual = sum(w * x for w, x in zip(truth, vector))
+        fitted_error += abs(sum(w * x for w, x in zip(coefficients, vector)) - actual) / actual
+        prior_error += abs(sum(w * x for w, x in zip(prior, vector)) - actual) / actual
+    # 先验仍以 PRIOR_WEIGHT 个样本的强度把系数拉向先验，拟合结果不会与真实值完全相同
+    assert fitted_error / 50 < 0.1
+    assert fitted_error < prior_error / 3
+
+
+def test_update_statistics_decays_old_samples():
+    statistics = new_statistics()
+    first = feature_vector({'size_kb': 10})
+    second = feature_vector({'size_kb': 20})
+    update_statistics(statistics, first, {'cpu_seconds': 1.0, 'peak_memory_mb': 50.0})
+    update_statistics(statistics, second, {'cpu_seconds': 3.0, 'peak_memory_mb': 70.0})
+    size = FEATURE_NAMES.index('size_kb')
+    assert statistics['count'] == pytest.approx(SAMPLE_DECAY + 1)
+    assert statistics['xtx'][size][size] == pytest.approx(SAMPLE_DECAY * 100 + 400)
+    assert statistics['xty']['cpu_seconds'][0] == pytest.approx(SAMPLE_DECAY * 1.0 + 3.0)
+    assert statistics['xty']['peak_memory_mb'][size] == pytest.approx(SAMPLE_DECAY * 500 + 1400)
+
+
+def test_estimate_uses_prior_and_minimum(tmp_path):
+    model_path = str(tmp_path / 'cost_model.sqlite3')
+    estimate = estimate_cost({}, 'html', model_path)
+    prior = PRIOR_COEFFICIENTS['html']
+    assert estimate == {'cpu_seconds': prior['cpu_seconds'][0], 'peak_memory_mb': prior['peak_memory_mb'][0]}
+    assert estimate_cost({'size_kb': -1e6}, 'html', model_path) == cost_model.MIN_ESTIMATE
+
+
+def test_record_cost_accumulates_samples_from_every_writer(tmp_path):
+    # 每次记录都基于数据库中的最新统计量，多个工作进程的样本不会互相覆盖
+    model_path = str(tmp_path / 'cost_model.sqlite3')
+    features = {'size_kb': 100, 'images': 2}
+    for _ in range(3):
+        record_cost(features, 'pdf', {'cpu_seconds': 30.0, 'peak_memory_mb': 400.0}, model_path)
+    connection = cost_model.connect_sqlite(model_path, cost_model.CREATE_TABLE_SQL)
+    try:
+        statistics = cost_model.load_statistics(connection, 'pdf')
+    finally:
+        connection.close()
+    assert statistics['count'] == pytest.approx(SAMPLE_DECAY ** 2 + SAMPLE_DECAY + 1)
+    prior_estimate = sum(w * x for w, x in zip(PRIOR_COEFFICIENTS['pdf']['cpu_seconds'], feature_vector(features)))
+    assert prior_estimate < estimate_cost(features, 'pdf', model_path)['cpu_seconds'] < 30.0
@@ -0,0 +1,15 @@
+import pytest
+
+from util.process_operations import ProcessLimitError, run_coroutine_sync, run_process
+
+
+def test_sigkill_without_cpu_use_is_ordinary_failure():
+    # 被 OOM killer 等终止的进程不应报告为超出 CPU 限制
+    result = run_coroutine_sync(run_process(['sh', '-c', 'kill -9 $$'], limits={'cpu_seconds': 60}))
+    assert result.returncode == -9
+
+
+def test_cpu_limit_is_reported():
+    with pytest.raises(ProcessLimitError) as error:
+        run_coroutine_sync(run_process(['sh', '-c', 'while :; do :; done'], limits={'cpu_seconds': 1}))
+    assert error.value.limit == 'cpu'
@@ -0,0 +1,65 @@
+import pytest
+
+from util import rate_limit
+from util.rate_limit import consume_tokens, prune_token_buckets, settle_tokens
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limit.time, 'time', lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / 'rate_limit.sqlite3')
+
+
+def test_new_bucket_starts_full(db_path, clock):
+    assert consume_tokens(db_path, 'a', 'convert_cpu', 10, rate=1, capacity=10) == 0
+    assert consume_tokens(db_path, 'a', 'convert_cpu', 1, rate=1, capacity=10) == pytest.approx(1.0)
+
+
+def test_tokens_refill_at_rate(db_path, clock):
+    consume_tokens(db_path, 'a', 'upload_bytes', 8, rate=2, capacity=10)
+    assert consume_tokens(db_path, 'a', 'upload_bytes', 6, rate=2, capacity=10) == pytest.approx(2.0)
+    clock[0] += 2
+    assert consume_tokens(db_path, 'a', 'upload_bytes', 6, rate=2, capacity=10) == 0
+
+
+def test_refill_is_capped_at_capacity(db_path, clock):
+    consume_tokens(db_path, 'a', 'b', 10, rate=1, capacity=10)
+    clock[0] += 1000
+    assert consume_tokens(db_path, 'a', 'b', 10, rate=1, capacity=10) == 0
+    assert consume_tokens(db_path, 'a', 'b', 1, rate=1, capacity=10) == pytest.approx(1.0)
+
+
+def test_request_larger_than_capacity_needs_full_bucket(db_path, clock):
+    consume_tokens(db_path, 'a', 'b', 1, rate=1, capacity=10)
+    assert consume_tokens(db_path, 'a', 'b', 50, rate=1, capacity=10) == pytest.approx(1.0)
+    clock[0] += 1
+    assert consume_tokens(db_path, 'a', 'b', 50, rate=1, capacity=10) == 0
+    # 超出容量的部分记为欠费，需要等令牌补回
+    assert consume_tokens(db_path, 'a', 'b', 1, rate=1, capacity=10) == pytest.approx(41.0)
+
+
+def test_settle_refunds_and_charges(db_path, clock):
+    consume_tokens(db_path, 'a', 'b', 10, rate=1, capacity=10)
+    settle_tokens(db_path, 'a', 'b', 4, rate=1, capacity=10)
+    assert consume_tokens(db_path, 'a', 'b', 4, rate=1, capacity=10) == 0
+    settle_tokens(db_path, 'a', 'b', -3, rate=1, capacity=10)
+    assert consume_tokens(db_path, 'a', 'b', 1, rate=1, capacity=10) == pytest.approx(4.0)
+
+
+def test_clients_and_buckets_are_independent(db_path, clock):
+    consume_tokens(db_path, 'a', 'b', 10, rate=1, capacity=10)
+    assert consume_tokens(db_path, 'c', 'b', 10, rate=1, capacity=10) == 0
+    assert consume_tokens(db_path, 'a', 'other', 10, rate=1, capacity=10) == 0
+
+
+def test_prune_removes_idle_buckets(db_path, clock):
+    consume_tokens(db_path, 'a', 'b', 5, rate=1, capacity=10)
+    clock[0] += 100
+    consume_tokens(db_path, 'c', 'b', 5, rate=1, capacity=10)
+    assert prune_token_buckets(db_path, 50) == 1
@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+from util import job_operations
+from util.job_operations import acquire_conversion_slot, release_conversion_slot
+
+
+@pytest.fixture(autouse=True)
+def scheduler(monkeypatch):
+    monkeypatch.setattr(job_operations, 'CONVERSION_WORKERS', 1)
+    monkeypatch.setattr(job_operations, 'AGING_RATE', 0.0)
+    monkeypatch.setattr(job_operations, '_client_queues', {})
+    monkeypatch.setattr(job_operations, '_client_finish', {})
+    monkeypatch.setattr(job_operations, '_running_slots', 0)
+    monkeypatch.setattr(job_operations, '_virtual_time', 0.0)
+
+
+def run_order(running, waiting):
+    """
+    一个槽位被 running 占用时，waiting 中的作业依次入队，之后每个作业运行完立即释放槽位。
+
+    返回:
+        list: 作业名按开始运行的顺序排列。
+    """
+    async def main():
+        order = []
+
+        async def job(name, estimate, client, weight):
+            await acquire_conversion_slot(estimate, client, weight)
+            order.append(name)
+
+        await acquire_conversion_slot(*running)
+        tasks = [asyncio.ensure_future(job(*arguments)) for arguments in waiting]
+        await asyncio.sleep(0)  # 所有作业入队
+        for _ in waiting:
+            release_conversion_slot()
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        release_conversion_slot()
+        return order
+
+    return asyncio.run(main())
+
+
+def test_shortest_job_first_within_client():
+    order = run_order((1, 'a', 1.0), [('long', 10, 'a', 1.0), ('short', 1, 'a', 1.0), ('medium', 5, 'a', 1.0)])
+    assert order == ['short', 'medium', 'long']
+
+
+def test_fair_share_between_clients():
+    # a 已经运行了一个作业，b 的作业排在 a 的长作业之前；权重为 2 的 c 的作业只占一半的虚拟时间
+    order = run_order((1, 'a', 1.0), [('a-10', 10, 'a', 1.0), ('a-1', 1, 'a', 1.0), ('a-5', 5, 'a', 1.0),
+                                      ('b-3', 3, 'b', 1.0), ('c-4', 4, 'c', 2.0)])
+    assert order == ['a-1', 'c-4', 'b-3', 'a-5', 'a-10']
+
+
+def test_heavy_client_does_not_starve_others():
+    waiting = [(f'a{i}', 1, 'a', 1.0) for i in range(5)] + [('b0', 1, 'b', 1.0)]
+    order = run_order((1, 'a', 1.0), waiting)
+    assert order.index('b0') <= 1
+
+
+def test_free_slot_is_taken_immediately():
+    async def main():
+        await asyncio.wait_for(acquire_conversion_slot(100, 'a', 1.0), timeout=1)
+        release_conversion_slot()
+        return job_operations._running_slots
+
+    assert asyncio.run(main()) == 0
@@ -0,0 +1,173 @@
+import gzip
+import os
+import re
+import tempfile
+
+try:
+    import brotli
+except ImportError:  # 未安装 Brotli 时只生成 .gz 文件
+    brotli = None
+
+
+# 内容中的空白有意义、不能压缩的元素
+PRESERVED_HTML_PATTERN = re.compile(r'(<(pre|textarea|script|style)\b[^>]*>.*?</\2\s*>)', re.IGNORECASE | re.DOTALL)
+HTML_COMMENT_PATTERN = re.compile(r'<!--(?!\[if).*?-->', re.DOTALL)
+CSS_STRING_PATTERN = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')')
+
+# 小于该大小的文件压缩收益很小，不生成预压缩文件
+PRECOMPRESS_MIN_SIZE = 1024
+
+# 支持的预压缩编码及其文件后缀，按优先级排列
+PRECOMPRESSED_ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def minify_css(css):
+    """
+    压缩CSS文本：去除注释和多余空白。
+
+    参数:
+        css (str): CSS文本。
+
+    返回:
+        str: 压缩后的CSS文本。
+    """
+    parts = CSS_STRING_PATTERN.split(re.sub(r'/\*.*?\*/', '', css, flags=re.DOTALL))
+    for index in range(0, len(parts), 2):
+        # 偶数下标为字符串常量以外的部分
+        part = re.sub(r'\s+', ' ', parts[index])
+        part = re.sub(r'\s*([{};:,>])\s*', r'\1', part)
+        parts[index] = part.replace(';}', '}')
+    return ''.join(parts).strip()
+
+
+def minify_html(html):
+    """
+    压缩HTML文本：去除注释，将连续空白合并为一个空格。
+
+    <pre>、<textarea>、<script> 中的内容保持不变，<style> 中的内容按CSS压缩。
+
+    参数:
+        html (str): HTML文本。
+
+    返回:
+        str: 压缩后的HTML文本。
+    """
+    parts = PRESERVED_HTML_PATTERN.split(html)
+    result = []
+    # split 的结果依次为：普通内容、保留元素、保留元素的标签名
+    for index in range(0, len(parts), 3):
+        text = re.sub(r'\s+', ' ', HTML_COMMENT_PATTERN.sub('', parts[index]))
+        result.append(text if index else text.lstrip())
+        if index + 1 < len(parts):
+            element, tag = parts[index + 1], parts[index + 2].lower()
+            if tag == 'style':
+                open_end = element.index('>') + 1
+                close_start = element.lower().rindex('</style')
+                element = element[:open_end] + minify_css(element[open_end:close_start]) + element[close_start:]
+            result.append(element)
+    return ''.join(result)
+
+
+def minify_file(file_path, minify_function):
+    """
+    原地压缩文本文件。
+
+    参数:
+        file_path (str): 文件路径。
+        minify_function (callable): 压缩函数，如 minify_html、minify_css。
+    """
+    with open(file_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    with open(file_path, 'w', encoding='utf-8') as f:
+        f.write(minify_function(content))
+
+
+def write_atomic(target_path, data):
+    """
+    先写入临时文件再原子替换，避免并发请求读到半成品。
+
+    参数:
+        target_path (str): 目标文件路径。
+        data (bytes): 文件内容。
+    """
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(target_path) or '.')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.chmod(temp_path, 0o644)
+    os.replace(temp_path, target_path)
+
+
+def precompress_file(file_path):
+    """
+    生成文件的 .gz 和 .br 预压缩版本，下载时按 Accept-Encoding 直接发送。
+
+    压缩后没有变小的版本不会保留。
+
+    参数:
+        file_path (str): 文件路径。
+    """
+    with open(file_path, 'rb') as f:
+        data = f.read()
+
+    compressors = {'.gz': lambda content: gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        compressors['.br'] = lambda content: brotli.compress(content, quality=11)
+
+    for suffix, compress in compressors.items():
+        compressed_path = file_path + suffix
+        compressed = compress(data) if len(data) >= PRECOMPRESS_MIN_SIZE else None
+        if compressed is not None and len(compressed) < len(data):
+            write_atomic(compressed_path, compressed)
+        elif os.path.exists(compressed_path):
+            os.remove(compressed_path)
+
+
+def parse_accept_encoding(accept_encoding):
+    """
+    解析 Accept-Encoding 请求头。
+
+    参数:
+        accept_encoding (str): 请求头内容。
+
+    返回:
+        dict: 编码名称到 q 值的映射。
+    """
+    encodings = {}
+    for item in (accept_encoding or '').split(','):
+        name, _, params = item.strip().partition(';')
+        if not name:
+            continue
+        quality = 1.0
+        match = re.search(r'q\s*=\s*([0-9.]+)', params)
+        if match:
+            try:
+                quality = float(match.group(1))
+            except ValueError:
+                quality = 0.0
+        encodings[name.strip().lower()] = quality
+    return encodings
+
+
+def choose_precompressed(file_path, accept_encoding):
+    """
+    根据 Accept-Encoding 选择可直接发送的预压缩文件。
+
+    只使用不比原文件旧的预压缩文件，避免原文件重新生成后发送过期内容。
+
+    参数:
+        file_path (str): 原文件路径。
+        accept_encoding (str): Accept-Encoding 请求头内容。
+
+    返回:
+        tuple: (要发送的文件路径, Content-Encoding)；没有合适的预压缩文件时编码为 None。
+    """
+    accepted = parse_accept_encoding(accept_encoding)
+    original_mtime = os.path.getmtime(file_path)
+    for encoding, suffix in PRECOMPRESSED_ENCODINGS:
+        quality = accepted.get(encoding, accepted.get('*', 0.0))
+        if quality <= 0:
+            continue
+        compressed_path = file_path + suffix
+        if os.path.exists(compressed_path) and os.path.getmtime(compressed_path) >= original_mtime:
+            return compressed_path, encoding
+    return file_path, None
@@ -1,6 +1,6 @@
-import logging
-
-LOG_LEVEL = logging.INFO
-HOST = '0.0.0.0'
-PORT = 8888
-DEBUG = True
+import logging
+
+LOG_LEVEL = logging.INFO
+HOST = '0.0.0.0'
+PORT = 8888
+DEBUG = True
@@ -0,0 +1,318 @@
+import json
+import logging
+import os
+import re
+import threading
+from util.image_operations import find_image_references, resolve_image_path
+from util.utils import connect_sqlite
+
+try:
+    from PIL import Image
+except ImportError:  # 未安装 Pillow 时不统计图片像素
+    Image = None
+
+
+logger = logging.getLogger(__name__)
+
+# 特征名称，与模型系数一一对应，第一项为常数项
+FEATURE_NAMES = ('bias', 'size_kb', 'headings', 'tables', 'code_blocks', 'images', 'image_megapixels')
+
+# 预测目标：转换所有子进程的 CPU 秒数之和、单个子进程的峰值常驻内存（MB）
+TARGETS = ('cpu_seconds', 'peak_memory_mb')
+
+# 没有实测数据时使用的先验系数，按输出格式和预测目标配置，顺序与 FEATURE_NAMES 一致
+PRIOR_COEFFICIENTS = {
+    'pdf': {
+        'cpu_seconds': [6.0, 0.03, 0.01, 0.05, 0.02, 0.2, 0.3],
+        'peak_memory_mb': [250.0, 0.3, 0.0, 0.5, 0.1, 2.0, 15.0],
+    },
+    'html': {
+        'cpu_seconds': [0.5, 0.005, 0.001, 0.005, 0.005, 0.01, 0.05],
+        'peak_memory_mb': [80.0, 0.2, 0.0, 0.1, 0.05, 0.5, 4.0],
+    },
+    'docx': {
+        'cpu_seconds': [1.0, 0.01, 0.002, 0.01, 0.005, 0.05, 0.1],
+        'peak_memory_mb': [100.0, 0.3, 0.0, 0.2, 0.05, 1.0, 8.0],
+    },
+}
+
+# 先验相当于的样本数，实测样本越多先验的影响越小
+PRIOR_WEIGHT = 5.0
+
+# 每加入一个新样本，旧样本的权重乘以该系数，使模型跟随环境变化（约最近 50 个样本起主要作用）
+SAMPLE_DECAY = 0.98
+
+# 预测值的下限
+MIN_ESTIMATE = {'cpu_seconds': 0.1, 'peak_memory_mb': 10.0}
+
+HEADING_PATTERN = re.compile(r'^#{1,6}\s')
+TABLE_SEPARATOR_PATTERN = re.compile(r'^\s*\|?\s*:?-{3,}:?\s*(\|\s*:?-{3,}:?\s*)+\|?\s*$')
+CODE_FENCE_PATTERN = re.compile(r'^\s*(```|~~~)')
+
+# 模型表：每个输出格式一行，statistics 为 JSON 格式的回归统计量，多个工作进程共享并各自累加实测样本
+CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS cost_model (
+    output_format TEXT PRIMARY KEY,
+    features TEXT NOT NULL,
+    statistics TEXT NOT NULL
+)
+"""
+
+
+def extract_document_features(md_file, resource_paths):
+    """
+    提取预测转换成本所需的文档特征：Markdown 大小、标题数、表格数、代码块数、图片数和图片总像素。
+
+    代码块中的内容不计入标题和表格。图片像素只读取图片头部，不解码图片数据。
+
+    参数:
+        md_file (str): Markdown 文件路径。
+        resource_paths (list): 资源文件路径列表，用于查找图片。
+
+    返回:
+        dict: 特征名称到数值的映射（不含常数项）。
+    """
+    features = {'size_kb': os.path.getsize(md_file) / 1024, 'headings': 0, 'tables': 0, 'code_blocks': 0,
+                'images': 0, 'image_megapixels': 0.0}
+    with open(md_file, 'r', encoding='utf-8', errors='replace') as f:
+        md_text = f.read()
+
+    in_code_block = False
+    for line in md_text.splitlines():
+        if CODE_FENCE_PATTERN.match(line):
+            if not in_code_block:
+                features['code_blocks'] += 1
+            in_code_block = not in_code_block
+        elif in_code_block:
+            continue
+        elif HEADING_PATTERN.match(line):
+            features['headings'] += 1
+        elif '|' in line and TABLE_SEPARATOR_PATTERN.match(line):
+            features['tables'] += 1
+
+    for reference in find_image_references(md_text):
+        image_path = resolve_image_path(reference, resource_paths)
+        if image_path is None:
+            continue
+        features['images'] += 1
+        if Image is None:
+            continue
+        try:
+            with Image.open(image_path) as image:
+                features['image_megapixels'] += image.width * image.height / 1e6
+        except (OSError, ValueError):
+            pass  # SVG 等 Pillow 无法打开的格式只计数
+    return features
+
+
+def get_document_features(md_file, resource_paths, cache_path):
+    """
+    获取文档特征，结果缓存在 cache_path 中，Markdown 文件变化后重新提取。
+
+    参数:
+        md_file (str): Markdown 文件路径。
+        resource_paths (list): 资源文件路径列表。
+        cache_path (str): 特征缓存文件路径。
+
+    返回:
+        dict: 文档特征。
+    """
+    stat = os.stat(md_file)
+    signature = f"{stat.st_mtime_ns} {stat.st_size}"
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        if cached.get('signature') == signature:
+            return cached['features']
+    except (OSError, ValueError, KeyError):
+        pass
+
+    features = extract_document_features(md_file, resource_paths)
+    write_json_atomic(cache_path, {'signature': signature, 'features': features})
+    return features
+
+
+def write_json_atomic(path, data):
+    """
+    先写入临时文件再原子替换，写入失败时忽略。
+
+    参数:
+        path (str): 文件路径。
+        data: 可序列化为 JSON 的数据。
+    """
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(temp_path, path)
+    except OSError as e:
+        logger.error(f"Failed to write {path}: {e}")
+
+
+def feature_vector(features):
+    """
+    返回:
+        list: 按 FEATURE_NAMES 顺序排列的特征值，第一项为常数 1。
+    """
+    return [1.0] + [float(features.get(name, 0)) for name in FEATURE_NAMES[1:]]
+
+
+def new_statistics():
+    """
+    返回:
+        dict: 空的回归统计量：样本权重之和、X^T X 和每个目标的 X^T y。
+    """
+    size = len(FEATURE_NAMES)
+    return {
+        'count': 0.0,
+        'xtx': [[0.0] * size for _ in range(size)],
+        'xty': {target: [0.0] * size for target in TARGETS},
+    }
+
+
+def load_statistics(connection, output_format):
+    """
+    读取输出格式的回归统计量。特征与 FEATURE_NAMES 不一致（特征有变化）或数据已损坏时从先验开始。
+
+    参数:
+        connection (sqlite3.Connection): 模型数据库的连接。
+        output_format (str): 输出格式。
+
+    返回:
+        dict: 回归统计量。
+    """
+    row = connection.execute('SELECT features, statistics FROM cost_model WHERE output_format = ?',
+                             (output_format,)).fetchone()
+    if row is None:
+        return new_statistics()
+    try:
+        if json.loads(row[0]) == list(FEATURE_NAMES):
+            return json.loads(row[1])
+    except ValueError:
+        pass
+    return new_statistics()
+
+
+def update_statistics(statistics, vector, usage):
+    """
+    将一个样本加入回归统计量，旧样本的权重先乘以 SAMPLE_DECAY。
+
+    参数:
+        statistics (dict): 回归统计量，原地更新。
+        vector (list): feature_vector 返回的特征向量。
+        usage (dict): 实测的资源使用，包含 TARGETS 中的各项。
+    """
+    statistics['count'] = statistics['count'] * SAMPLE_DECAY + 1
+    for i, row in enumerate(statistics['xtx']):
+        for j in range(len(row)):
+            row[j] = row[j] * SAMPLE_DECAY + vector[i] * vector[j]
+    for target in TARGETS:
+        xty = statistics['xty'][target]
+        for i in range(len(xty)):
+            xty[i] = xty[i] * SAMPLE_DECAY + vector[i] * usage[target]
+
+
+def solve_linear_system(matrix, vector):
+    """
+    用列主元高斯消元法求解线性方程组。
+
+    参数:
+        matrix (list): 系数矩阵。
+        vector (list): 右端向量。
+
+    返回:
+        list: 方程组的解；矩阵奇异时返回 None。
+    """
+    size = len(vector)
+    rows = [list(matrix[i]) + [vector[i]] for i in range(size)]
+    for column in range(size):
+        pivot = max(range(column, size), key=lambda row: abs(rows[row][column]))
+        if abs(rows[pivot][column]) < 1e-12:
+            return None
+        rows[column], rows[pivot] = rows[pivot], rows[column]
+        for row in range(column + 1, size):
+            factor = rows[row][column] / rows[column][column]
+            for index in range(column, size + 1):
+                rows[row][index] -= factor * rows[column][index]
+    solution = [0.0] * size
+    for row in reversed(range(size)):
+        remainder = rows[row][size] - sum(rows[row][index] * solution[index] for index in range(row + 1, size))
+        solution[row] = remainder / rows[row][row]
+    return solution
+
+
+def fit_coefficients(statistics, target, prior):
+    """
+    以先验系数为中心做岭回归：最小化 Σ(y - w·x)² + Σ λ_j (w_j - prior_j)²。
+
+    λ_j 为 PRIOR_WEIGHT 乘以特征 j 的平方均值，使先验的强度与特征的量纲无关。
+
+    参数:
+        statistics (dict): 回归统计量。
+        target (str): 预测目标。
+        prior (list): 先验系数。
+
+    返回:
+        list: 模型系数。
+    """
+    count = statistics['count']
+    if count <= 0:
+        return prior
+    matrix = [row[:] for row in statistics['xtx']]
+    vector = statistics['xty'][target][:]
+    for index in range(len(prior)):
+        strength = PRIOR_WEIGHT * max(matrix[index][index] / count, 1e-6)
+        matrix[index][index] += strength
+        vector[index] += strength * prior[index]
+    return solve_linear_system(matrix, vector) or prior
+
+
+def estimate_cost(features, output_format, model_path):
+    """
+    预测转换的 CPU 时间和峰值内存。
+
+    参数:
+        features (dict): 文档特征。
+        output_format (str): 输出格式（pdf、html、docx）。
+        model_path (str): 模型数据库文件路径。
+
+    返回:
+        dict: cpu_seconds（预计 CPU 秒数）和 peak_memory_mb（预计峰值内存，MB）。
+    """
+    vector = feature_vector(features)
+    connection = connect_sqlite(model_path, CREATE_TABLE_SQL)
+    try:
+        statistics = load_statistics(connection, output_format)
+    finally:
+        connection.close()
+    estimate = {}
+    for target in TARGETS:
+        coefficients = fit_coefficients(statistics, target, PRIOR_COEFFICIENTS[output_format][target])
+        value = sum(weight * x for weight, x in zip(coefficients, vector))
+        estimate[target] = round(max(value, MIN_ESTIMATE[target]), 2)
+    return estimate
+
+
+def record_cost(features, output_format, usage, model_path):
+    """
+    用一次转换实测的资源使用更新模型。在一个写事务中读取、更新和写回统计量，
+    多个工作进程的样本都计入同一个模型。
+
+    参数:
+        features (dict): 文档特征。
+        output_format (str): 输出格式。
+        usage (dict): 实测的资源使用，包含 cpu_seconds 和 peak_memory_mb。
+        model_path (str): 模型数据库文件路径。
+    """
+    vector = feature_vector(features)
+    connection = connect_sqlite(model_path, CREATE_TABLE_SQL)
+    try:
+        connection.execute('BEGIN IMMEDIATE')  # 立即取得写锁，避免两个进程基于同一份统计量更新而丢失样本
+        statistics = load_statistics(connection, output_format)
+        update_statistics(statistics, vector, usage)
+        connection.execute('INSERT OR REPLACE INTO cost_model (output_format, features, statistics) VALUES (?, ?, ?)',
+                           (output_format, json.dumps(list(FEATURE_NAMES)), json.dumps(statistics)))
+        connection.execute('COMMIT')
+    finally:
+        connection.close()
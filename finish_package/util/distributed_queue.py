@@ -0,0 +1,249 @@
+import json
+import time
+import uuid
+
+try:
+    import redis
+except ImportError:  # 未安装 redis 时不能启用分布式模式
+    redis = None
+
+
+# 共享队列使用的 Redis 连接和键前缀，由 configure_queue 设置
+_redis = None
+KEY_PREFIX = 'md2doc:'
+
+# 作业的最长存活时间（秒）：排队加运行超过该时间的作业视为丢失
+JOB_TTL = 900
+
+# 结果的保留时间（秒），在此期间相同的转换请求直接使用结果
+RESULT_TTL = 24 * 3600
+
+# 工作节点的租约时间（秒）：节点每秒续约，租约过期的作业由其他节点重新排队
+LEASE_SECONDS = 30
+
+# 取消广播的保留时间（秒）
+CANCEL_TTL = 3600
+
+# 等待结果时每次阻塞的最长时间（秒），超时后检查作业是否已丢失
+WAIT_POLL_SECONDS = 5
+
+
+def configure_queue(redis_url, key_prefix='md2doc:', job_ttl=900, result_ttl=24 * 3600):
+    """
+    连接共享作业队列所在的 Redis（或兼容 Redis 协议的服务器，如 util/mini_redis.py）。
+
+    参数:
+        redis_url (str): Redis 地址，如 'redis://127.0.0.1:6379/0'。
+        key_prefix (str): 所有键的前缀，多套部署共用一个 Redis 时区分各自的键。
+        job_ttl (float): 作业的最长存活时间（秒）。
+        result_ttl (float): 结果的保留时间（秒）。
+
+    异常:
+        RuntimeError: 未安装 redis 包。
+    """
+    global _redis, KEY_PREFIX, JOB_TTL, RESULT_TTL
+    if redis is None:
+        raise RuntimeError("DISTRIBUTED_MODE requires the redis package (pip install redis)")
+    _redis = redis.Redis.from_url(redis_url, decode_responses=True, health_check_interval=30)
+    KEY_PREFIX = key_prefix
+    JOB_TTL = int(job_ttl)
+    RESULT_TTL = int(result_ttl)
+
+
+def queue_key(*parts):
+    """
+    返回:
+        str: 加上前缀的键名，如 queue_key('claim', job_id) -> 'md2doc:claim:<job_id>'。
+    """
+    return KEY_PREFIX + ':'.join(parts)
+
+
+def submit_job(job_id, payload, priority, supersede_key=None):
+    """
+    提交转换作业。作业 ID 相同（转换键相同）的作业正在排队、运行或已有结果时不再重复提交，直接等待同一个结果。
+
+    参数:
+        job_id (str): 作业 ID，即转换键摘要。
+        payload (dict): 作业内容，必须包含 urlid，工作节点据此重新生成转换计划。
+        priority (float): 排队优先级，数值越小越先运行。
+        supersede_key (str): 取代键（如 'urlid:输出格式'）；指定时同一取代键下较早提交的其他作业会被取消。
+
+    返回:
+        bool: 是否提交了新作业；为 False 时已有相同的作业。
+    """
+    if supersede_key is not None:
+        _redis.set(queue_key('latest', supersede_key), job_id, ex=JOB_TTL)
+    token = uuid.uuid4().hex
+    if not _redis.set(queue_key('claim', job_id), token, nx=True, ex=JOB_TTL):
+        return False
+    payload = dict(payload, job_id=job_id, token=token, priority=priority, supersede_key=supersede_key,
+                   submitted_at=time.time())
+    urlid_jobs = queue_key('urlid_jobs', payload['urlid'])
+    pipeline = _redis.pipeline(transaction=False)
+    pipeline.delete(queue_key('result', job_id))  # 清除上一次失败或被取消的结果
+    pipeline.set(queue_key('job', job_id), json.dumps(payload), ex=JOB_TTL)
+    pipeline.sadd(urlid_jobs, job_id)
+    pipeline.expire(urlid_jobs, RESULT_TTL)
+    pipeline.zadd(queue_key('queue'), {job_id: priority})
+    pipeline.execute()
+    return True
+
+
+def wait_for_result(job_id, timeout):
+    """
+    等待作业的结果。结果保存在只有一个元素的列表中，用 BRPOPLPUSH 把它弹出再压回同一个列表，
+    相当于阻塞地读取，多个等待方都能读到。
+
+    参数:
+        job_id (str): 作业 ID。
+        timeout (float): 最长等待时间（秒）。
+
+    返回:
+        dict: 工作节点写入的结果，包含 status（done、failed、cancelled、limit）；超时时返回 None。
+    """
+    deadline = time.monotonic() + timeout
+    result_key = queue_key('result', job_id)
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        result = _redis.brpoplpush(result_key, result_key, max(1, int(min(remaining, WAIT_POLL_SECONDS))))
+        if result is not None:
+            return json.loads(result)
+        if not _redis.exists(queue_key('claim', job_id), result_key):
+            # 作业已过期（如工作节点在写入结果前崩溃且未被重新排队）
+            return None
+
+
+def cancel_jobs(urlid):
+    """
+    取消 urlid 的所有作业：广播取消时间，工作节点在 1 秒内终止在此之前提交的作业；
+    同时撤销这些作业，等待方立即得到取消结果，之后相同的转换请求会重新提交。
+
+    参数:
+        urlid (str): 上传文件的唯一标识符。
+
+    返回:
+        int: 撤销的作业数。
+    """
+    urlid_jobs = queue_key('urlid_jobs', urlid)
+    job_ids = _redis.smembers(urlid_jobs)
+    pipeline = _redis.pipeline(transaction=False)
+    pipeline.set(queue_key('cancel', urlid), repr(time.time()), ex=CANCEL_TTL)
+    for job_id in job_ids:
+        # 写入取消结果，立即唤醒等待方
+        result_key = queue_key('result', job_id)
+        pipeline.delete(queue_key('claim', job_id), result_key)
+        pipeline.rpush(result_key, json.dumps({'status': 'cancelled'}))
+        pipeline.expire(result_key, JOB_TTL)
+    pipeline.delete(urlid_jobs)
+    pipeline.execute()
+    return len(job_ids)
+
+
+def pop_job(timeout):
+    """
+    取出优先级最高的作业，登记为本节点正在运行并取得租约。
+
+    参数:
+        timeout (int): 队列为空时最长等待时间（秒）。
+
+    返回:
+        dict: 作业内容；队列为空或作业已过期时返回 None。
+    """
+    item = _redis.bzpopmin(queue_key('queue'), timeout)
+    if item is None:
+        return None
+    job_id = item[1]
+    payload = _redis.get(queue_key('job', job_id))
+    if payload is None:
+        return None
+    pipeline = _redis.pipeline(transaction=False)
+    pipeline.hset(queue_key('running'), job_id, payload)
+    pipeline.set(queue_key('lease', job_id), '1', ex=LEASE_SECONDS)
+    pipeline.execute()
+    return json.loads(payload)
+
+
+def get_cancelled_jobs(payloads):
+    """
+    续约本节点正在运行的作业，并找出其中已被取消的作业：urlid 在作业提交之后广播了取消、
+    同一取代键下有更新的作业，或作业已被撤销。
+
+    参数:
+        payloads (list): 正在运行的作业内容。
+
+    返回:
+        list: 已被取消的作业 ID。
+    """
+    if not payloads:
+        return []
+    pipeline = _redis.pipeline(transaction=False)
+    for payload in payloads:
+        job_id = payload['job_id']
+        pipeline.set(queue_key('lease', job_id), '1', ex=LEASE_SECONDS)
+        pipeline.get(queue_key('cancel', payload['urlid']))
+        pipeline.get(queue_key('latest', payload['supersede_key'] or ''))
+        pipeline.get(queue_key('claim', job_id))
+    replies = pipeline.execute()
+    cancelled = []
+    for index, payload in enumerate(payloads):
+        _, cancelled_at, latest, claim = replies[index * 4:index * 4 + 4]
+        if (cancelled_at is not None and float(cancelled_at) >= payload['submitted_at']) or \
+                (payload['supersede_key'] and latest is not None and latest != payload['job_id']) or \
+                claim != payload['token']:
+            cancelled.append(payload['job_id'])
+    return cancelled
+
+
+def finish_job(payload, result):
+    """
+    写入作业结果并结束租约。作业已被撤销或重新提交时不写入结果，避免覆盖新作业的结果。
+
+    成功的结果保留 RESULT_TTL 秒，期间相同的转换请求直接使用；失败或被取消时释放作业 ID，之后可以重新提交。
+
+    参数:
+        payload (dict): 作业内容。
+        result (dict): 结果，包含 status。
+    """
+    job_id = payload['job_id']
+    claim_key = queue_key('claim', job_id)
+    if _redis.get(claim_key) == payload['token']:
+        result_key = queue_key('result', job_id)
+        pipeline = _redis.pipeline(transaction=False)
+        pipeline.delete(result_key)
+        pipeline.rpush(result_key, json.dumps(result))
+        pipeline.expire(result_key, RESULT_TTL)
+        if result['status'] == 'done':
+            pipeline.expire(claim_key, RESULT_TTL)
+        else:
+            pipeline.delete(claim_key)
+        pipeline.execute()
+    pipeline = _redis.pipeline(transaction=False)
+    pipeline.hdel(queue_key('running'), job_id)
+    pipeline.delete(queue_key('lease', job_id), queue_key('job', job_id))
+    pipeline.execute()
+
+
+def requeue_stale_jobs():
+    """
+    将租约已过期（工作节点崩溃或断网）的作业重新排队，由任意节点调用，每个作业只会被一个节点重新排队。
+
+    返回:
+        int: 重新排队的作业数。
+    """
+    requeued = 0
+    for job_id, payload in _redis.hgetall(queue_key('running')).items():
+        if _redis.exists(queue_key('lease', job_id)):
+            continue
+        if not _redis.hdel(queue_key('running'), job_id):
+            continue  # 已被其他节点重新排队或已完成
+        payload = json.loads(payload)
+        if _redis.get(queue_key('claim', job_id)) != payload['token']:
+            continue  # 已被撤销，不再运行
+        pipeline = _redis.pipeline(transaction=False)
+        pipeline.set(queue_key('job', job_id), json.dumps(payload), ex=JOB_TTL)
+        pipeline.zadd(queue_key('queue'), {job_id: payload['priority']})
+        pipeline.execute()
+        requeued += 1
+    return requeued
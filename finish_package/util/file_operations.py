@@ -1,73 +1,120 @@
-import os
-import zipfile
-import shutil
-
-
-def check_and_extract_archive(zip_path, extract_to):
-    """
-    解压并检查ZIP文件内容是否包含.md文件。
-
-    参数:
-        zip_path (str): ZIP文件的路径。
-        extract_to (str): 解压文件的目标目录。
-
-    返回:
-        bool: 如果ZIP文件包含至少一个.md文件，则返回True；否则返回False。
-    """
-    clear_directory(extract_to)
-    os.makedirs(extract_to, exist_ok=True)
-    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-        extracted_contents = zip_ref.namelist()
-        has_md_file = any(name.endswith('.md') for name in extracted_contents)
-        if has_md_file:
-            zip_ref.extractall(extract_to)
-        return has_md_file
-
-
-def get_subdirs(directory):
-    '''
-    获取指定目录下的所有子目录名称。
-
-    参数:
-    directory (str): 目录路径。
-
-    返回:
-    list: 子目录名称列表。
-    '''
-    return [name for name in os.listdir(directory) if os.path.isdir(os.path.join(directory, name))]
-
-
-# 获取指定目录下的所有子目录路径。
-def get_all_subdirs(directory):
-    """
-    获取指定目录下的所有子目录路径。
-
-    参数:
-        directory (str): 要搜索的目录路径。
-
-    返回:
-        list: 目录下所有子目录的路径列表。
-    """
-    subdirs = []  # 用于存储子目录路径的列表
-    for root, dirs, _ in os.walk(directory):
-        # 遍历当前目录中的所有子目录
-        for dir in dirs:
-            subdir_path = os.path.join(root, dir)  # 获取子目录的完整路径
-            if os.path.exists(subdir_path):  # 检查子目录是否存在
-                subdirs.append(subdir_path)  # 将子目录路径添加到列表中
-    return subdirs  # 返回子目录路径列表
-
-
-def clear_directory(directory_path):
-    """
-    清空指定目录的所有内容。
-    """
-    for filename in os.listdir(directory_path):
-        file_path = os.path.join(directory_path, filename)
-        try:
-            if os.path.isfile(file_path) or os.path.islink(file_path):
-                os.unlink(file_path)
-            elif os.path.isdir(file_path):
-                shutil.rmtree(file_path)
-        except Exception as e:
-            print(f'Failed to delete {file_path}. Reason: {e}')
+import logging
+import os
+import zipfile
+import shutil
+import tempfile
+from util.utils import compute_file_hash, touch_access_time
+
+
+logger = logging.getLogger(__name__)
+
+
+def check_and_extract_archive(zip_path, extract_to):
+    """
+    解压并检查ZIP文件内容是否包含.md文件。
+
+    参数:
+        zip_path (str): ZIP文件的路径。
+        extract_to (str): 解压文件的目标目录。
+
+    返回:
+        bool: 如果ZIP文件包含至少一个.md文件，则返回True；否则返回False。
+    """
+    clear_directory(extract_to)
+    os.makedirs(extract_to, exist_ok=True)
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        extracted_contents = zip_ref.namelist()
+        has_md_file = any(name.endswith('.md') for name in extracted_contents)
+        if has_md_file:
+            zip_ref.extractall(extract_to)
+        return has_md_file
+
+
+def get_subdirs(directory):
+    '''
+    获取指定目录下的所有子目录名称。
+
+    参数:
+    directory (str): 目录路径。
+
+    返回:
+    list: 子目录名称列表。
+    '''
+    return [name for name in os.listdir(directory) if os.path.isdir(os.path.join(directory, name))]
+
+
+# 获取指定目录下的所有子目录路径。
+def get_all_subdirs(directory):
+    """
+    获取指定目录下的所有子目录路径。
+
+    参数:
+        directory (str): 要搜索的目录路径。
+
+    返回:
+        list: 目录下所有子目录的路径列表。
+    """
+    subdirs = []  # 用于存储子目录路径的列表
+    for root, dirs, _ in os.walk(directory):
+        # 遍历当前目录中的所有子目录
+        for dir in dirs:
+            subdir_path = os.path.join(root, dir)  # 获取子目录的完整路径
+            if os.path.exists(subdir_path):  # 检查子目录是否存在
+                subdirs.append(subdir_path)  # 将子目录路径添加到列表中
+    return subdirs  # 返回子目录路径列表
+
+
+def clear_directory(directory_path):
+    """
+    清空指定目录的所有内容。
+    """
+    for filename in os.listdir(directory_path):
+        file_path = os.path.join(directory_path, filename)
+        try:
+            if os.path.isfile(file_path) or os.path.islink(file_path):
+                os.unlink(file_path)
+            elif os.path.isdir(file_path):
+                shutil.rmtree(file_path)
+        except Exception as e:
+            logger.error(f'Failed to delete {file_path}. Reason: {e}')
+
+
+def store_content_addressed(source_path, store_dir):
+    """
+    将文件按内容哈希存入共享资源目录，同一内容只保存一份。
+
+    参数:
+        source_path (str): 源文件路径。
+        store_dir (str): 资源目录。
+
+    返回:
+        str: 资源名称（内容哈希加扩展名），可通过 get_content_addressed_path 找回文件。
+    """
+    extension = os.path.splitext(source_path)[1].lower()
+    asset_name = compute_file_hash(source_path) + extension
+    target_path = get_content_addressed_path(asset_name, store_dir)
+    if not os.path.exists(target_path):
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        # 先复制到临时文件再原子替换，避免并发请求读到半成品
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(target_path), suffix=extension)
+        os.close(fd)
+        shutil.copyfile(source_path, temp_path)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, target_path)
+    else:
+        touch_access_time(target_path)
+    return asset_name
+
+
+def get_content_addressed_path(asset_name, store_dir):
+    """
+    获取资源名称在共享资源目录中对应的文件路径。
+
+    参数:
+        asset_name (str): 资源名称。
+        store_dir (str): 资源目录。
+
+    返回:
+        str: 文件路径。
+    """
+    return os.path.join(store_dir, asset_name[:2], asset_name)
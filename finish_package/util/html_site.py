@@ -0,0 +1,213 @@
+import html
+import os
+import re
+import shutil
+import zipfile
+from bs4 import BeautifulSoup
+from util.utils import compute_file_hash
+
+
+# 多页HTML站点的页面模板，所有页面共用 assets/ 下的样式和图片
+SITE_PAGE_TEMPLATE = """<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>{title}</title>
+<link rel="stylesheet" href="assets/styles.css">
+<link rel="stylesheet" href="assets/site.css">
+{prefetch}</head>
+<body>
+<nav class="site-nav">{nav}</nav>
+<main>
+{content}
+</main>
+<nav class="site-nav">{nav}</nav>
+</body>
+</html>
+"""
+
+# 导航栏和目录页的附加样式
+SITE_CSS = """
+.site-nav { display: flex; justify-content: space-between; padding: 0.6em 0; border-bottom: 1px solid #ddd; }
+.site-nav:last-of-type { border-top: 1px solid #ddd; border-bottom: none; }
+.site-toc { list-style: none; padding-left: 0; }
+.site-toc li { margin: 0.3em 0; }
+.site-toc .toc-level2 { padding-left: 1.5em; }
+.site-toc .toc-level3 { padding-left: 3em; }
+"""
+
+HEADING_PATTERN = re.compile(r'^h[1-6]$')
+
+
+def copy_site_asset(source_path, assets_dir):
+    """
+    将资源文件按内容哈希复制到站点的 assets 目录中，相同内容只复制一次。
+
+    参数:
+        source_path (str): 源文件路径。
+        assets_dir (str): 站点的 assets 目录。
+
+    返回:
+        str: 相对于站点根目录的资源路径。
+    """
+    asset_name = compute_file_hash(source_path) + os.path.splitext(source_path)[1].lower()
+    target_path = os.path.join(assets_dir, asset_name)
+    if not os.path.exists(target_path):
+        shutil.copyfile(source_path, target_path)
+    return f"assets/{asset_name}"
+
+
+def get_section_level(node):
+    """
+    获取 pandoc --section-divs 生成的 <section> 元素的标题级别。
+
+    参数:
+        node: BeautifulSoup 节点。
+
+    返回:
+        int: 标题级别；不是章节元素时返回 None。
+    """
+    if getattr(node, 'name', None) != 'section':
+        return None
+    for class_name in node.get('class', []):
+        match = re.fullmatch(r'level(\d)', class_name)
+        if match:
+            return int(match.group(1))
+    return None
+
+
+def split_html_sections(fragment, split_level):
+    """
+    按标题级别将 pandoc 生成的HTML片段拆分为多个页面。
+
+    级别不超过 split_level 的章节各自成为一个页面，更深的章节保留在所属页面中，
+    第一个章节之前的内容放在目录页中。
+
+    参数:
+        fragment (str): pandoc 使用 --section-divs 生成的HTML片段。
+        split_level (int): 拆分页面的标题级别（1 或 2）。
+
+    返回:
+        tuple: (目录页前言节点列表, 页面列表)，每个页面包含 level、id、title、nodes。
+    """
+    soup = BeautifulSoup(fragment, 'html.parser')
+    preamble = []
+    pages = []
+
+    def walk(nodes, current):
+        for node in list(nodes):
+            level = get_section_level(node)
+            if level is None or level > split_level:
+                current.append(node)
+                continue
+            heading = node.find(HEADING_PATTERN, recursive=False)
+            page = {
+                'level': level,
+                'id': node.get('id', ''),
+                'title': heading.get_text(' ', strip=True) if heading else '',
+                'nodes': [],
+            }
+            pages.append(page)
+            walk(node.children, page['nodes'])
+
+    walk(soup.contents, preamble)
+    return preamble, pages
+
+
+def build_html_site(fragment, site_dir, title, css_path, split_level=2):
+    """
+    根据HTML片段生成多页HTML站点：目录页 index.html、每个章节一个页面、共享样式和资源。
+
+    参数:
+        fragment (str): pandoc 使用 --section-divs 生成的HTML片段。
+        site_dir (str): 站点输出目录，图片需已复制到其中的 assets 目录。
+        title (str): 文档标题。
+        css_path (str): 页面使用的 styles.css 文件路径。
+        split_level (int): 拆分页面的标题级别（1 或 2）。
+    """
+    assets_dir = os.path.join(site_dir, 'assets')
+    os.makedirs(assets_dir, exist_ok=True)
+    shutil.copyfile(css_path, os.path.join(assets_dir, 'styles.css'))
+    with open(os.path.join(assets_dir, 'site.css'), 'w', encoding='utf-8') as f:
+        f.write(SITE_CSS)
+
+    preamble, pages = split_html_sections(fragment, split_level)
+    for number, page in enumerate(pages, start=1):
+        page['file'] = f"section-{number:03d}.html"
+
+    # 记录每个锚点所在的页面，用于改写跨页面的内部链接
+    anchor_pages = {}
+    for page_file, nodes in [('index.html', preamble)] + [(page['file'], page['nodes']) for page in pages]:
+        for node in nodes:
+            if getattr(node, 'name', None) is None:
+                continue
+            if node.get('id'):
+                anchor_pages[node['id']] = page_file
+            for element in node.find_all(id=True):
+                anchor_pages.setdefault(element['id'], page_file)
+    for page in pages:
+        if page['id']:
+            anchor_pages[page['id']] = page['file']
+
+    def render_nodes(nodes, page_file):
+        for node in nodes:
+            if getattr(node, 'name', None) is None:
+                continue
+            links = node.find_all('a', href=True)
+            if node.name == 'a' and node.get('href'):
+                links.append(node)
+            for link in links:
+                anchor = link['href'][1:] if link['href'].startswith('#') else None
+                target_file = anchor_pages.get(anchor) if anchor else None
+                if target_file and target_file != page_file:
+                    link['href'] = f"{target_file}#{anchor}"
+            for image in node.find_all('img'):
+                image.attrs.setdefault('loading', 'lazy')
+                image.attrs.setdefault('decoding', 'async')
+        return ''.join(str(node) for node in nodes)
+
+    def write_page(page_file, page_title, content, previous_page=None, next_page=None):
+        nav = '<a href="index.html">目录</a>'
+        if previous_page:
+            nav += f'<a href="{previous_page["file"]}" rel="prev">上一页：{html.escape(previous_page["title"])}</a>'
+        if next_page:
+            nav += f'<a href="{next_page["file"]}" rel="next">下一页：{html.escape(next_page["title"])}</a>'
+        prefetch = f'<link rel="prefetch" href="{next_page["file"]}">\n' if next_page else ''
+        with open(os.path.join(site_dir, page_file), 'w', encoding='utf-8') as f:
+            f.write(SITE_PAGE_TEMPLATE.format(title=html.escape(page_title), prefetch=prefetch,
+                                              nav=nav, content=content))
+
+    # 目录页：文档标题、前言和所有页面的链接
+    toc_items = ''.join(
+        f'<li class="toc-level{page["level"]}"><a href="{page["file"]}">{html.escape(page["title"])}</a></li>'
+        for page in pages
+    )
+    index_content = (f'<h1 class="title">{html.escape(title)}</h1>\n'
+                     f'{render_nodes(preamble, "index.html")}\n'
+                     f'<ul class="site-toc">{toc_items}</ul>')
+    write_page('index.html', title, index_content, next_page=pages[0] if pages else None)
+
+    for position, page in enumerate(pages):
+        content = (f'<section id="{html.escape(page["id"])}" class="level{page["level"]}">'
+                   f'{render_nodes(page["nodes"], page["file"])}</section>')
+        write_page(page['file'], f'{page["title"]} - {title}', content,
+                   previous_page=pages[position - 1] if position > 0 else None,
+                   next_page=pages[position + 1] if position + 1 < len(pages) else None)
+
+
+def zip_directory(directory, zip_path):
+    """
+    将目录打包为ZIP文件，预压缩文件（.gz/.br）不打包。
+
+    参数:
+        directory (str): 要打包的目录。
+        zip_path (str): ZIP文件路径。
+    """
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+        for root, _, files in os.walk(directory):
+            for name in files:
+                if name.endswith(('.gz', '.br')):
+                    continue
+                file_path = os.path.join(root, name)
+                zip_ref.write(file_path, os.path.relpath(file_path, os.path.dirname(directory)))
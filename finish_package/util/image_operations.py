@@ -0,0 +1,299 @@
+import logging
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote
+from util.utils import compute_file_hash, touch_access_time
+
+try:
+    from PIL import Image, ImageOps
+    from PIL.Image import DecompressionBombError  # 像素数超出 Image.MAX_IMAGE_PIXELS 两倍，不是 OSError 的子类
+except ImportError:  # 未安装 Pillow 时跳过图片优化
+    Image = None
+    ImageOps = None
+    DecompressionBombError = OSError
+
+try:
+    import cairosvg
+except ImportError:  # 未安装 cairosvg 时使用 rsvg-convert 转换 SVG
+    cairosvg = None
+
+
+logger = logging.getLogger(__name__)
+
+# Markdown 图片语法 ![alt](path "title") 以及 HTML <img src="path">
+MARKDOWN_IMAGE_PATTERN = re.compile(r'(!\[[^\]]*\]\(\s*<?)([^)\s>]+)(>?(?:\s+"[^"]*")?\s*\))')
+HTML_IMAGE_PATTERN = re.compile(r'(<img\b[^>]*?\bsrc\s*=\s*["\'])([^"\']+)(["\'])', re.IGNORECASE)
+
+# PDF 页面布局：pandoc 的 geometry 变量和 generate_latex_document_pdf 生成的 \geometry 都使用这些值，
+# 版心宽度与实际排版一致
+PDF_PAPER = 'a4paper'
+PDF_PAPER_WIDTH_MM = 210
+PDF_MARGIN_MM = 25
+
+# 版心宽度（英寸）：PDF 由上面的页面布局计算（约 6.3 英寸），DOCX 为 python-docx 默认模板
+PDF_TEXT_WIDTH_INCHES = (PDF_PAPER_WIDTH_MM - 2 * PDF_MARGIN_MM) / 25.4
+DOCX_TEXT_WIDTH_INCHES = 6.0
+
+# 颜色数不超过该值的图片视为截图/示意图，使用 PNG 无损保存
+PNG_MAX_COLORS = 4096
+JPEG_QUALITY = 85
+
+# xelatex 无法直接嵌入的图片格式：矢量图转为 PDF，位图转为 PNG
+VECTOR_EXTENSIONS = {'.svg', '.svgz'}
+XELATEX_UNSUPPORTED_EXTENSIONS = VECTOR_EXTENSIONS | {'.webp', '.gif', '.tif', '.tiff'}
+
+
+def find_image_references(md_text):
+    """
+    查找 Markdown 文本中引用的所有本地图片路径。
+
+    参数:
+        md_text (str): Markdown 文本。
+
+    返回:
+        list: 图片引用路径列表（去重，保持出现顺序）。
+    """
+    references = []
+    for pattern in (MARKDOWN_IMAGE_PATTERN, HTML_IMAGE_PATTERN):
+        for match in pattern.finditer(md_text):
+            target = match.group(2)
+            if re.match(r'^[a-zA-Z][a-zA-Z0-9+.-]*://', target) or target.startswith('data:'):
+                continue
+            if target not in references:
+                references.append(target)
+    return references
+
+
+def resolve_image_path(reference, resource_paths):
+    """
+    按照 pandoc 的 --resource-path 规则解析图片的实际路径。
+
+    参数:
+        reference (str): Markdown 中的图片引用路径。
+        resource_paths (list): 资源文件路径列表。
+
+    返回:
+        str: 图片的绝对路径；找不到时返回 None。
+    """
+    for candidate in (reference, unquote(reference)):
+        if os.path.isabs(candidate):
+            if os.path.isfile(candidate):
+                return candidate
+            continue
+        for base in resource_paths:
+            path = os.path.join(base, candidate)
+            if os.path.isfile(path):
+                return os.path.abspath(path)
+    return None
+
+
+def optimize_image(source_path, cache_dir, max_width_px):
+    """
+    将图片按目标像素宽度缩小并重新压缩，结果按源文件内容哈希缓存。
+
+    照片类图片（含原本就是 JPEG 的图片）保存为 JPEG，带透明通道或颜色较少的截图保存为 PNG。
+    图片本身不超过目标宽度时不做处理，直接返回源文件路径。
+
+    参数:
+        source_path (str): 源图片路径。
+        cache_dir (str): 派生图片缓存目录。
+        max_width_px (int): 目标最大像素宽度。
+
+    返回:
+        str: 可供 pandoc 引用的图片路径。
+    """
+    if Image is None:
+        return source_path
+
+    source_hash = compute_file_hash(source_path)
+    shard_dir = os.path.join(cache_dir, source_hash[:2])
+    for extension in ('.jpg', '.png'):
+        cached_path = os.path.join(shard_dir, f"{source_hash}-{max_width_px}{extension}")
+        if os.path.exists(cached_path):
+            touch_access_time(cached_path)
+            return cached_path
+
+    try:
+        with Image.open(source_path) as image:
+            if image.width <= max_width_px or getattr(image, 'is_animated', False):
+                return source_path
+            source_is_jpeg = image.format == 'JPEG'
+            image = ImageOps.exif_transpose(image)
+            height = max(1, round(image.height * max_width_px / image.width))
+            image = image.resize((max_width_px, height), Image.LANCZOS)
+
+            has_alpha = image.mode in ('RGBA', 'LA') or 'transparency' in image.info
+            if has_alpha:
+                image = image.convert('RGBA')
+                has_alpha = image.getchannel('A').getextrema()[0] < 255
+            if has_alpha or (not source_is_jpeg and image.getcolors(PNG_MAX_COLORS) is not None):
+                extension, save_options = '.png', {'format': 'PNG', 'optimize': True}
+                if not has_alpha:
+                    image = image.convert('RGB')
+            else:
+                extension, save_options = '.jpg', {'format': 'JPEG', 'quality': JPEG_QUALITY, 'optimize': True}
+                image = image.convert('RGB')
+
+            os.makedirs(shard_dir, exist_ok=True)
+            cached_path = os.path.join(shard_dir, f"{source_hash}-{max_width_px}{extension}")
+            # 先写入临时文件再原子替换，避免并发请求读到半成品
+            fd, temp_path = tempfile.mkstemp(dir=shard_dir, suffix=extension)
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    image.save(f, **save_options)
+                os.replace(temp_path, cached_path)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+            return cached_path
+    except (OSError, ValueError, DecompressionBombError) as e:
+        logger.warning(f"Failed to optimize image {source_path}: {e}")
+        return source_path
+
+
+def normalize_image(source_path, cache_dir):
+    """
+    将 xelatex 不支持的图片格式转换为 PDF（矢量图）或 PNG（位图），结果按内容哈希缓存。
+
+    缓存目录在所有会话之间共享，同一张图片只会转换一次。
+
+    参数:
+        source_path (str): 源图片路径。
+        cache_dir (str): 转换结果缓存目录。
+
+    返回:
+        str: 可供 xelatex 引用的图片路径；无法转换时返回源文件路径。
+    """
+    extension = os.path.splitext(source_path)[1].lower()
+    if extension not in XELATEX_UNSUPPORTED_EXTENSIONS:
+        return source_path
+
+    target_extension = '.pdf' if extension in VECTOR_EXTENSIONS else '.png'
+    source_hash = compute_file_hash(source_path)
+    shard_dir = os.path.join(cache_dir, source_hash[:2])
+    cached_path = os.path.join(shard_dir, f"{source_hash}{target_extension}")
+    if os.path.exists(cached_path):
+        touch_access_time(cached_path)
+        return cached_path
+
+    os.makedirs(shard_dir, exist_ok=True)
+    # 先写入临时文件再原子替换，避免并发请求读到半成品
+    fd, temp_path = tempfile.mkstemp(dir=shard_dir, suffix=target_extension)
+    os.close(fd)
+    try:
+        if target_extension == '.pdf':
+            if cairosvg is not None:
+                cairosvg.svg2pdf(url=source_path, write_to=temp_path)
+            elif shutil.which('rsvg-convert'):
+                subprocess.run(['rsvg-convert', '-f', 'pdf', '-o', temp_path, source_path],
+                               check=True, capture_output=True, timeout=60)
+            else:
+                logger.warning(f"No SVG converter available for {source_path}")
+                os.remove(temp_path)
+                return source_path
+        else:
+            if Image is None:
+                os.remove(temp_path)
+                return source_path
+            with Image.open(source_path) as image:
+                # 动图只保留第一帧
+                image.seek(0)
+                image = ImageOps.exif_transpose(image)
+                has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+                image = image.convert('RGBA' if has_alpha else 'RGB')
+                image.save(temp_path, format='PNG', optimize=True)
+        os.replace(temp_path, cached_path)
+        return cached_path
+    except (OSError, ValueError, DecompressionBombError, subprocess.SubprocessError) as e:
+        logger.warning(f"Failed to normalize image {source_path}: {e}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return source_path
+
+
+def prepare_image(source_path, cache_dir, max_width_px=None, normalize=False):
+    """
+    对单张图片依次执行格式规范化和缩小重压缩。
+
+    参数:
+        source_path (str): 源图片路径。
+        cache_dir (str): 派生图片缓存目录。
+        max_width_px (int): 目标最大像素宽度，为 None 时不缩小。
+        normalize (bool): 是否将 xelatex 不支持的格式转换为 PDF/PNG。
+
+    返回:
+        str: 处理后的图片路径。
+    """
+    image_path = source_path
+    if normalize:
+        image_path = normalize_image(image_path, cache_dir)
+    if max_width_px and not image_path.lower().endswith(('.pdf', '.svg', '.svgz')):
+        image_path = optimize_image(image_path, cache_dir, max_width_px)
+    return image_path
+
+
+def prepare_markdown_images(md_text, resource_paths, cache_dir, target_dpi=None, text_width_inches=None,
+                            max_workers=4, normalize=False):
+    """
+    在调用 pandoc 之前，并行处理 Markdown 中引用的所有图片。
+
+    参数:
+        md_text (str): Markdown 文本。
+        resource_paths (list): 资源文件路径列表。
+        cache_dir (str): 派生图片缓存目录。
+        target_dpi (int): 目标分辨率（DPI），为 None 时不缩小图片。
+        text_width_inches (float): 版心宽度（英寸）。
+        max_workers (int): 线程池大小。
+        normalize (bool): 是否将 xelatex 不支持的格式转换为 PDF/PNG。
+
+    返回:
+        dict: 原图片引用路径到处理后图片路径的映射。
+    """
+    max_width_px = int(target_dpi * text_width_inches) if target_dpi else None
+    if not max_width_px and not normalize:
+        return {}
+    sources = {}
+    for reference in find_image_references(md_text):
+        source_path = resolve_image_path(reference, resource_paths)
+        if source_path:
+            sources[reference] = source_path
+    if not sources:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            reference: executor.submit(prepare_image, source_path, cache_dir, max_width_px, normalize)
+            for reference, source_path in sources.items()
+        }
+        image_map = {reference: future.result() for reference, future in futures.items()}
+
+    return {reference: path for reference, path in image_map.items() if path != sources[reference]}
+
+
+def rewrite_image_references(text, image_map):
+    """
+    将文本中的图片引用替换为映射后的路径。
+
+    参数:
+        text (str): Markdown 文本（可以是单行）。
+        image_map (dict): 原图片引用路径到新路径的映射。
+
+    返回:
+        str: 替换后的文本。
+    """
+    if not image_map:
+        return text
+
+    def replace(match):
+        target = image_map.get(match.group(2))
+        if target is None:
+            return match.group(0)
+        return match.group(1) + target.replace("\\", "/") + match.group(3)
+
+    text = MARKDOWN_IMAGE_PATTERN.sub(replace, text)
+    return HTML_IMAGE_PATTERN.sub(replace, text)
@@ -0,0 +1,582 @@
+import asyncio
+import concurrent.futures
+import hashlib
+import heapq
+import itertools
+import logging
+import os
+import time
+import portalocker
+from util.process_operations import run_coroutine_sync, get_process_loop, run_in_thread, process_usage, new_usage, \
+    TERMINATE_GRACE_SECONDS
+from util.session_store import get_completed_conversion, mark_conversion_completed, record_cancellation, \
+    get_cancellations
+from util.metrics import time_stage, track_jobs, count_cache_result
+from util.tracing import span, clear_timeline
+
+
+logger = logging.getLogger(__name__)
+
+# 正在运行的转换作业：urlid -> {作业键: asyncio.Task}，只在共享事件循环中访问，无需加锁
+_jobs = {}
+
+# 正在运行的转换作业：转换键 -> asyncio.Task，相同的转换请求共享同一个作业
+_flights = {}
+
+# 本进程登记的作业：asyncio.Task -> (登记时间, 转换键摘要)，用于处理其他进程广播的取消
+_registered = {}
+
+# 多个工作进程共享的会话数据库，记录已完成的转换和取消广播，由 configure_shared_state 设置
+_state_db = None
+
+# 轮询其他进程取消广播的间隔（秒）
+CANCEL_POLL_SECONDS = 1
+
+# 等待其他进程释放输出文件锁的轮询间隔（秒）
+OUTPUT_LOCK_POLL_SECONDS = 0.2
+
+# 广播取消后等待其他进程中的作业退出的最长时间（秒）：轮询间隔加上 SIGTERM、SIGKILL 各自的等待时间
+CANCEL_WAIT_SECONDS = CANCEL_POLL_SECONDS + 2 * TERMINATE_GRACE_SECONDS + 1
+
+# 等待中或正在运行的预渲染任务：urlid -> set(asyncio.Task)
+_speculative = {}
+
+# 同时运行的预渲染数
+SPECULATIVE_CONCURRENCY = 1
+_speculative_slots = None
+
+# 正在运行的正式转换数；预渲染只在没有正式转换时开始
+_active_jobs = 0
+_idle = None
+
+# 同时运行转换子进程的作业数，以及等待时每秒抵扣的预计 CPU 秒数，由 configure_scheduler 设置
+CONVERSION_WORKERS = os.cpu_count() or 1
+AGING_RATE = 0.5
+
+# 等待运行的作业按客户端分组：客户端 -> (优先级, 序号, asyncio.Future, 预计 CPU 秒数, 权重) 组成的最小堆
+_client_queues = {}
+_slot_sequence = itertools.count()
+_running_slots = 0
+
+# 加权公平排队：全局虚拟时间，以及每个客户端最近开始的作业的虚拟结束时间
+_virtual_time = 0.0
+_client_finish = {}
+
+# 预计 CPU 秒数的下限，避免没有估计值的作业不占用虚拟时间
+MIN_JOB_COST = 0.1
+
+
+class ConversionCancelledError(Exception):
+    """
+    转换作业被取消（页面关闭、重新上传或被新的转换请求取代）。
+    """
+
+
+def configure_scheduler(workers, aging_rate):
+    """
+    设置作业调度参数。
+
+    参数:
+        workers (int): 同时运行转换子进程的作业数。
+        aging_rate (float): 等待时每秒抵扣的预计 CPU 秒数，保证预计耗时长的作业不会一直被插队。
+    """
+    global CONVERSION_WORKERS, AGING_RATE
+    CONVERSION_WORKERS = max(1, int(workers))
+    AGING_RATE = aging_rate
+
+
+def configure_shared_state(db_path):
+    """
+    设置多个工作进程共享的会话数据库，并在共享事件循环中开始轮询其他进程的取消广播。
+
+    参数:
+        db_path (str): SQLite 数据库文件路径。
+    """
+    global _state_db
+    watching = _state_db is not None
+    _state_db = db_path
+    if not watching:
+        asyncio.run_coroutine_threadsafe(watch_cancellations(), get_process_loop())
+
+
+def hash_flight_key(flight_key):
+    """
+    返回:
+        str: 转换键的摘要，用于在进程之间比较转换键。
+    """
+    return hashlib.sha256(repr(flight_key).encode('utf-8')).hexdigest()
+
+
+async def lock_output_file(output_file):
+    """
+    取得输出文件的排他锁，其他工作进程正在写同一个输出文件时等待。
+
+    参数:
+        output_file (str): 输出文件路径。
+
+    返回:
+        file: 已加锁的锁文件，关闭即释放。
+    """
+    lock_file = open(output_file + '.lock', 'a')
+    try:
+        while True:
+            try:
+                portalocker.lock(lock_file, portalocker.LOCK_EX | portalocker.LOCK_NB)
+                return lock_file
+            except portalocker.exceptions.LockException:
+                await asyncio.sleep(OUTPUT_LOCK_POLL_SECONDS)
+    except BaseException:
+        lock_file.close()
+        raise
+
+
+def cancel_local_jobs(urlid, key=None, before=None, keep_flight_hash=None):
+    """
+    取消本进程中 urlid 的作业，不等待其退出。
+
+    参数:
+        urlid (str): 上传文件的唯一标识符。
+        key (str): 作业键；为 None 时取消所有作业（包括预渲染）。
+        before (float): 只取消在该时间之前登记的作业。
+        keep_flight_hash (str): 转换键摘要与之相同的作业不取消。
+
+    返回:
+        int: 被取消的作业数。
+    """
+    jobs = _jobs.get(urlid, {})
+    if key is None:
+        tasks = set(jobs.values()) | _speculative.get(urlid, set())
+    else:
+        tasks = {jobs[key]} if key in jobs else set()
+    cancelled = 0
+    for task in tasks:
+        registered_at, flight_hash = _registered.get(task, (0.0, None))
+        if before is not None and registered_at >= before:
+            continue
+        if keep_flight_hash is not None and flight_hash == keep_flight_hash:
+            continue
+        task.cancel()
+        cancelled += 1
+    return cancelled
+
+
+def cancel_flight(flight_hash):
+    """
+    取消本进程中转换键摘要为 flight_hash 的作业，不等待其退出。可在任意线程中调用。
+
+    参数:
+        flight_hash (str): 转换键摘要。
+    """
+    def cancel():
+        for task, (_, registered_hash) in list(_registered.items()):
+            if registered_hash == flight_hash:
+                task.cancel()
+
+    get_process_loop().call_soon_threadsafe(cancel)
+
+
+async def watch_cancellations():
+    """
+    轮询其他工作进程广播的取消（页面关闭、重新上传、被新的转换请求取代），取消本进程中对应的作业。
+    """
+    last_id = None
+    while True:
+        try:
+            last_id, cancellations = await run_in_thread(get_cancellations, _state_db, last_id, os.getpid())
+            for urlid, key, flight_hash, cancelled_at in cancellations:
+                cancel_local_jobs(urlid, key, before=cancelled_at, keep_flight_hash=flight_hash)
+        except Exception as e:
+            logger.error(f"Failed to poll cancellations: {e}")
+        await asyncio.sleep(CANCEL_POLL_SECONDS)
+
+
+def init_primitives():
+    """
+    在共享事件循环中创建同步原语（Python 3.10 以前的版本在创建时绑定当前线程的事件循环）。
+    """
+    global _speculative_slots, _idle
+    if _idle is None:
+        _speculative_slots = asyncio.Semaphore(SPECULATIVE_CONCURRENCY)
+        _idle = asyncio.Event()
+        if not _active_jobs:
+            _idle.set()
+
+
+def update_active_jobs(delta):
+    """
+    更新正在运行的正式转换数，没有正式转换时允许预渲染开始。
+
+    参数:
+        delta (int): 变化量。
+    """
+    global _active_jobs
+    init_primitives()
+    _active_jobs += delta
+    if _active_jobs:
+        _idle.clear()
+    else:
+        _idle.set()
+
+
+def start_fair_share(client, estimate, weight):
+    """
+    记录客户端的作业开始运行：作业的虚拟开始时间为全局虚拟时间与该客户端上一个作业虚拟结束时间的较大者，
+    虚拟结束时间再加上 预计 CPU 秒数 / 权重，全局虚拟时间前进到该作业的虚拟开始时间。
+
+    参数:
+        client (str): 客户端标识。
+        estimate (float): 预计 CPU 秒数。
+        weight (float): 客户端权重。
+    """
+    global _virtual_time
+    start = max(_virtual_time, _client_finish.get(client, 0.0))
+    _client_finish[client] = start + estimate / weight
+    _virtual_time = start
+    # 虚拟结束时间已落后于全局虚拟时间且没有等待作业的客户端与新客户端相同，不再保留
+    for idle_client in [c for c, finish in _client_finish.items() if finish <= _virtual_time and c not in _client_queues]:
+        del _client_finish[idle_client]
+
+
+async def acquire_conversion_slot(estimate, client='', weight=1.0):
+    """
+    等待运行槽位：客户端之间按加权公平排队，同一客户端的作业按预计最短作业优先。
+
+    槽位空出时，比较每个客户端队首作业的虚拟结束时间，最小的先运行，
+    因此持续提交大量作业的客户端不会挤占其他客户端，权重为 2 的客户端得到两倍的份额。
+
+    同一客户端内作业的优先级为预计 CPU 秒数减去 AGING_RATE 乘以已等待的秒数，数值越小越先运行。
+    所有作业的优先级随时间以相同速度降低，排序等价于按 预计 CPU 秒数 + AGING_RATE × 入队时间 排序，
+    因此可以用最小堆保存。
+
+    参数:
+        estimate (float): 预计 CPU 秒数。
+        client (str): 客户端标识。
+        weight (float): 客户端权重。
+    """
+    global _running_slots
+    estimate = max(estimate, MIN_JOB_COST)
+    if _running_slots < CONVERSION_WORKERS and not _client_queues:
+        _running_slots += 1
+        start_fair_share(client, estimate, weight)
+        return
+    future = asyncio.get_running_loop().create_future()
+    heapq.heappush(_client_queues.setdefault(client, []),
+                   (estimate + AGING_RATE * time.monotonic(), next(_slot_sequence), future, estimate, weight))
+    try:
+        await future
+    except asyncio.CancelledError:
+        # 已分配到槽位后才被取消时把槽位交给下一个作业；仍在等待的条目由 release_conversion_slot 跳过
+        if future.done() and not future.cancelled():
+            release_conversion_slot()
+        raise
+
+
+def release_conversion_slot():
+    """
+    释放运行槽位，直接交给虚拟结束时间最小的客户端的队首作业。
+    """
+    global _running_slots
+    selected = None
+    for client, queue in list(_client_queues.items()):
+        while queue and queue[0][2].done():
+            heapq.heappop(queue)  # 跳过已取消的等待作业
+        if not queue:
+            del _client_queues[client]
+            continue
+        _, _, _, estimate, weight = queue[0]
+        finish = max(_virtual_time, _client_finish.get(client, 0.0)) + estimate / weight
+        if selected is None or finish < selected[0]:
+            selected = (finish, client)
+    if selected is None:
+        _running_slots -= 1
+        return
+    client = selected[1]
+    _, _, future, estimate, weight = heapq.heappop(_client_queues[client])
+    if not _client_queues[client]:
+        del _client_queues[client]
+    start_fair_share(client, estimate, weight)
+    future.set_result(None)
+
+
+async def supervise_conversion(urlid, key, flight_key, output_file, prepare, speculative=False, estimate=None,
+                               on_measured=None, client='', weight=1.0):
+    """
+    登记并运行转换作业。
+
+    输出文件已是相同转换的结果时直接返回；转换键相同的作业正在运行时等待它的结果，
+    不再启动新的转换；否则同一 urlid 下作业键相同的旧作业会先被取消，等其子进程退出、
+    临时文件清理完毕后再开始新作业，避免两者写同一个输出文件。
+    其他工作进程中的旧作业通过取消广播终止，输出文件锁保证同一时间只有一个进程写输出文件；
+    其他进程中转换键相同的作业不会被取消，取得锁后直接使用它的结果。
+
+    参数:
+        urlid (str): 上传文件的唯一标识符。
+        key (str): 作业键，如输出格式。
+        flight_key (tuple): 转换键，由上传内容哈希、输出格式和转换参数组成。
+        output_file (str): 输出文件路径。
+        prepare (callable): 准备函数，在线程池中运行（如生成模板文件），返回启动转换协程的函数。
+        speculative (bool): 是否为预渲染作业。
+        estimate (float): 预计 CPU 秒数，用于排队顺序。
+        on_measured (callable): 子进程运行结束后（包括失败和被终止）在线程池中调用，
+            参数为实测的资源使用（cpu_seconds、peak_memory_mb）和转换是否成功。
+        client (str): 提交作业的客户端标识，用于公平排队。
+        weight (float): 客户端权重。
+
+    返回:
+        转换协程的返回值。
+    """
+    flight_hash = hash_flight_key(flight_key)
+    if await run_in_thread(is_completed, urlid, key, flight_hash, output_file):
+        if not speculative:
+            count_cache_result(key, 'hit')
+        return None
+
+    running = _flights.get(flight_key)
+    if running is not None:
+        if not speculative:
+            count_cache_result(key, 'shared')
+        # shield 保证等待方断开时不会取消共享的作业
+        return await asyncio.shield(running)
+
+    task = asyncio.current_task()
+    _flights[flight_key] = task
+    _registered[task] = (time.time(), flight_hash)
+    jobs = _jobs.setdefault(urlid, {})
+    previous = jobs.get(key)
+    jobs[key] = task
+    if not speculative:
+        update_active_jobs(1)
+    started = time.time()
+    lock_file = None
+    try:
+        if not speculative:
+            # 清除转换记录，并通知其他进程取消同一 urlid、同一作业键的旧作业；预渲染不取消其他进程的正式转换
+            await run_in_thread(record_cancellation, _state_db, urlid, key, flight_hash, os.getpid())
+        if previous is not None:
+            previous.cancel()
+            await asyncio.gather(previous, return_exceptions=True)
+        lock_file = await lock_output_file(output_file)
+        # 等待锁期间其他进程可能已完成相同的转换；预渲染不覆盖任何已完成的转换
+        if await run_in_thread(is_completed, urlid, key, None if speculative else flight_hash, output_file):
+            if not speculative:
+                count_cache_result(key, 'hit')
+            return None
+        if not speculative:
+            count_cache_result(key, 'miss')
+        with time_stage('prepare', key), span('prepare'):
+            start = await run_in_thread(prepare)
+        with time_stage('queue_wait', key), track_jobs('waiting'), span('queue_wait'):
+            await acquire_conversion_slot(estimate or 0.0, client, weight)
+        usage = new_usage()
+        process_usage.set(usage)
+        succeeded = False
+        try:
+            with track_jobs('running'), span('convert', format=key):
+                result = await start()
+            # 转换失败时可能保留旧的输出文件，只有本次生成的输出才记为完成
+            succeeded = os.path.exists(output_file) and os.path.getmtime(output_file) >= started
+            if succeeded:
+                await run_in_thread(mark_conversion_completed, _state_db, urlid, key, flight_hash)
+            return result
+        finally:
+            release_conversion_slot()
+            if on_measured is not None and usage['processes']:
+                try:
+                    await run_in_thread(on_measured, usage, succeeded)
+                except Exception as e:
+                    logger.error(f"Failed to record usage of {key} for {urlid}: {e}")
+    finally:
+        if lock_file is not None:
+            lock_file.close()
+        _registered.pop(task, None)
+        if not speculative:
+            update_active_jobs(-1)
+        if _flights.get(flight_key) is task:
+            del _flights[flight_key]
+        jobs = _jobs.get(urlid, {})
+        if jobs.get(key) is task:
+            del jobs[key]
+            if not jobs:
+                del _jobs[urlid]
+
+
+def is_completed(urlid, key, flight_hash, output_file):
+    """
+    判断输出文件是否已是该转换的结果。
+
+    参数:
+        urlid (str): 上传文件的唯一标识符。
+        key (str): 作业键。
+        flight_hash (str): 转换键摘要；为 None 时只判断是否有已完成的转换。
+        output_file (str): 输出文件路径。
+
+    返回:
+        bool: 是否已完成。
+    """
+    completed = get_completed_conversion(_state_db, urlid, key)
+    if completed is None or (flight_hash is not None and completed != flight_hash):
+        return False
+    return os.path.exists(output_file)
+
+
+async def run_speculative_conversion(urlid, key, flight_key, output_file, prepare, estimate=None, on_measured=None,
+                                     client='', weight=1.0):
+    """
+    以低优先级运行预渲染作业：同一时间只运行 SPECULATIVE_CONCURRENCY 个，并且等到没有正式转换时才开始。
+
+    该 urlid、作业键已有正式转换（正在运行或已完成）时不再预渲染，避免覆盖用户请求的结果。
+
+    参数:
+        urlid (str): 上传文件的唯一标识符。
+        key (str): 作业键，如输出格式。
+        flight_key (tuple): 转换键。
+        output_file (str): 输出文件路径。
+        prepare (callable): 准备函数，返回启动转换协程的函数。
+        estimate (float): 预计 CPU 秒数。
+        on_measured (callable): 子进程运行结束后调用，参数为实测的资源使用和转换是否成功。
+        client (str): 上传文件的客户端标识。
+        weight (float): 客户端权重。
+    """
+    init_primitives()
+    # 预渲染在上传请求返回后继续运行，不记入上传请求的时间线
+    clear_timeline()
+    task = asyncio.current_task()
+    _speculative.setdefault(urlid, set()).add(task)
+    _registered[task] = (time.time(), None)
+    try:
+        async with _speculative_slots:
+            await _idle.wait()
+            if key in _jobs.get(urlid, {}) or await run_in_thread(is_completed, urlid, key, None, output_file):
+                return
+            await supervise_conversion(urlid, key, flight_key, output_file, prepare, speculative=True,
+                                       estimate=estimate, on_measured=on_measured, client=client, weight=weight)
+    except Exception as e:
+        logger.warning(f"Speculative conversion {key} for {urlid} failed: {e}")
+    finally:
+        _registered.pop(task, None)
+        tasks = _speculative.get(urlid, set())
+        tasks.discard(task)
+        if not tasks:
+            _speculative.pop(urlid, None)
+
+
+async def cancel_urlid_jobs(urlid):
+    """
+    取消 urlid 的所有转换作业，并等待它们的子进程退出。
+
+    参数:
+        urlid (str): 上传文件的唯一标识符。
+
+    返回:
+        int: 被取消的作业数。
+    """
+    tasks = set(_jobs.pop(urlid, {}).values()) | _speculative.pop(urlid, set())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return len(tasks)
+
+
+def run_conversion(urlid, key, flight_key, output_file, prepare, estimate=None, on_measured=None, client='',
+                   weight=1.0):
+    """
+    运行转换作业并阻塞等待其完成。作业登记为 urlid 的可取消句柄，
+    可被 cancel_conversions 或同一 urlid、同一作业键的新作业取消；
+    转换键相同的并发请求（重复点击、前端重试）共享同一个作业和结果，
+    输出文件已是相同转换（包括预渲染）的结果时立即返回。
+    同时运行的作业数不超过 CONVERSION_WORKERS，其余作业在客户端之间公平排队，同一客户端内按预计最短作业优先。
+
+    参数:
+        urlid (str): 上传文件的唯一标识符。
+        key (str): 作业键，如输出格式。
+        flight_key (tuple): 转换键，由上传内容哈希、输出格式和转换参数组成。
+        output_file (str): 输出文件路径。
+        prepare (callable): 准备函数，返回启动转换协程的函数，只在需要启动新作业时调用。
+        estimate (float): 预计 CPU 秒数，用于排队顺序。
+        on_measured (callable): 子进程运行结束后调用，参数为实测的资源使用和转换是否成功；
+            作业未启动子进程（共享其他请求的结果）时不调用。
+        client (str): 提交作业的客户端标识。
+        weight (float): 客户端权重。
+
+    返回:
+        转换协程的返回值。
+
+    异常:
+        ConversionCancelledError: 作业被取消。
+    """
+    try:
+        return run_coroutine_sync(supervise_conversion(urlid, key, flight_key, output_file, prepare,
+                                                       estimate=estimate, on_measured=on_measured,
+                                                       client=client, weight=weight))
+    except concurrent.futures.CancelledError:
+        raise ConversionCancelledError(f"Conversion {key} for {urlid} was cancelled")
+
+
+def start_speculative_conversion(urlid, key, flight_key, output_file, prepare, estimate=None, on_measured=None,
+                                 client='', weight=1.0):
+    """
+    在后台排队预渲染，不等待其完成。
+
+    参数:
+        urlid (str): 上传文件的唯一标识符。
+        key (str): 作业键，如输出格式。
+        flight_key (tuple): 转换键。
+        output_file (str): 输出文件路径。
+        prepare (callable): 准备函数，返回启动转换协程的函数。
+        estimate (float): 预计 CPU 秒数。
+        on_measured (callable): 子进程运行结束后调用，参数为实测的资源使用和转换是否成功。
+        client (str): 上传文件的客户端标识。
+        weight (float): 客户端权重。
+    """
+    asyncio.run_coroutine_threadsafe(run_speculative_conversion(urlid, key, flight_key, output_file, prepare,
+                                                                estimate, on_measured, client, weight),
+                                     get_process_loop())
+
+
+def wait_for_output_unlocked(output_directory, timeout):
+    """
+    等待其他工作进程中写入该目录下输出文件的作业退出，即所有输出文件锁都已释放。
+
+    参数:
+        output_directory (str): 输出目录。
+        timeout (float): 最长等待时间（秒）。
+
+    返回:
+        bool: 是否所有锁都已释放。
+    """
+    if not os.path.isdir(output_directory):
+        return True
+    deadline = time.monotonic() + timeout
+    for name in os.listdir(output_directory):
+        if not name.endswith('.lock'):
+            continue
+        with open(os.path.join(output_directory, name), 'a') as lock_file:
+            while True:
+                try:
+                    portalocker.lock(lock_file, portalocker.LOCK_EX | portalocker.LOCK_NB)
+                    portalocker.unlock(lock_file)
+                    break
+                except portalocker.exceptions.LockException:
+                    if time.monotonic() >= deadline:
+                        return False
+                    time.sleep(OUTPUT_LOCK_POLL_SECONDS)
+    return True
+
+
+def cancel_conversions(urlid, output_directory=None):
+    """
+    取消 urlid 的所有转换作业，立即终止本进程中的 pandoc/xelatex 进程组，
+    并广播给其他工作进程（在 CANCEL_POLL_SECONDS 内终止）。
+
+    参数:
+        urlid (str): 上传文件的唯一标识符。
+        output_directory (str): urlid 的输出目录；指定时等待其他进程中的作业退出，之后可以安全地删除文件。
+
+    返回:
+        int: 本进程中被取消的作业数。
+    """
+    cancelled = run_coroutine_sync(cancel_urlid_jobs(urlid))
+    record_cancellation(_state_db, urlid, None, None, os.getpid())
+    if output_directory is not None and not wait_for_output_unlocked(output_directory, CANCEL_WAIT_SECONDS):
+        logger.warning(f"Conversions for {urlid} in other workers did not stop within {CANCEL_WAIT_SECONDS}s")
+    return cancelled
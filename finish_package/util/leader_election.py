@@ -0,0 +1,26 @@
+import portalocker
+
+
+def run_as_leader(lock_path, run, stop_event, retry_seconds=10):
+    """
+    在多个工作进程中只让一个进程运行 run：循环尝试取得锁文件的排他锁，取得后运行 run(stop_event)。
+
+    锁在持有进程退出（包括崩溃、平滑重启时旧进程退出）时由操作系统释放，其他进程在 retry_seconds 内接替。
+
+    参数:
+        lock_path (str): 锁文件路径，所有工作进程使用同一个文件。
+        run (callable): 当选后运行的函数，参数为 stop_event，应在 stop_event 设置后返回。
+        stop_event (threading.Event): 停止事件。
+        retry_seconds (float): 未当选时重试的间隔（秒）。
+    """
+    while not stop_event.is_set():
+        with open(lock_path, 'a') as f:
+            try:
+                portalocker.lock(f, portalocker.LOCK_EX | portalocker.LOCK_NB)
+            except portalocker.exceptions.LockException:
+                stop_event.wait(retry_seconds)
+                continue
+            try:
+                run(stop_event)
+            finally:
+                portalocker.unlock(f)
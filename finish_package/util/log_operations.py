@@ -0,0 +1,205 @@
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import os
+import queue
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import portalocker
+
+
+# 当前请求或作业的日志上下文（request_id、urlid、job_id、output_format 等），由 bind_log_context 设置，
+# 记录日志时附加到每条记录；协程和 run_in_thread 中的函数继承调用方的上下文
+_log_context = contextvars.ContextVar('log_context', default={})
+
+# LogRecord 自带的属性，其余属性（logger.info(..., extra={...}) 传入的字段和日志上下文）作为结构化字段输出
+RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+# 文本格式，与原来各日志文件的格式相同
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+def bind_log_context(**fields):
+    """
+    为当前请求或作业之后的日志记录附加字段，如 bind_log_context(urlid=urlid, output_format='pdf')。值为 None 的字段被忽略。
+    """
+    context = dict(_log_context.get())
+    context.update((key, value) for key, value in fields.items() if value is not None)
+    _log_context.set(context)
+
+
+def clear_log_context(**fields):
+    """
+    清除当前上下文中的所有字段（工作线程会被下一个请求复用），再设置 fields 中的字段。
+    """
+    _log_context.set({})
+    bind_log_context(**fields)
+
+
+def add_log_context(record):
+    """
+    日志过滤器：在调用方的线程中把日志上下文附加到记录上（extra 中的同名字段优先），始终返回 True。
+    """
+    for key, value in _log_context.get().items():
+        if not hasattr(record, key):
+            setattr(record, key, value)
+    return True
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    将日志记录格式化为一行 JSON：time、level、logger、message、pid、thread，以及日志上下文和 extra 中的字段。
+    """
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'pid': record.process,
+            'thread': record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class ContextQueueHandler(QueueHandler):
+    """
+    放入队列前预先格式化消息的 QueueHandler。异常堆栈保存在 exc_text 中，不拼接到 message 里，
+    JSON 格式输出为 exception 字段，文本格式仍附加在消息之后。
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        # 堆栈帧和 traceback 对象不能跨线程保留，只保留格式化后的文本
+        record.exc_info = None
+        return record
+
+
+class SharedRotatingFileHandler(RotatingFileHandler):
+    """
+    可由多个进程（gunicorn 的各个 worker）同时写入的 RotatingFileHandler。每次写入都持有 <文件名>.lock 上的
+    排他文件锁，轮转和写入在各进程间串行；其他进程轮转后，重新打开新的日志文件再写入。
+    """
+
+    def __init__(self, filename, max_bytes, backup_count):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True)
+        self.lock_file = open(f'{self.baseFilename}.lock', 'a')
+
+    def is_stale(self):
+        """
+        返回:
+            bool: 已打开的文件是否已被其他进程轮转（改名或删除）。
+        """
+        try:
+            return os.fstat(self.stream.fileno()).st_ino != os.stat(self.baseFilename).st_ino
+        except FileNotFoundError:
+            return True
+
+    def emit(self, record):
+        try:
+            portalocker.lock(self.lock_file, portalocker.LOCK_EX)
+            try:
+                if self.stream is not None and self.is_stale():
+                    self.stream.close()
+                    self.stream = None
+                if self.stream is None:
+                    self.stream = self._open()
+                if self.shouldRollover(record):
+                    self.doRollover()
+                logging.FileHandler.emit(self, record)
+            finally:
+                portalocker.unlock(self.lock_file)
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        super().close()
+        self.lock_file.close()
+
+
+class RoutingFileHandler(logging.Handler):
+    """
+    按记录器名称写入不同的日志文件：routes 中的记录器（及其子记录器）写入 <directory>/<文件名>.log，
+    其他记录器写入 <directory>/<default>.log。每个文件按大小轮转，在首次写入时创建。只在日志线程中使用；
+    同一主机上的多个进程可以写入同一目录。
+    """
+
+    def __init__(self, directory, routes, default, formatter, max_bytes, backup_count):
+        super().__init__()
+        self.directory = directory
+        self.routes = routes
+        self.default = default
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.setFormatter(formatter)
+        self.files = {}
+
+    def route(self, name):
+        """
+        返回:
+            str: 记录器名称对应的日志文件名（不含扩展名）。
+        """
+        while name:
+            if name in self.routes:
+                return self.routes[name]
+            name = name.rpartition('.')[0]
+        return self.default
+
+    def emit(self, record):
+        file_name = self.route(record.name)
+        handler = self.files.get(file_name)
+        if handler is None:
+            handler = SharedRotatingFileHandler(os.path.join(self.directory, f'{file_name}.log'), self.max_bytes,
+                                                self.backup_count)
+            handler.setFormatter(self.formatter)
+            self.files[file_name] = handler
+        handler.handle(record)
+
+    def close(self):
+        for handler in self.files.values():
+            handler.close()
+        super().close()
+
+
+def start_log_listener(directory, routes, default='application', json_format=True, max_bytes=1000000, backup_count=5):
+    """
+    启动日志线程：记录日志时只把记录放入无界队列，格式化、写文件和轮转都在后台线程中进行，不阻塞请求。
+    进程退出时写完队列中剩余的记录。每个进程（如各个 gunicorn worker）各自启动一个日志线程，
+    写入和轮转由文件锁在进程间串行，不会丢失或覆盖其他进程的日志。
+
+    参数:
+        directory (str): 日志目录。
+        routes (dict): 记录器名称 -> 日志文件名，如 {'upload': 'upload'}。
+        default (str): 其他记录器（Flask 应用、util 模块）的日志文件名。
+        json_format (bool): 是否每行输出一个 JSON；为 False 时使用原来的文本格式。
+        max_bytes (int): 单个日志文件的大小上限，超出后轮转。
+        backup_count (int): 保留的轮转文件数。
+
+    返回:
+        ContextQueueHandler: 添加到各记录器上的处理器。
+    """
+    os.makedirs(directory, exist_ok=True)
+    formatter = JsonFormatter() if json_format else logging.Formatter(TEXT_FORMAT)
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, RoutingFileHandler(directory, routes, default, formatter, max_bytes,
+                                                           backup_count))
+    listener.start()
+    atexit.register(listener.stop)
+    queue_handler = ContextQueueHandler(log_queue)
+    queue_handler.addFilter(add_log_context)
+    return queue_handler
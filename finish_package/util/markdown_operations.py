@@ -1,353 +1,725 @@
-import os
-import subprocess
-from util.generate import add_cover_page\
-    , add_table_of_contents, update_toc\
-    , apply_headers_footers_to_sections\
-    , add_header_image_to_first_page
-from docx import Document
-from docxcompose.composer import Composer
-
-
-# md -> pdf
-def convert_markdown_to_pdf(input_file, title, version, date, output_file, header_file, logo_path, resource_paths=[],
-                            statement=""):
-    """
-    将Markdown文件转换为PDF文件。
-
-    参数:
-        input_file (str): 输入的Markdown文件路径。
-        title (str): 文档标题。
-        version (str): 版本号。
-        date (str): 文档日期。
-        output_file (str): 输出的PDF文件路径。
-        header_file (str): LaTeX header文件路径。
-        logo_path (str): logo文件路径。
-        resource_paths (list): 资源文件路径列表。
-        statement (str): 可选声明。
-    """
-    # 将路径标准化并替换反斜杠为正斜杠
-    input_file = input_file.replace("\\", "/")
-    output_file = output_file.replace("\\", "/")
-    header_file = header_file.replace("\\", "/")
-    logo_path = logo_path.replace("\\", "/")
-    resource_paths = [path.replace("\\", "/") for path in resource_paths]
-
-    # # 将资源路径列表转换为字符串，使用冒号分隔
-    # resource_path_str = ":".join(resource_paths)
-    # 将资源路径列表转换为字符串，使用操作系统的路径分隔符
-    resource_path_str = os.pathsep.join(resource_paths)
-    print(resource_path_str)
-
-    # 创建一个临时的Markdown文件，用于存储转换过程中的中间数据
-    temp_md_file = os.path.join(os.path.dirname(input_file), "temp.md")
-    with open(temp_md_file, "w", encoding="utf-8") as f:
-        # 写入封面信息，包含标题、作者、日期和logo
-        f.write(f"\\coverpage{{{title}}}{{{version}}}{{{date}}}{{{logo_path}}}\n\n")
-        f.write("\\newpage\n\n")
-
-        # 如果有声明信息，则写入声明信息
-        if statement:
-            f.write(f"\\statementpage{{{statement}}}\n\n")
-            f.write("\\newpage\n\n")
-
-        # 写入目录页
-        f.write("\\tableofcontents\n\n")
-        f.write("\\newpage\n\n")
-
-        # 读取原始Markdown文件内容，并写入临时Markdown文件
-        with open(input_file, "r", encoding="utf-8") as original_md:
-            previous_line = ""
-            for line in original_md:
-                # 每次遇到Markdown标题时在前面添加空行
-                if line.strip().startswith("#"):
-                    if previous_line.strip():
-                        f.write("\n")
-                    f.write("\n" + line.strip() + "\n\n")
-                else:
-                    f.write(line)
-                previous_line = line
-
-    # 打印资源路径字符串，供调试使用
-    print(resource_path_str)
-
-    # Pandoc命令，用于将Markdown转换为PDF
-    command = [
-        "pandoc",
-        temp_md_file,  # 输入文件为临时Markdown文件
-        "-o", output_file,  # 输出文件为指定的PDF文件
-        "--pdf-engine=xelatex",  # 使用xelatex引擎
-        f"--include-in-header={header_file}",  # 包含指定的LaTeX header文件
-        "--resource-path", resource_path_str,  # 资源路径
-        "-V", "tables=true",  # 启用表格支持
-        "-V", "longtable=true",  # 启用长表格支持
-        "-V", "booktabs=true",  # 启用booktabs支持
-        "--listings",  # 启用代码高亮
-        "--highlight-style=pygments",  # 使用pygments代码高亮样式
-        "-V", "geometry:margin=1in",  # 设置页面边距
-    ]
-
-    # 运行Pandoc命令
-    result = subprocess.run(command, cwd=os.path.dirname(input_file), capture_output=True, text=True)
-
-    # 检查命令执行结果，如果出错则打印错误信息
-    if result.returncode != 0:
-        print(f"Error converting {input_file} to {output_file}")
-        print(result.stderr)
-
-    # 删除临时Markdown文件
-    os.remove(temp_md_file)
-
-
-# md -> html
-def convert_markdown_to_html(input_file, output_file, resource_paths=[], title="Document"):
-    """
-    将Markdown文件转换为HTML文件。
-
-    参数:
-        input_file (str): 输入的Markdown文件路径。
-        output_file (str): 输出的HTML文件路径。
-        resource_paths (list): 资源文件路径列表。
-        title (str): 文档标题。
-    """
-    # # 将资源路径列表转换为字符串，使用冒号分隔
-    # resource_path_str = ":".join(resource_paths)
-    # 将资源路径列表转换为字符串，使用操作系统的路径分隔符
-    resource_path_str = os.pathsep.join(resource_paths)
-    print(resource_path_str)
-
-    # 创建一个临时的Markdown文件，用于存储转换过程中的中间数据
-    temp_md_file = os.path.join(os.path.dirname(input_file), "temp.md")
-
-    # 确保styles.css文件存在，如果不存在则创建一个默认的styles.css文件
-    css_path = os.path.join(os.getcwd(), "templates/styles.css")
-    print(css_path)
-    if not os.path.exists(css_path):
-        # 创建并写入改进后的CSS样式
-        with open(css_path, "w", encoding="utf-8") as f:
-            f.write("""
-/* 设置整体页面的字体和背景颜色 */
-body {
-    font-family: Arial, sans-serif;  /* 使用Arial字体，后备字体为sans-serif */
-    margin: 20px;  /* 设置页面边距 */
-    background-color: #f9f9f9;  /* 设置背景颜色 */
-    color: #333;  /* 设置文本颜色 */
-}
-
-/* 设置各级标题的颜色和间距 */
-h1, h2, h3, h4, h5, h6 {
-    color: #444;  /* 设置标题颜色 */
-    margin-top: 1.2em;  /* 设置标题顶部间距 */
-    margin-bottom: 0.6em;  /* 设置标题底部间距 */
-}
-
-/* 设置一级标题的字体大小和底部边框 */
-h1 {
-    font-size: 2.5em;  /* 设置字体大小 */
-    border-bottom: 2px solid #ddd;  /* 设置底部边框 */
-    padding-bottom: 0.3em;  /* 设置底部内边距 */
-}
-
-/* 设置二级标题的字体大小和底部边框 */
-h2 {
-    font-size: 2em;  /* 设置字体大小 */
-    border-bottom: 1px solid #ddd;  /* 设置底部边框 */
-    padding-bottom: 0.2em;  /* 设置底部内边距 */
-}
-
-/* 设置三级标题的字体大小 */
-h3 {
-    font-size: 1.75em;  /* 设置字体大小 */
-}
-
-/* 设置段落的行高和底部间距 */
-p {
-    line-height: 1.6;  /* 设置行高 */
-    margin-bottom: 1.2em;  /* 设置底部间距 */
-}
-
-/* 设置链接的颜色和取消下划线 */
-a {
-    color: #0066cc;  /* 设置链接颜色 */
-    text-decoration: none;  /* 取消下划线 */
-}
-
-/* 设置链接悬停时的下划线 */
-a:hover {
-    text-decoration: underline;  /* 悬停时显示下划线 */
-}
-
-/* 设置无序和有序列表的左边距和底部间距 */
-ul, ol {
-    margin-left: 20px;  /* 设置左边距 */
-    margin-bottom: 1.2em;  /* 设置底部间距 */
-}
-
-/* 设置代码块的字体、背景颜色、内边距和圆角 */
-code {
-    font-family: Consolas, "Courier New", monospace;  /* 设置字体 */
-    background-color: #f4f4f4;  /* 设置背景颜色 */
-    padding: 2px 4px;  /* 设置内边距 */
-    border-radius: 4px;  /* 设置圆角 */
-}
-
-/* 设置预格式化代码块的显示样式 */
-pre code {
-    display: block;  /* 代码块显示为块级元素 */
-    padding: 10px;  /* 设置内边距 */
-    background-color: #f4f4f4;  /* 设置背景颜色 */
-    border: 1px solid #ddd;  /* 设置边框 */
-    border-radius: 4px;  /* 设置圆角 */
-    overflow-x: auto;  /* 超出时水平滚动 */
-}
-
-/* 设置引用块的样式 */
-blockquote {
-    border-left: 4px solid #ddd;  /* 设置左边框 */
-    padding-left: 1em;  /* 设置左内边距 */
-    color: #666;  /* 设置文本颜色 */
-    margin: 1.2em 0;  /* 设置上下间距 */
-    background-color: #f4f4f4;  /* 设置背景颜色 */
-}
-
-/* 设置表格的样式 */
-table {
-    width: 100%;  /* 设置表格宽度为100% */
-    border-collapse: collapse;  /* 合并边框 */
-    margin-bottom: 1.2em;  /* 设置底部间距 */
-}
-
-/* 设置表格、表头和单元格的边框和内边距 */
-table, th, td {
-    border: 1px solid #ddd;  /* 设置边框 */
-    padding: 0.6em;  /* 设置内边距 */
-}
-
-/* 设置表头的背景颜色和对齐方式 */
-th {
-    background-color: #f2f2f2;  /* 设置背景颜色 */
-    text-align: left;  /* 设置左对齐 */
-}
-""")
-
-    # 创建临时Markdown文件并写入文档标题
-    with open(temp_md_file, "w", encoding="utf-8") as f:
-        f.write(f"% {title}\n\n")
-        # 读取原始Markdown文件内容并写入临时Markdown文件
-        with open(input_file, "r", encoding="utf-8") as original_md:
-            previous_line = ""
-            for line in original_md:
-                # 每次遇到Markdown标题时在前面添加空行
-                if line.strip().startswith("#"):
-                    if previous_line.strip():
-                        f.write("\n")
-                    f.write("\n" + line.strip() + "\n\n")
-                else:
-                    f.write(line)
-                previous_line = line
-
-    # Pandoc命令，用于将Markdown转换为HTML
-    command = [
-        "pandoc",
-        temp_md_file,  # 输入文件为临时Markdown文件
-        "-o", output_file,  # 输出文件为指定的HTML文件
-        "--self-contained",  # 生成包含所有资源的单个HTML文件
-        "--resource-path", resource_path_str,  # 资源路径
-        "-c", css_path  # 使用默认的CSS文件进行样式设置
-    ]
-
-    # 运行Pandoc命令
-    result = subprocess.run(command, cwd=os.path.dirname(input_file), capture_output=True, text=True)
-
-    # 检查命令执行结果，如果出错则打印错误信息
-    if result.returncode != 0:
-        print(f"Error converting {input_file} to {output_file}")
-        print(result.stderr)
-
-    # 删除临时Markdown文件
-    os.remove(temp_md_file)
-
-
-# md -> docx
-def convert_md_to_docx_with_toc_and_template(md_file_path, docx_file_path, template_file_path, title, version, date,
-                                             left_header, right_header, statement, resource_paths, logo_path):
-    """
-    将Markdown文件转换为带有目录和模板的DOCX文件。
-
-    参数:
-        md_file_path (str): 输入的Markdown文件路径。
-        docx_file_path (str): 输出的DOCX文件路径。
-        template_file_path (str): DOCX模板文件路径。
-        title (str): 文档标题。
-        version (str): 版本号。
-        date (str): 文档日期。
-        left_header (str): 左页眉内容。
-        right_header (str): 右页眉内容。
-        statement (str): 可选声明。
-        resource_paths (list): 资源文件路径列表。
-    """
-    # 临时DOCX文件路径
-    temp_docx_file_path = 'temp.docx'
-    # 将资源路径列表转换为字符串，使用冒号分隔
-    # resource_path_str = ":".join(resource_paths)
-    resource_path_str = os.pathsep.join(resource_paths)
-
-    print(resource_path_str)
-
-    # Pandoc命令
-    pandoc_command = [
-        'pandoc',
-        md_file_path,  # 输入文件为Markdown文件
-        '-o', temp_docx_file_path,  # 输出文件为临时DOCX文件
-        '--toc',  # 启用目录
-        '--toc-depth=3',  # 目录深度为3级
-        '--reference-doc', template_file_path,  # 使用指定的DOCX模板
-        '--resource-path', resource_path_str,  # 资源路径
-    ]
-
-    # 运行Pandoc命令
-    result = subprocess.run(pandoc_command, capture_output=True, text=True)
-
-    # 检查命令执行结果
-    if result.returncode == 0:
-        print(f"Converted {md_file_path} to temporary {temp_docx_file_path} with template")
-
-        # 创建新的文档并添加封面、声明和目录
-        final_doc = Document()
-        add_cover_page(final_doc, title, version, date, statement)
-        add_table_of_contents(final_doc)
-        final_doc_path = 'final_temp.docx'
-        final_doc.save(final_doc_path)
-
-        # 打开生成的临时文档
-        main_doc = Document(temp_docx_file_path)
-
-        # 使用 Composer 合并文档
-        composer = Composer(Document(final_doc_path))
-        composer.append(main_doc)
-        composer.save(docx_file_path)
-        print(f"Added cover page and TOC to {docx_file_path}")
-
-        # 更新目录
-        update_toc(docx_file_path)
-
-        # 重新应用页眉和页脚
-        final_doc = Document(docx_file_path)
-        apply_headers_footers_to_sections(final_doc, left_header, right_header)
-        final_doc.save(docx_file_path)
-
-        # 打开最终文档
-        doc = Document(docx_file_path)
-
-        # # 为文档中的所有图片添加标题
-        # add_image_captions(doc)
-
-        # 添加首页页眉图片
-        doc = add_header_image_to_first_page(doc, logo_path, right_text=right_header)
-
-        doc.save(docx_file_path)
-
-        # 删除临时DOCX文件s
-        os.remove(final_doc_path)
-        os.remove(temp_docx_file_path)
-    else:
-        print(f"Error in conversion: {result.stderr}")
\ No newline at end of file
+import logging
+import os
+import re
+import shutil
+import tempfile
+from util.generate import add_cover_page\
+    , add_table_of_contents, update_toc\
+    , apply_headers_footers_to_sections\
+    , add_header_image_to_first_page
+from util.image_operations import prepare_markdown_images, rewrite_image_references\
+    , find_image_references, resolve_image_path\
+    , PDF_TEXT_WIDTH_INCHES, DOCX_TEXT_WIDTH_INCHES, PDF_PAPER, PDF_MARGIN_MM
+from util.file_operations import store_content_addressed, get_content_addressed_path
+from util.compress_operations import minify_css, minify_html, minify_file, precompress_file
+from util.html_site import build_html_site, copy_site_asset, zip_directory
+from util.process_operations import run_process, run_coroutine_sync, run_in_thread
+from util.metrics import time_stage
+from util.tracing import span
+from docx import Document
+from docxcompose.composer import Composer
+
+
+logger = logging.getLogger(__name__)
+
+# xelatex 最多运行的次数，目录和交叉引用需要多次运行才能稳定
+XELATEX_MAX_RUNS = 3
+
+# xelatex 日志中提示需要再次运行的信息
+LATEX_RERUN_PATTERN = re.compile(r'Rerun to get|Label\(s\) may have changed|Rerun LaTeX')
+
+
+def latex_needs_rerun(work_dir):
+    """
+    根据 xelatex 日志判断是否需要再次运行。
+
+    参数:
+        work_dir (str): xelatex 工作目录。
+
+    返回:
+        bool: 是否需要再次运行。
+    """
+    with open(os.path.join(work_dir, "document.log"), "r", encoding="utf-8", errors="replace") as f:
+        return LATEX_RERUN_PATTERN.search(f.read()) is not None
+
+
+def copy_markdown_with_spaced_headings(input_file, f, image_map=None):
+    """
+    将Markdown文件内容写入临时文件，在每个标题前后添加空行，并替换图片引用路径。
+
+    参数:
+        input_file (str): 输入的Markdown文件路径。
+        f: 已打开的临时Markdown文件对象。
+        image_map (dict): 原图片引用路径到新路径的映射。
+    """
+    with open(input_file, "r", encoding="utf-8") as original_md:
+        previous_line = ""
+        for line in original_md:
+            # 每次遇到Markdown标题时在前面添加空行
+            if line.strip().startswith("#"):
+                if previous_line.strip():
+                    f.write("\n")
+                f.write("\n" + line.strip() + "\n\n")
+            else:
+                f.write(rewrite_image_references(line, image_map))
+            previous_line = line
+
+
+# md -> pdf
+async def convert_markdown_to_pdf_async(input_file, title, version, date, output_file, header_file, logo_path,
+                                        resource_paths=[], statement="", image_dpi=None, image_cache_dir=None,
+                                        image_workers=4, limits=None):
+    """
+    将Markdown文件转换为PDF文件（异步）。
+
+    参数:
+        input_file (str): 输入的Markdown文件路径。
+        title (str): 文档标题。
+        version (str): 版本号。
+        date (str): 文档日期。
+        output_file (str): 输出的PDF文件路径。
+        header_file (str): LaTeX header文件路径。
+        logo_path (str): logo文件路径。
+        resource_paths (list): 资源文件路径列表。
+        statement (str): 可选声明。
+        image_dpi (int): 图片目标分辨率，为 None 时不缩小图片。
+        image_cache_dir (str): 处理后图片的缓存目录，xelatex 不支持的图片格式也在此转换。
+        image_workers (int): 图片处理线程池大小。
+        limits (dict): 子进程资源限制，见 process_operations.run_process。
+    """
+    # 将路径标准化并替换反斜杠为正斜杠
+    input_file = input_file.replace("\\", "/")
+    output_file = output_file.replace("\\", "/")
+    header_file = header_file.replace("\\", "/")
+    logo_path = logo_path.replace("\\", "/")
+    resource_paths = [path.replace("\\", "/") for path in resource_paths]
+
+    # # 将资源路径列表转换为字符串，使用冒号分隔
+    # resource_path_str = ":".join(resource_paths)
+    # 将资源路径列表转换为字符串，使用操作系统的路径分隔符
+    resource_path_str = os.pathsep.join(resource_paths)
+    logger.debug(f"Resource paths: {resource_path_str}")
+
+    # 创建一个临时的Markdown文件，用于存储转换过程中的中间数据
+    temp_md_file = os.path.join(os.path.dirname(input_file), "temp.md")
+
+    def write_temp_markdown():
+        # 将 xelatex 不支持的图片格式转换为 PDF/PNG，并按版心宽度和目标 DPI 缩小图片，
+        # 得到原引用路径到处理后图片的映射
+        image_map = {}
+        if image_cache_dir:
+            with open(input_file, "r", encoding="utf-8") as original_md:
+                image_map = prepare_markdown_images(original_md.read(), resource_paths, image_cache_dir,
+                                                    image_dpi, PDF_TEXT_WIDTH_INCHES, image_workers, normalize=True)
+
+        with open(temp_md_file, "w", encoding="utf-8") as f:
+            # 写入封面信息，包含标题、作者、日期和logo
+            f.write(f"\\coverpage{{{title}}}{{{version}}}{{{date}}}{{{logo_path}}}\n\n")
+            f.write("\\newpage\n\n")
+
+            # 如果有声明信息，则写入声明信息
+            if statement:
+                f.write(f"\\statementpage{{{statement}}}\n\n")
+                f.write("\\newpage\n\n")
+
+            # 写入目录页
+            f.write("\\tableofcontents\n\n")
+            f.write("\\newpage\n\n")
+
+            # 读取原始Markdown文件内容，并写入临时Markdown文件
+            copy_markdown_with_spaced_headings(input_file, f, image_map)
+
+    # 图片处理和文件读写在线程池中执行，避免阻塞事件循环
+    with time_stage('preprocess', 'pdf'):
+        await run_in_thread(write_temp_markdown)
+
+    # 记录资源路径字符串，供调试使用
+    logger.debug(f"Resource paths: {resource_path_str}")
+
+    # pandoc 只生成 LaTeX 源文件，xelatex 单独运行，以便对其设置内存限制
+    # （pandoc 的 GHC 运行时会预先保留大量虚拟地址空间，其子进程无法继承 RLIMIT_AS）
+    work_dir = tempfile.mkdtemp(prefix="pdf-", dir=os.path.dirname(input_file))
+    tex_file = os.path.join(work_dir, "document.tex")
+
+    # Pandoc命令，用于将Markdown转换为LaTeX
+    command = [
+        "pandoc",
+        temp_md_file,  # 输入文件为临时Markdown文件
+        "-o", tex_file,  # 输出LaTeX源文件
+        "--standalone",  # 生成完整的LaTeX文档
+        "--extract-media", os.path.join(work_dir, "media"),  # 将图片复制到工作目录，供xelatex引用
+        f"--include-in-header={header_file}",  # 包含指定的LaTeX header文件
+        "--resource-path", resource_path_str,  # 资源路径
+        "-V", "tables=true",  # 启用表格支持
+        "-V", "longtable=true",  # 启用长表格支持
+        "-V", "booktabs=true",  # 启用booktabs支持
+        "--listings",  # 启用代码高亮
+        "--highlight-style=pygments",  # 使用pygments代码高亮样式
+        "-V", f"geometry:{PDF_PAPER}",  # 纸张大小，与 header 文件中的 \geometry 一致
+        "-V", f"geometry:margin={PDF_MARGIN_MM}mm",  # 设置页面边距
+    ]
+
+    # xelatex命令，与 pandoc --pdf-engine=xelatex 的调用方式一致
+    xelatex_command = ["xelatex", "-halt-on-error", "-interaction=nonstopmode", "document.tex"]
+
+    # 运行Pandoc和xelatex，无论成功、失败还是被取消都删除临时文件
+    try:
+        with time_stage('pandoc', 'pdf') as outcome:
+            result = await run_process(command, cwd=os.path.dirname(input_file), limits=limits)
+            if result.returncode != 0:
+                outcome['outcome'] = 'failure'
+        with time_stage('xelatex', 'pdf') as outcome:
+            for run in range(XELATEX_MAX_RUNS):
+                # 第一次运行只生成目录，至少需要运行两次
+                if result.returncode != 0 or (run >= 2 and not latex_needs_rerun(work_dir)):
+                    break
+                result = await run_process(xelatex_command, cwd=work_dir, limits=limits)
+            if result.returncode != 0:
+                outcome['outcome'] = 'failure'
+        if result.returncode == 0:
+            shutil.move(os.path.join(work_dir, "document.pdf"), output_file)
+    finally:
+        os.remove(temp_md_file)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    # 检查命令执行结果，如果出错则记录错误信息
+    if result.returncode != 0:
+        logger.error(f"Error converting {input_file} to {output_file}:\n{result.stderr or result.stdout[-2000:]}")
+
+
+def convert_markdown_to_pdf(*args, **kwargs):
+    """
+    将Markdown文件转换为PDF文件，参数与 convert_markdown_to_pdf_async 相同。
+    """
+    return run_coroutine_sync(convert_markdown_to_pdf_async(*args, **kwargs))
+
+
+# 尚未声明加载方式的 <img> 标签
+IMG_WITHOUT_LOADING_PATTERN = re.compile(r'<img\b(?![^>]*\bloading\s*=)', re.IGNORECASE)
+
+
+def add_lazy_loading(html_file):
+    """
+    为HTML文件中的图片添加延迟加载属性。
+
+    参数:
+        html_file (str): HTML文件路径。
+    """
+    with open(html_file, "r", encoding="utf-8") as f:
+        html = f.read()
+    html = IMG_WITHOUT_LOADING_PATTERN.sub('<img loading="lazy" decoding="async"', html)
+    with open(html_file, "w", encoding="utf-8") as f:
+        f.write(html)
+
+
+def ensure_html_stylesheet():
+    """
+    确保HTML使用的styles.css文件存在，如果不存在则创建一个默认的styles.css文件。
+
+    返回:
+        str: styles.css文件路径。
+    """
+    css_path = os.path.join(os.getcwd(), "templates/styles.css")
+    logger.debug(f"Stylesheet: {css_path}")
+    if not os.path.exists(css_path):
+        # 创建并写入改进后的CSS样式
+        with open(css_path, "w", encoding="utf-8") as f:
+            f.write("""
+/* 设置整体页面的字体和背景颜色 */
+body {
+    font-family: Arial, sans-serif;  /* 使用Arial字体，后备字体为sans-serif */
+    margin: 20px;  /* 设置页面边距 */
+    background-color: #f9f9f9;  /* 设置背景颜色 */
+    color: #333;  /* 设置文本颜色 */
+}
+
+/* 设置各级标题的颜色和间距 */
+h1, h2, h3, h4, h5, h6 {
+    color: #444;  /* 设置标题颜色 */
+    margin-top: 1.2em;  /* 设置标题顶部间距 */
+    margin-bottom: 0.6em;  /* 设置标题底部间距 */
+}
+
+/* 设置一级标题的字体大小和底部边框 */
+h1 {
+    font-size: 2.5em;  /* 设置字体大小 */
+    border-bottom: 2px solid #ddd;  /* 设置底部边框 */
+    padding-bottom: 0.3em;  /* 设置底部内边距 */
+}
+
+/* 设置二级标题的字体大小和底部边框 */
+h2 {
+    font-size: 2em;  /* 设置字体大小 */
+    border-bottom: 1px solid #ddd;  /* 设置底部边框 */
+    padding-bottom: 0.2em;  /* 设置底部内边距 */
+}
+
+/* 设置三级标题的字体大小 */
+h3 {
+    font-size: 1.75em;  /* 设置字体大小 */
+}
+
+/* 设置段落的行高和底部间距 */
+p {
+    line-height: 1.6;  /* 设置行高 */
+    margin-bottom: 1.2em;  /* 设置底部间距 */
+}
+
+/* 设置链接的颜色和取消下划线 */
+a {
+    color: #0066cc;  /* 设置链接颜色 */
+    text-decoration: none;  /* 取消下划线 */
+}
+
+/* 设置链接悬停时的下划线 */
+a:hover {
+    text-decoration: underline;  /* 悬停时显示下划线 */
+}
+
+/* 设置无序和有序列表的左边距和底部间距 */
+ul, ol {
+    margin-left: 20px;  /* 设置左边距 */
+    margin-bottom: 1.2em;  /* 设置底部间距 */
+}
+
+/* 设置代码块的字体、背景颜色、内边距和圆角 */
+code {
+    font-family: Consolas, "Courier New", monospace;  /* 设置字体 */
+    background-color: #f4f4f4;  /* 设置背景颜色 */
+    padding: 2px 4px;  /* 设置内边距 */
+    border-radius: 4px;  /* 设置圆角 */
+}
+
+/* 设置预格式化代码块的显示样式 */
+pre code {
+    display: block;  /* 代码块显示为块级元素 */
+    padding: 10px;  /* 设置内边距 */
+    background-color: #f4f4f4;  /* 设置背景颜色 */
+    border: 1px solid #ddd;  /* 设置边框 */
+    border-radius: 4px;  /* 设置圆角 */
+    overflow-x: auto;  /* 超出时水平滚动 */
+}
+
+/* 设置引用块的样式 */
+blockquote {
+    border-left: 4px solid #ddd;  /* 设置左边框 */
+    padding-left: 1em;  /* 设置左内边距 */
+    color: #666;  /* 设置文本颜色 */
+    margin: 1.2em 0;  /* 设置上下间距 */
+    background-color: #f4f4f4;  /* 设置背景颜色 */
+}
+
+/* 设置表格的样式 */
+table {
+    width: 100%;  /* 设置表格宽度为100% */
+    border-collapse: collapse;  /* 合并边框 */
+    margin-bottom: 1.2em;  /* 设置底部间距 */
+}
+
+/* 设置表格、表头和单元格的边框和内边距 */
+table, th, td {
+    border: 1px solid #ddd;  /* 设置边框 */
+    padding: 0.6em;  /* 设置内边距 */
+}
+
+/* 设置表头的背景颜色和对齐方式 */
+th {
+    background-color: #f2f2f2;  /* 设置背景颜色 */
+    text-align: left;  /* 设置左对齐 */
+}
+""")
+
+    return css_path
+
+
+def ensure_minified_stylesheet(css_path):
+    """
+    生成压缩后的样式文件 styles.min.css，原文件更新后自动重新生成。
+
+    参数:
+        css_path (str): styles.css文件路径。
+
+    返回:
+        str: styles.min.css文件路径。
+    """
+    min_css_path = os.path.splitext(css_path)[0] + ".min.css"
+    if not os.path.exists(min_css_path) or os.path.getmtime(min_css_path) < os.path.getmtime(css_path):
+        with open(css_path, "r", encoding="utf-8") as f:
+            css = f.read()
+        temp_path = f"{min_css_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(minify_css(css))
+        os.replace(temp_path, min_css_path)
+    return min_css_path
+
+
+# md -> html
+async def convert_markdown_to_html_async(input_file, output_file, resource_paths=[], title="Document",
+                                         html_mode="self_contained", asset_store_dir=None, asset_url_prefix="/cas/",
+                                         minify=False, precompress=False, limits=None):
+    """
+    将Markdown文件转换为HTML文件（异步）。
+
+    参数:
+        input_file (str): 输入的Markdown文件路径。
+        output_file (str): 输出的HTML文件路径。
+        resource_paths (list): 资源文件路径列表。
+        title (str): 文档标题。
+        html_mode (str): "self_contained" 将图片和CSS以base64内嵌到单个文件中；
+            "linked" 将图片和CSS按内容哈希存入 asset_store_dir，页面中只保留链接。
+        asset_store_dir (str): linked 模式下的共享资源目录。
+        asset_url_prefix (str): linked 模式下资源的访问URL前缀。
+        minify (bool): 是否压缩输出的HTML和使用的CSS。
+        precompress (bool): 是否在输出文件旁生成 .gz/.br 预压缩文件。
+        limits (dict): 子进程资源限制，见 process_operations.run_process。
+    """
+    # # 将资源路径列表转换为字符串，使用冒号分隔
+    # resource_path_str = ":".join(resource_paths)
+    # 将资源路径列表转换为字符串，使用操作系统的路径分隔符
+    resource_path_str = os.pathsep.join(resource_paths)
+    logger.debug(f"Resource paths: {resource_path_str}")
+
+    # 创建一个临时的Markdown文件，用于存储转换过程中的中间数据
+    temp_md_file = os.path.join(os.path.dirname(input_file), "temp_html.md")
+
+    def write_temp_markdown():
+        # 确保styles.css文件存在
+        css_path = ensure_html_stylesheet()
+        if minify:
+            css_path = ensure_minified_stylesheet(css_path)
+
+        # linked 模式下将图片和CSS存入共享资源目录，并改为引用内容哈希URL
+        image_map = {}
+        css_href = css_path
+        if html_mode == "linked":
+            with open(input_file, "r", encoding="utf-8") as original_md:
+                md_text = original_md.read()
+            for reference in find_image_references(md_text):
+                source_path = resolve_image_path(reference, resource_paths)
+                if source_path:
+                    image_map[reference] = asset_url_prefix + store_content_addressed(source_path, asset_store_dir)
+            css_name = store_content_addressed(css_path, asset_store_dir)
+            css_href = asset_url_prefix + css_name
+            if precompress and not os.path.exists(get_content_addressed_path(css_name, asset_store_dir) + ".gz"):
+                precompress_file(get_content_addressed_path(css_name, asset_store_dir))
+
+        # 创建临时Markdown文件并写入文档标题
+        with open(temp_md_file, "w", encoding="utf-8") as f:
+            f.write(f"% {title}\n\n")
+            # 读取原始Markdown文件内容并写入临时Markdown文件
+            copy_markdown_with_spaced_headings(input_file, f, image_map)
+        return css_href
+
+    # 资源存储和文件读写在线程池中执行，避免阻塞事件循环
+    with time_stage('preprocess', 'html'):
+        css_href = await run_in_thread(write_temp_markdown)
+
+    # Pandoc命令，用于将Markdown转换为HTML
+    command = [
+        "pandoc",
+        temp_md_file,  # 输入文件为临时Markdown文件
+        "-o", output_file,  # 输出文件为指定的HTML文件
+        "--resource-path", resource_path_str,  # 资源路径
+        "-c", css_href  # 使用默认的CSS文件进行样式设置
+    ]
+    if html_mode == "linked":
+        command.append("--standalone")  # 生成完整的HTML页面，资源以链接形式引用
+    else:
+        command.append("--self-contained")  # 生成包含所有资源的单个HTML文件
+
+    # 运行Pandoc命令，无论成功、失败还是被取消都删除临时Markdown文件
+    try:
+        with time_stage('pandoc', 'html') as outcome:
+            result = await run_process(command, cwd=os.path.dirname(input_file), limits=limits)
+            if result.returncode != 0:
+                outcome['outcome'] = 'failure'
+    finally:
+        os.remove(temp_md_file)
+
+    # 检查命令执行结果，如果出错则记录错误信息
+    if result.returncode != 0:
+        logger.error(f"Error converting {input_file} to {output_file}:\n{result.stderr}")
+        return
+
+    # 延迟加载、压缩和预压缩在线程池中执行
+    def postprocess():
+        if html_mode == "linked":
+            add_lazy_loading(output_file)
+        if minify:
+            minify_file(output_file, minify_html)
+        if precompress:
+            precompress_file(output_file)
+
+    with time_stage('postprocess', 'html'):
+        await run_in_thread(postprocess)
+
+
+def convert_markdown_to_html(*args, **kwargs):
+    """
+    将Markdown文件转换为HTML文件，参数与 convert_markdown_to_html_async 相同。
+    """
+    return run_coroutine_sync(convert_markdown_to_html_async(*args, **kwargs))
+
+
+# md -> 多页html站点
+async def convert_markdown_to_html_site_async(input_file, output_file, resource_paths=[], title="Document",
+                                              split_level=2, minify=False, precompress=False, limits=None):
+    """
+    将Markdown文件转换为按一级或二级标题拆分的多页HTML站点，并打包为ZIP文件（异步）。
+
+    站点目录与ZIP文件同名（不含扩展名），包含目录页 index.html、每个章节一个页面，
+    以及所有页面共享的 assets 目录（样式和图片）。
+
+    参数:
+        input_file (str): 输入的Markdown文件路径。
+        output_file (str): 输出的ZIP文件路径。
+        resource_paths (list): 资源文件路径列表。
+        title (str): 文档标题。
+        split_level (int): 拆分页面的标题级别（1 或 2）。
+        minify (bool): 是否压缩站点中的HTML和CSS。
+        precompress (bool): 是否为站点中的HTML和CSS生成 .gz/.br 预压缩文件。
+        limits (dict): 子进程资源限制，见 process_operations.run_process。
+    """
+    resource_path_str = os.pathsep.join(resource_paths)
+
+    site_dir = os.path.splitext(output_file)[0]
+    assets_dir = os.path.join(site_dir, "assets")
+    # 创建一个临时的Markdown文件，用于存储转换过程中的中间数据
+    temp_md_file = os.path.join(os.path.dirname(input_file), "temp_site.md")
+
+    def write_temp_markdown():
+        # 重新创建站点目录
+        if os.path.exists(site_dir):
+            shutil.rmtree(site_dir)
+        os.makedirs(assets_dir)
+
+        # 将图片复制到站点共享的 assets 目录，并改为相对路径引用
+        image_map = {}
+        with open(input_file, "r", encoding="utf-8") as original_md:
+            md_text = original_md.read()
+        for reference in find_image_references(md_text):
+            source_path = resolve_image_path(reference, resource_paths)
+            if source_path:
+                image_map[reference] = copy_site_asset(source_path, assets_dir)
+
+        with open(temp_md_file, "w", encoding="utf-8") as f:
+            copy_markdown_with_spaced_headings(input_file, f, image_map)
+
+    # 图片复制和文件读写在线程池中执行，避免阻塞事件循环
+    with time_stage('preprocess', 'html'):
+        await run_in_thread(write_temp_markdown)
+
+    # Pandoc命令，生成按章节包裹的HTML片段
+    fragment_file = os.path.join(site_dir, "fragment.html")
+    command = [
+        "pandoc",
+        temp_md_file,  # 输入文件为临时Markdown文件
+        "-o", fragment_file,  # 输出HTML片段
+        "-t", "html5",
+        "--section-divs",  # 用 <section> 包裹每个章节，便于按章节拆分
+        "--reference-location=section",  # 脚注放在所属章节末尾
+        "--wrap=none",
+        "--resource-path", resource_path_str,  # 资源路径
+    ]
+
+    # 运行Pandoc命令，无论成功、失败还是被取消都删除临时Markdown文件
+    try:
+        with time_stage('pandoc', 'html') as outcome:
+            result = await run_process(command, cwd=os.path.dirname(input_file), limits=limits)
+            if result.returncode != 0:
+                outcome['outcome'] = 'failure'
+    finally:
+        os.remove(temp_md_file)
+
+    # 检查命令执行结果，如果出错则记录错误信息
+    if result.returncode != 0:
+        logger.error(f"Error converting {input_file} to {output_file}:\n{result.stderr}")
+        return
+
+    # 拆分页面、压缩和打包在线程池中执行
+    def build_site():
+        with open(fragment_file, "r", encoding="utf-8") as f:
+            fragment = f.read()
+        os.remove(fragment_file)
+
+        # 确保styles.css文件存在，并拆分页面
+        build_html_site(fragment, site_dir, title, ensure_html_stylesheet(), split_level)
+
+        # 压缩页面和样式，并生成预压缩文件供在线浏览使用
+        for root, _, files in os.walk(site_dir):
+            for name in files:
+                file_path = os.path.join(root, name)
+                if name.endswith((".html", ".css")):
+                    if minify:
+                        minify_file(file_path, minify_html if name.endswith(".html") else minify_css)
+                    if precompress:
+                        precompress_file(file_path)
+
+        # 打包站点
+        zip_directory(site_dir, output_file)
+
+    with time_stage('postprocess', 'html'):
+        await run_in_thread(build_site)
+
+
+def convert_markdown_to_html_site(*args, **kwargs):
+    """
+    将Markdown文件转换为多页HTML站点，参数与 convert_markdown_to_html_site_async 相同。
+    """
+    return run_coroutine_sync(convert_markdown_to_html_site_async(*args, **kwargs))
+
+
+def compose_docx_with_cover(pandoc_docx_path, docx_file_path, title, version, date, left_header, right_header,
+                            statement, logo_path):
+    """
+    为 pandoc 生成的DOCX文件添加封面、声明、目录、页眉页脚和首页页眉图片。
+
+    参数:
+        pandoc_docx_path (str): pandoc 生成的DOCX文件路径。
+        docx_file_path (str): 输出的DOCX文件路径。
+        title (str): 文档标题。
+        version (str): 版本号。
+        date (str): 文档日期。
+        left_header (str): 左页眉内容。
+        right_header (str): 右页眉内容。
+        statement (str): 可选声明。
+        logo_path (str): logo文件路径。
+    """
+    with time_stage('docx_compose', 'docx'):
+        # 创建新的文档并添加封面、声明和目录
+        final_doc = Document()
+        add_cover_page(final_doc, title, version, date, statement)
+        add_table_of_contents(final_doc)
+        final_doc_path = os.path.splitext(docx_file_path)[0] + '.cover.docx'
+        final_doc.save(final_doc_path)
+
+        # 打开生成的临时文档
+        main_doc = Document(pandoc_docx_path)
+
+        # 使用 Composer 合并文档
+        composer = Composer(Document(final_doc_path))
+        with span('Composer.append'):
+            composer.append(main_doc)
+        composer.save(docx_file_path)
+        logger.info(f"Added cover page and TOC to {docx_file_path}")
+
+    # 更新目录
+    with time_stage('docx_toc', 'docx'), span('update_toc'):
+        update_toc(docx_file_path)
+
+    with time_stage('docx_headers', 'docx'):
+        # 重新应用页眉和页脚
+        final_doc = Document(docx_file_path)
+        with span('apply_headers_footers_to_sections'):
+            apply_headers_footers_to_sections(final_doc, left_header, right_header)
+        final_doc.save(docx_file_path)
+
+        # 打开最终文档
+        doc = Document(docx_file_path)
+
+        # # 为文档中的所有图片添加标题
+        # add_image_captions(doc)
+
+        # 添加首页页眉图片
+        with span('add_header_image_to_first_page'):
+            doc = add_header_image_to_first_page(doc, logo_path, right_text=right_header)
+
+        doc.save(docx_file_path)
+
+    # 删除临时DOCX文件
+    os.remove(final_doc_path)
+
+
+# md -> docx
+async def convert_md_to_docx_with_toc_and_template_async(md_file_path, docx_file_path, template_file_path, title,
+                                                         version, date, left_header, right_header, statement,
+                                                         resource_paths, logo_path, image_dpi=None,
+                                                         image_cache_dir=None, image_workers=4, limits=None):
+    """
+    将Markdown文件转换为带有目录和模板的DOCX文件（异步）。
+
+    参数:
+        md_file_path (str): 输入的Markdown文件路径。
+        docx_file_path (str): 输出的DOCX文件路径。
+        template_file_path (str): DOCX模板文件路径。
+        title (str): 文档标题。
+        version (str): 版本号。
+        date (str): 文档日期。
+        left_header (str): 左页眉内容。
+        right_header (str): 右页眉内容。
+        statement (str): 可选声明。
+        resource_paths (list): 资源文件路径列表。
+        logo_path (str): logo文件路径。
+        image_dpi (int): 图片目标分辨率，为 None 时不优化图片。
+        image_cache_dir (str): 优化后图片的缓存目录。
+        image_workers (int): 图片优化线程池大小。
+        limits (dict): 子进程资源限制，见 process_operations.run_process。
+    """
+    # 临时DOCX文件放在输出文件旁，避免并发转换互相覆盖
+    temp_docx_file_path = os.path.splitext(docx_file_path)[0] + '.pandoc.docx'
+    # 将资源路径列表转换为字符串，使用冒号分隔
+    # resource_path_str = ":".join(resource_paths)
+    resource_path_str = os.pathsep.join(resource_paths)
+
+    logger.debug(f"Resource paths: {resource_path_str}")
+
+    # 按版心宽度和目标 DPI 缩小图片，有替换时写入临时Markdown文件
+    def write_temp_markdown():
+        if not (image_dpi and image_cache_dir):
+            return md_file_path
+        with open(md_file_path, "r", encoding="utf-8") as original_md:
+            md_text = original_md.read()
+        image_map = prepare_markdown_images(md_text, resource_paths, image_cache_dir,
+                                            image_dpi, DOCX_TEXT_WIDTH_INCHES, image_workers)
+        if not image_map:
+            return md_file_path
+        temp_md_file = os.path.join(os.path.dirname(md_file_path), "temp_docx.md")
+        with open(temp_md_file, "w", encoding="utf-8") as f:
+            f.write(rewrite_image_references(md_text, image_map))
+        return temp_md_file
+
+    # 图片处理在线程池中执行，避免阻塞事件循环
+    with time_stage('preprocess', 'docx'):
+        pandoc_input_file = await run_in_thread(write_temp_markdown)
+
+    # Pandoc命令
+    pandoc_command = [
+        'pandoc',
+        pandoc_input_file,  # 输入文件为Markdown文件
+        '-o', temp_docx_file_path,  # 输出文件为临时DOCX文件
+        '--toc',  # 启用目录
+        '--toc-depth=3',  # 目录深度为3级
+        '--reference-doc', template_file_path,  # 使用指定的DOCX模板
+        '--resource-path', resource_path_str,  # 资源路径
+    ]
+
+    # 运行Pandoc命令，无论成功、失败还是被取消都删除临时Markdown文件
+    try:
+        with time_stage('pandoc', 'docx') as outcome:
+            result = await run_process(pandoc_command, limits=limits)
+            if result.returncode != 0:
+                outcome['outcome'] = 'failure'
+    finally:
+        if pandoc_input_file != md_file_path:
+            os.remove(pandoc_input_file)
+
+    # 检查命令执行结果
+    if result.returncode != 0:
+        logger.error(f"Error in conversion: {result.stderr}")
+        return
+
+    logger.info(f"Converted {md_file_path} to temporary {temp_docx_file_path} with template")
+
+    # 合并封面和更新目录在线程池中执行
+    try:
+        await run_in_thread(compose_docx_with_cover, temp_docx_file_path, docx_file_path, title, version, date,
+                                left_header, right_header, statement, logo_path)
+    finally:
+        os.remove(temp_docx_file_path)
+
+
+def convert_md_to_docx_with_toc_and_template(*args, **kwargs):
+    """
+    将Markdown文件转换为带有目录和模板的DOCX文件，参数与 convert_md_to_docx_with_toc_and_template_async 相同。
+    """
+    return run_coroutine_sync(convert_md_to_docx_with_toc_and_template_async(*args, **kwargs))
@@ -0,0 +1,261 @@
+import asyncio
+import logging
+import os
+import re
+import time
+from contextlib import contextmanager
+
+
+# Prometheus 指标对象，由 configure_metrics 创建；为 None（未调用或未安装 prometheus_client）时各记录函数不做任何事
+_metrics = None
+
+# 多进程模式下各进程（gunicorn 的工作进程、同一主机上的 worker.py）写入指标文件的目录，由 generate_metrics 合并输出
+_directory = None
+
+# 阶段耗时的分桶（秒）：从解压、模板生成等毫秒级操作到 xelatex 的数分钟
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+# 上传大小的分桶（字节）：64 KB 到 1 GB
+UPLOAD_BUCKETS = tuple(64 * 1024 * 4 ** exponent for exponent in range(8))
+
+logger = logging.getLogger(__name__)
+
+# 指标文件名中的进程号，如 counter_1234.db、gauge_livesum_1234.db
+METRIC_FILE_PID_PATTERN = re.compile(r'_(\d+)\.db$')
+
+
+def configure_metrics(directory=None, reset=False):
+    """
+    创建指标。必须在导入 prometheus_client 之前调用：多进程模式由环境变量 PROMETHEUS_MULTIPROC_DIR 决定，
+    prometheus_client 只在导入时读取一次。
+
+    参数:
+        directory (str): 多进程模式下指标文件的目录，所有进程使用同一个目录；为 None 时只统计本进程。
+        reset (bool): 是否先删除已退出的进程留下的指标文件（只应在服务启动时由单个进程执行）。
+
+    返回:
+        bool: 是否已启用指标；未安装 prometheus_client 时为 False。
+    """
+    global _metrics, _directory
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        if reset:
+            remove_dead_process_files(directory)
+        os.environ['PROMETHEUS_MULTIPROC_DIR'] = directory
+    try:
+        from prometheus_client import Counter, Gauge, Histogram
+    except ImportError:  # 未安装 prometheus_client 时不收集指标
+        return False
+    _directory = directory
+    _metrics = {
+        'upload': Histogram('md2doc_upload_size_bytes', '上传的压缩包大小', ['outcome'], buckets=UPLOAD_BUCKETS),
+        'stage': Histogram('md2doc_stage_duration_seconds', '上传和转换各阶段的耗时', ['stage', 'format', 'outcome'],
+                           buckets=STAGE_BUCKETS),
+        'conversion': Histogram('md2doc_conversion_duration_seconds', '转换请求从提交到返回的耗时',
+                                ['format', 'outcome'], buckets=STAGE_BUCKETS),
+        'cache': Counter('md2doc_conversion_cache_total',
+                         '转换请求的结果来源：hit 为已完成的相同转换，shared 为正在进行的相同转换，miss 为新转换',
+                         ['format', 'result']),
+        'jobs': Gauge('md2doc_conversion_jobs', '等待槽位和正在运行的转换作业数', ['state'],
+                      multiprocess_mode='livesum'),
+        'served': Counter('md2doc_served_bytes_total', '发送给客户端的响应体字节数（含交由前置服务器发送的文件）',
+                          ['endpoint', 'encoding']),
+        'requests': Histogram('md2doc_request_duration_seconds', 'HTTP 请求的处理耗时', ['endpoint', 'status'],
+                              buckets=STAGE_BUCKETS),
+        'storage': Gauge('md2doc_storage_bytes', '会话目录和缓存目录占用的空间，以及存储根目录所在文件系统的剩余空间',
+                         ['kind'], multiprocess_mode='mostrecent'),
+    }
+    return True
+
+
+def remove_dead_process_files(directory):
+    """
+    删除已退出的进程留下的指标文件。这些进程的计数不再出现在输出中，Prometheus 将其视为计数器重置。
+
+    参数:
+        directory (str): 指标文件目录。
+    """
+    for name in os.listdir(directory):
+        match = METRIC_FILE_PID_PATTERN.search(name)
+        if match is None or is_process_alive(int(match.group(1))):
+            continue
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            pass
+
+
+def is_process_alive(pid):
+    """
+    返回:
+        bool: 进程是否存在。
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # 其他用户的进程
+    return True
+
+
+def mark_process_dead(pid, directory):
+    """
+    工作进程退出后删除其 livesum 类型的仪表文件，等待和运行中的作业数不再计入该进程。在 gunicorn 主进程中调用。
+
+    参数:
+        pid (int): 退出的进程号。
+        directory (str): 指标文件目录。
+    """
+    try:
+        from prometheus_client import multiprocess
+    except ImportError:
+        return
+    multiprocess.mark_process_dead(pid, directory)
+
+
+def get_registry():
+    """
+    返回:
+        CollectorRegistry: 多进程模式下为合并所有进程指标文件的注册表，否则为本进程的默认注册表。
+    """
+    from prometheus_client import CollectorRegistry, REGISTRY, multiprocess
+    if not _directory:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=_directory)
+    return registry
+
+
+def generate_metrics():
+    """
+    返回:
+        tuple: (Prometheus 文本格式的指标, Content-Type)；未启用指标时返回 None。
+    """
+    if _metrics is None:
+        return None
+    from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+    return generate_latest(get_registry()), CONTENT_TYPE_LATEST
+
+
+def start_metrics_server(port, host='0.0.0.0'):
+    """
+    在后台线程中启动只提供指标的 HTTP 服务器，供没有 Web 服务的工作节点使用。
+
+    参数:
+        port (int): 端口。
+        host (str): 监听地址。
+    """
+    if _metrics is None:
+        return
+    from prometheus_client import start_http_server
+    start_http_server(port, host, get_registry())
+
+
+def observe_stage(stage, output_format, seconds, outcome='success'):
+    """
+    记录一个阶段的耗时。
+
+    参数:
+        stage (str): 阶段，如 extract、preflight、preprocess、pandoc、xelatex、docx_compose、queue_wait。
+        output_format (str): 输出格式（pdf、html、docx），与格式无关的阶段为空字符串。
+        seconds (float): 耗时（秒）。
+        outcome (str): 结果：success、failure（如子进程返回非 0）、error（异常）、cancelled。
+    """
+    if _metrics is not None:
+        _metrics['stage'].labels(stage, output_format, outcome).observe(seconds)
+
+
+@contextmanager
+def time_stage(stage, output_format=''):
+    """
+    记录 with 语句块的耗时，可用于同步代码和协程，同时写一条带 stage、duration_ms、outcome 字段的日志。
+    抛出异常时结果记为 error，被取消时记为 cancelled；语句块中可以设置 outcome['outcome'] 为 'failure' 等其他结果。
+
+    用法:
+        with time_stage('pandoc', 'pdf') as outcome:
+            result = await run_process(command)
+            if result.returncode != 0:
+                outcome['outcome'] = 'failure'
+    """
+    outcome = {'outcome': 'success'}
+    start = time.perf_counter()
+    try:
+        yield outcome
+    except BaseException as e:
+        outcome['outcome'] = 'cancelled' if isinstance(e, asyncio.CancelledError) else 'error'
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        observe_stage(stage, output_format, seconds, outcome['outcome'])
+        logger.info(f"Stage {stage} {outcome['outcome']} in {seconds * 1000:.1f}ms", extra={
+            'stage': stage, 'duration_ms': round(seconds * 1000, 1), 'outcome': outcome['outcome']})
+
+
+@contextmanager
+def track_jobs(state):
+    """
+    在 with 语句块期间把 state（waiting 或 running）状态的作业数加 1。
+    """
+    if _metrics is None:
+        yield
+        return
+    gauge = _metrics['jobs'].labels(state)
+    gauge.inc()
+    try:
+        yield
+    finally:
+        gauge.dec()
+
+
+def observe_upload(size, outcome):
+    """
+    记录上传的压缩包大小（字节）和结果（success、invalid）。
+    """
+    if _metrics is not None:
+        _metrics['upload'].labels(outcome).observe(size)
+
+
+def observe_conversion(output_format, outcome, seconds):
+    """
+    记录转换请求的结果（success、failed、cancelled、limit、timeout、rate_limited、error）和耗时（秒）。
+    """
+    if _metrics is not None:
+        _metrics['conversion'].labels(output_format, outcome).observe(seconds)
+
+
+def count_cache_result(output_format, result):
+    """
+    记录转换请求的结果来源：hit、shared 或 miss。
+    """
+    if _metrics is not None:
+        _metrics['cache'].labels(output_format, result).inc()
+
+
+def count_served_bytes(endpoint, encoding, size):
+    """
+    记录发送的响应体字节数。
+
+    参数:
+        endpoint (str): 处理请求的视图函数名，如 download_file。
+        encoding (str): 内容编码：identity、gzip 或 br。
+        size (int): 字节数。
+    """
+    if _metrics is not None:
+        _metrics['served'].labels(endpoint, encoding).inc(size)
+
+
+def observe_request(endpoint, status, seconds):
+    """
+    记录 HTTP 请求的处理耗时（秒），status 为响应状态码。
+    """
+    if _metrics is not None:
+        _metrics['requests'].labels(endpoint, str(status)).observe(seconds)
+
+
+def set_storage_bytes(kind, size):
+    """
+    记录存储空间（字节），kind 如 sessions、caches、scratch_free、output_free。
+    """
+    if _metrics is not None:
+        _metrics['storage'].labels(kind).set(size)
@@ -0,0 +1,585 @@
+"""
+单机测试用的 Redis 协议服务器，实现分布式转换队列（util/distributed_queue.py）用到的命令子集。
+
+数据只保存在内存中，不持久化，不支持事务、发布订阅和 Lua 脚本，不能用于生产环境。
+
+用法:
+    python -m util.mini_redis --host 127.0.0.1 --port 6379
+"""
+import argparse
+import asyncio
+import time
+
+
+# 所有数据：键 -> bytes（字符串）、list（列表）、dict（哈希；有序集合为 成员 -> 分数）或 set（集合）
+_data = {}
+
+# 键的类型：键 -> 'string'、'list'、'hash'、'zset' 或 'set'
+_types = {}
+
+# 设置了过期时间的键：键 -> 过期的 time.monotonic() 时间
+_expires = {}
+
+# 阻塞在列表或有序集合上的客户端：键 -> [asyncio.Future]
+_waiters = {}
+
+# 清理过期键的间隔（秒）
+EXPIRE_SWEEP_SECONDS = 1
+
+
+class CommandError(Exception):
+    """
+    命令执行失败，以 Redis 错误回复返回给客户端。
+    """
+
+
+class SimpleString(str):
+    """
+    以 +OK 形式回复的简单字符串。
+    """
+
+
+class NullArray:
+    """
+    阻塞命令超时时回复的空数组（*-1）。
+    """
+
+
+OK = SimpleString('OK')
+WRONGTYPE = 'WRONGTYPE Operation against a key holding the wrong kind of value'
+
+
+def encode_reply(value):
+    """
+    将命令的返回值编码为 RESP2 回复。
+
+    参数:
+        value: None、整数、bytes/str、SimpleString、CommandError、NullArray 或它们组成的列表。
+
+    返回:
+        bytes: RESP2 编码。
+    """
+    if value is None:
+        return b'$-1\r\n'
+    if isinstance(value, NullArray):
+        return b'*-1\r\n'
+    if isinstance(value, CommandError):
+        return f"-{value}\r\n".encode('utf-8')
+    if isinstance(value, SimpleString):
+        return f"+{value}\r\n".encode('utf-8')
+    if isinstance(value, bool):
+        value = int(value)
+    if isinstance(value, int):
+        return f":{value}\r\n".encode('ascii')
+    if isinstance(value, str):
+        value = value.encode('utf-8')
+    if isinstance(value, bytes):
+        return b'$%d\r\n%s\r\n' % (len(value), value)
+    return b'*%d\r\n' % len(value) + b''.join(encode_reply(item) for item in value)
+
+
+def is_expired(key):
+    """
+    返回:
+        bool: 键是否已过期；已过期的键立即删除。
+    """
+    deadline = _expires.get(key)
+    if deadline is not None and deadline <= time.monotonic():
+        delete_key(key)
+        return True
+    return False
+
+
+def delete_key(key):
+    """
+    删除键及其过期时间。
+
+    返回:
+        bool: 键是否存在。
+    """
+    _expires.pop(key, None)
+    _types.pop(key, None)
+    return _data.pop(key, None) is not None
+
+
+def get_value(key, value_type, create=False):
+    """
+    获取键的值并检查类型。
+
+    参数:
+        key (bytes): 键。
+        value_type (str): 期望的类型。
+        create (bool): 键不存在时是否创建空值。
+
+    返回:
+        键的值；不存在且不创建时返回 None。
+
+    异常:
+        CommandError: 键的类型不符。
+    """
+    if key in _data and not is_expired(key):
+        if _types[key] != value_type:
+            raise CommandError(WRONGTYPE)
+        return _data[key]
+    if not create:
+        return None
+    value = {'string': b'', 'list': [], 'hash': {}, 'zset': {}, 'set': set()}[value_type]
+    _data[key] = value
+    _types[key] = value_type
+    return value
+
+
+def drop_if_empty(key):
+    """
+    列表、哈希、有序集合和集合为空时删除键，与 Redis 一致。
+    """
+    if key in _data and _types[key] != 'string' and not _data[key]:
+        delete_key(key)
+
+
+def notify_waiters(key):
+    """
+    唤醒阻塞在该键上的客户端，由它们重新尝试弹出元素。
+    """
+    for future in _waiters.pop(key, []):
+        if not future.done():
+            future.set_result(None)
+
+
+def parse_int(value):
+    try:
+        return int(value)
+    except ValueError:
+        raise CommandError('ERR value is not an integer or out of range')
+
+
+def parse_float(value):
+    try:
+        return float(value)
+    except ValueError:
+        raise CommandError('ERR value is not a valid float')
+
+
+def command_ping(args):
+    return args[0] if args else SimpleString('PONG')
+
+
+def command_ok(args):
+    # SELECT、CLIENT SETINFO 等连接设置命令：只有一个数据库，直接确认
+    return OK
+
+
+def command_get(args):
+    return get_value(args[0], 'string')
+
+
+def command_set(args):
+    key, value = args[0], args[1]
+    ttl = None
+    only_new = only_existing = False
+    options = [option.upper() for option in args[2:]]
+    index = 0
+    while index < len(options):
+        option = options[index]
+        if option in (b'EX', b'PX') and index + 1 < len(options):
+            ttl = parse_int(args[2 + index + 1]) / (1 if option == b'EX' else 1000)
+            index += 1
+        elif option == b'NX':
+            only_new = True
+        elif option == b'XX':
+            only_existing = True
+        else:
+            raise CommandError('ERR syntax error')
+        index += 1
+    exists = key in _data and not is_expired(key)
+    if (only_new and exists) or (only_existing and not exists):
+        return None
+    delete_key(key)
+    _data[key] = value
+    _types[key] = 'string'
+    if ttl is not None:
+        _expires[key] = time.monotonic() + ttl
+    return OK
+
+
+def command_del(args):
+    return sum(1 for key in args if not is_expired(key) and delete_key(key))
+
+
+def command_exists(args):
+    return sum(1 for key in args if key in _data and not is_expired(key))
+
+
+def command_expire(args):
+    key = args[0]
+    if key not in _data or is_expired(key):
+        return 0
+    _expires[key] = time.monotonic() + parse_int(args[1])
+    return 1
+
+
+def command_ttl(args):
+    key = args[0]
+    if key not in _data or is_expired(key):
+        return -2
+    deadline = _expires.get(key)
+    return -1 if deadline is None else max(0, round(deadline - time.monotonic()))
+
+
+def command_incr(args):
+    value = get_value(args[0], 'string') or b'0'
+    result = parse_int(value) + 1
+    command_set([args[0], str(result).encode('ascii')])
+    return result
+
+
+def command_hset(args):
+    if len(args) < 3 or len(args) % 2 == 0:
+        raise CommandError("ERR wrong number of arguments for 'hset' command")
+    fields = get_value(args[0], 'hash', create=True)
+    added = 0
+    for index in range(1, len(args), 2):
+        added += args[index] not in fields
+        fields[args[index]] = args[index + 1]
+    return added
+
+
+def command_hget(args):
+    return (get_value(args[0], 'hash') or {}).get(args[1])
+
+
+def command_hdel(args):
+    fields = get_value(args[0], 'hash') or {}
+    removed = sum(1 for field in args[1:] if fields.pop(field, None) is not None)
+    drop_if_empty(args[0])
+    return removed
+
+
+def command_hgetall(args):
+    fields = get_value(args[0], 'hash') or {}
+    return [item for pair in fields.items() for item in pair]
+
+
+def push(args, left):
+    items = get_value(args[0], 'list', create=True)
+    for value in args[1:]:
+        if left:
+            items.insert(0, value)
+        else:
+            items.append(value)
+    notify_waiters(args[0])
+    return len(items)
+
+
+def command_lpush(args):
+    return push(args, left=True)
+
+
+def command_rpush(args):
+    return push(args, left=False)
+
+
+def command_llen(args):
+    return len(get_value(args[0], 'list') or [])
+
+
+def command_lrange(args):
+    items = get_value(args[0], 'list') or []
+    start, stop = parse_int(args[1]), parse_int(args[2])
+    if start < 0:
+        start = max(0, len(items) + start)
+    stop = len(items) + stop if stop < 0 else min(stop, len(items) - 1)
+    return items[start:stop + 1]
+
+
+def command_lrem(args):
+    items = get_value(args[0], 'list') or []
+    count, value = parse_int(args[1]), args[2]
+    removed = 0
+    indexes = range(len(items) - 1, -1, -1) if count < 0 else range(len(items))
+    for index in list(indexes):
+        if items[index] == value and (count == 0 or removed < abs(count)):
+            removed += 1
+            items[index] = None
+    items[:] = [item for item in items if item is not None]
+    drop_if_empty(args[0])
+    return removed
+
+
+def rpoplpush(source, destination):
+    """
+    弹出 source 的最后一个元素并压入 destination 的头部；source 与 destination 相同时为循环，可用于阻塞地查看元素。
+
+    返回:
+        bytes: 弹出的元素；列表为空时返回 None。
+    """
+    items = get_value(source, 'list')
+    if not items:
+        return None
+    get_value(destination, 'list', create=True)
+    value = items.pop()
+    drop_if_empty(source)
+    push([destination, value], left=True)
+    return value
+
+
+def command_rpoplpush(args):
+    return rpoplpush(args[0], args[1])
+
+
+def command_sadd(args):
+    members = get_value(args[0], 'set', create=True)
+    added = len(set(args[1:]) - members)
+    members.update(args[1:])
+    return added
+
+
+def command_srem(args):
+    members = get_value(args[0], 'set') or set()
+    removed = len(members & set(args[1:]))
+    members.difference_update(args[1:])
+    drop_if_empty(args[0])
+    return removed
+
+
+def command_smembers(args):
+    return sorted(get_value(args[0], 'set') or set())
+
+
+def command_zadd(args):
+    options = []
+    index = 1
+    while index < len(args) and args[index].upper() in (b'NX', b'XX', b'GT', b'LT', b'CH'):
+        options.append(args[index].upper())
+        index += 1
+    if (len(args) - index) < 2 or (len(args) - index) % 2:
+        raise CommandError('ERR syntax error')
+    scores = get_value(args[0], 'zset', create=True)
+    added = 0
+    for position in range(index, len(args), 2):
+        score, member = parse_float(args[position]), args[position + 1]
+        if member in scores and b'NX' in options or member not in scores and b'XX' in options:
+            continue
+        added += member not in scores
+        scores[member] = score
+    drop_if_empty(args[0])
+    notify_waiters(args[0])
+    return added
+
+
+def command_zrem(args):
+    scores = get_value(args[0], 'zset') or {}
+    removed = sum(1 for member in args[1:] if scores.pop(member, None) is not None)
+    drop_if_empty(args[0])
+    return removed
+
+
+def command_zcard(args):
+    return len(get_value(args[0], 'zset') or {})
+
+
+def command_zscore(args):
+    score = (get_value(args[0], 'zset') or {}).get(args[1])
+    return None if score is None else repr(score)
+
+
+def zpopmin(key):
+    """
+    弹出有序集合中分数最小的成员，分数相同时按成员排序。
+
+    返回:
+        list: [键, 成员, 分数]；有序集合为空时返回 None。
+    """
+    scores = get_value(key, 'zset')
+    if not scores:
+        return None
+    member = min(scores, key=lambda item: (scores[item], item))
+    score = scores.pop(member)
+    drop_if_empty(key)
+    return [key, member, repr(score)]
+
+
+def command_flushdb(args):
+    _data.clear()
+    _types.clear()
+    _expires.clear()
+    return OK
+
+
+async def block_until(pop, keys, timeout):
+    """
+    反复尝试弹出元素，所有键都为空时等待其他客户端写入，超时后返回空回复。
+
+    参数:
+        pop (callable): 尝试弹出元素的函数，参数为键，没有元素时返回 None。
+        keys (list): 按顺序尝试的键。
+        timeout (float): 最长等待时间（秒），为 0 时一直等待。
+
+    返回:
+        弹出结果；超时时返回 None。
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout if timeout > 0 else None
+    while True:
+        for key in keys:
+            result = pop(key)
+            if result is not None:
+                return result
+        remaining = None if deadline is None else deadline - loop.time()
+        if remaining is not None and remaining <= 0:
+            return None
+        future = loop.create_future()
+        for key in keys:
+            _waiters.setdefault(key, []).append(future)
+        try:
+            await asyncio.wait_for(future, remaining)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            for key in keys:
+                waiting = _waiters.get(key, [])
+                if future in waiting:
+                    waiting.remove(future)
+                if not waiting:
+                    _waiters.pop(key, None)
+
+
+async def command_brpoplpush(args):
+    source, destination = args[0], args[1]
+    return await block_until(lambda key: rpoplpush(key, destination), [source], parse_float(args[2]))
+
+
+async def command_bzpopmin(args):
+    result = await block_until(zpopmin, args[:-1], parse_float(args[-1]))
+    return NullArray() if result is None else result
+
+
+COMMANDS = {
+    b'PING': command_ping,
+    b'ECHO': lambda args: args[0],
+    b'SELECT': command_ok,
+    b'CLIENT': command_ok,
+    b'GET': command_get,
+    b'SET': command_set,
+    b'DEL': command_del,
+    b'UNLINK': command_del,
+    b'EXISTS': command_exists,
+    b'EXPIRE': command_expire,
+    b'TTL': command_ttl,
+    b'INCR': command_incr,
+    b'HSET': command_hset,
+    b'HGET': command_hget,
+    b'HDEL': command_hdel,
+    b'HGETALL': command_hgetall,
+    b'LPUSH': command_lpush,
+    b'RPUSH': command_rpush,
+    b'LLEN': command_llen,
+    b'LRANGE': command_lrange,
+    b'LREM': command_lrem,
+    b'RPOPLPUSH': command_rpoplpush,
+    b'BRPOPLPUSH': command_brpoplpush,
+    b'SADD': command_sadd,
+    b'SREM': command_srem,
+    b'SMEMBERS': command_smembers,
+    b'ZADD': command_zadd,
+    b'ZREM': command_zrem,
+    b'ZCARD': command_zcard,
+    b'ZSCORE': command_zscore,
+    b'BZPOPMIN': command_bzpopmin,
+    b'FLUSHDB': command_flushdb,
+    b'FLUSHALL': command_flushdb,
+}
+
+
+async def read_command(reader):
+    """
+    读取一条命令：RESP 数组，或以空格分隔的内联命令（便于用 telnet 调试）。
+
+    返回:
+        list: 命令和参数（bytes）；连接关闭时返回 None。
+    """
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b'*'):
+        return line.split()
+    args = []
+    for _ in range(int(line[1:])):
+        header = await reader.readline()
+        if not header.startswith(b'$'):
+            raise CommandError('ERR Protocol error: expected bulk string')
+        data = await reader.readexactly(int(header[1:]) + 2)
+        args.append(data[:-2])
+    return args
+
+
+async def handle_client(reader, writer):
+    """
+    处理一个客户端连接，按顺序执行其命令。
+    """
+    try:
+        while True:
+            try:
+                args = await read_command(reader)
+            except (CommandError, ValueError) as e:
+                writer.write(encode_reply(CommandError(str(e))))
+                break
+            if args is None:
+                break
+            if not args:
+                continue
+            name = args[0].upper()
+            if name == b'QUIT':
+                writer.write(encode_reply(OK))
+                break
+            handler = COMMANDS.get(name)
+            try:
+                if handler is None:
+                    raise CommandError(f"ERR unknown command '{args[0].decode('utf-8', 'replace')}'")
+                if len(args) < 2 and name not in (b'PING', b'FLUSHDB', b'FLUSHALL'):
+                    raise CommandError(f"ERR wrong number of arguments for '{name.decode().lower()}' command")
+                reply = handler(args[1:])
+                if asyncio.iscoroutine(reply):
+                    reply = await reply
+            except CommandError as e:
+                reply = e
+            except IndexError:
+                reply = CommandError(f"ERR wrong number of arguments for '{name.decode().lower()}' command")
+            writer.write(encode_reply(reply))
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def sweep_expired_keys():
+    """
+    定期删除已过期的键，避免不再访问的键一直占用内存。
+    """
+    while True:
+        await asyncio.sleep(EXPIRE_SWEEP_SECONDS)
+        for key in list(_expires):
+            is_expired(key)
+
+
+async def serve(host, port):
+    server = await asyncio.start_server(handle_client, host, port)
+    print(f"Mini Redis listening on {host}:{port}")
+    sweeper = asyncio.ensure_future(sweep_expired_keys())
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        sweeper.cancel()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='单机测试用的 Redis 协议服务器')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6379)
+    arguments = parser.parse_args()
+    try:
+        asyncio.run(serve(arguments.host, arguments.port))
+    except KeyboardInterrupt:
+        pass
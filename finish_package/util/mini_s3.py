@@ -0,0 +1,227 @@
+"""
+单机测试用的 S3 兼容服务器，实现对象存储（util/object_store.py）用到的请求子集：创建桶、上传、下载、HEAD、
+删除对象，ListObjectsV2 和批量删除。只支持路径形式的桶地址（http://host:port/<bucket>/<key>）。
+
+数据只保存在内存中，不校验签名，不支持分段上传和版本，不能用于生产环境。
+
+用法:
+    python -m util.mini_s3 --host 127.0.0.1 --port 9000 --bucket md2doc
+"""
+import argparse
+import hashlib
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, unquote
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+
+# 所有对象：桶 -> {键: (内容, 元数据, 修改时间)}
+_buckets = {}
+_lock = threading.Lock()
+
+# ListObjectsV2 每页的最大对象数
+MAX_KEYS = 1000
+
+S3_NAMESPACE = 'http://s3.amazonaws.com/doc/2006-03-01/'
+
+
+def decode_aws_chunked(body):
+    """
+    解码 aws-chunked 编码的请求体（每块为 "十六进制长度;chunk-signature=...\\r\\n内容\\r\\n"，最后一块长度为 0，
+    之后可能有校验和尾部）。
+
+    参数:
+        body (bytes): 请求体。
+
+    返回:
+        bytes: 对象内容。
+    """
+    data = bytearray()
+    position = 0
+    while True:
+        line_end = body.index(b'\r\n', position)
+        size = int(body[position:line_end].split(b';')[0], 16)
+        if size == 0:
+            return bytes(data)
+        data += body[line_end + 2:line_end + 2 + size]
+        position = line_end + 2 + size + 2
+
+
+class S3RequestHandler(BaseHTTPRequestHandler):
+    """
+    按路径形式的桶地址处理 S3 请求。
+    """
+    protocol_version = 'HTTP/1.1'  # 支持长连接和 Expect: 100-continue
+
+    def log_message(self, format, *args):
+        pass
+
+    def parse_path(self):
+        """
+        返回:
+            tuple: (桶, 键, 查询参数)；访问桶本身时键为空字符串。
+        """
+        url = urlsplit(self.path)
+        bucket, _, key = url.path.lstrip('/').partition('/')
+        return unquote(bucket), unquote(key), parse_qs(url.query, keep_blank_values=True)
+
+    def read_body(self):
+        """
+        返回:
+            bytes: 请求体，已解码 HTTP 分块传输和 aws-chunked 编码。
+        """
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            body = bytearray()
+            while True:
+                size = int(self.rfile.readline().split(b';')[0], 16)
+                if size == 0:
+                    while self.rfile.readline() not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                body += self.rfile.read(size)
+                self.rfile.readline()
+            body = bytes(body)
+        else:
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if 'aws-chunked' in self.headers.get('Content-Encoding', ''):
+            body = decode_aws_chunked(body)
+        return body
+
+    def send_body(self, status, body=b'', headers=None, content_type='application/xml'):
+        """
+        发送回复；HEAD 请求只发送头部。
+        """
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if body or self.command != 'HEAD':
+            self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def send_error_code(self, status, code, message):
+        """
+        以 S3 的 XML 错误格式回复。
+        """
+        body = (f'<?xml version="1.0" encoding="UTF-8"?><Error><Code>{code}</Code>'
+                f'<Message>{escape(message)}</Message></Error>').encode('utf-8')
+        self.send_body(status, b'' if self.command == 'HEAD' else body)
+
+    def get_bucket(self, bucket):
+        """
+        返回:
+            dict: 桶中的对象；桶不存在时回复 NoSuchBucket 并返回 None。
+        """
+        objects = _buckets.get(bucket)
+        if objects is None:
+            self.send_error_code(404, 'NoSuchBucket', 'The specified bucket does not exist')
+        return objects
+
+    def do_PUT(self):
+        bucket, key, _ = self.parse_path()
+        body = self.read_body()
+        with _lock:
+            if not key:
+                _buckets.setdefault(bucket, {})
+                self.send_body(200)
+                return
+            objects = self.get_bucket(bucket)
+            if objects is None:
+                return
+            metadata = {name[len('x-amz-meta-'):].lower(): value for name, value in self.headers.items()
+                        if name.lower().startswith('x-amz-meta-')}
+            objects[key] = (body, metadata, time.time())
+        self.send_body(200, headers={'ETag': '"%s"' % hashlib.md5(body).hexdigest()})
+
+    def do_GET(self):
+        bucket, key, query = self.parse_path()
+        if not key:
+            self.list_objects(bucket, query)
+            return
+        with _lock:
+            objects = self.get_bucket(bucket)
+            if objects is None:
+                return
+            item = objects.get(key)
+        if item is None:
+            self.send_error_code(404, 'NoSuchKey', 'The specified key does not exist.')
+            return
+        data, metadata, mtime = item
+        headers = {'ETag': '"%s"' % hashlib.md5(data).hexdigest(), 'Last-Modified': formatdate(mtime, usegmt=True)}
+        headers.update({f'x-amz-meta-{name}': value for name, value in metadata.items()})
+        self.send_body(200, data, headers, content_type='application/octet-stream')
+
+    do_HEAD = do_GET
+
+    def do_DELETE(self):
+        bucket, key, _ = self.parse_path()
+        with _lock:
+            objects = self.get_bucket(bucket)
+            if objects is None:
+                return
+            objects.pop(key, None)
+        self.send_body(204)
+
+    def do_POST(self):
+        bucket, _, query = self.parse_path()
+        body = self.read_body()
+        if 'delete' not in query:
+            self.send_error_code(501, 'NotImplemented', 'Only DeleteObjects is supported')
+            return
+        keys = [element.text or '' for element in ElementTree.fromstring(body).iter()
+                if element.tag.rsplit('}', 1)[-1] == 'Key']
+        with _lock:
+            objects = self.get_bucket(bucket)
+            if objects is None:
+                return
+            for key in keys:
+                objects.pop(key, None)
+        self.send_body(200, f'<?xml version="1.0" encoding="UTF-8"?><DeleteResult xmlns="{S3_NAMESPACE}"/>'
+                       .encode('utf-8'))
+
+    def list_objects(self, bucket, query):
+        """
+        按 ListObjectsV2 回复桶中键以 prefix 开头的对象，每页最多 MAX_KEYS 个。
+        """
+        prefix = query.get('prefix', [''])[0]
+        start_after = query.get('continuation-token', query.get('start-after', ['']))[0]
+        with _lock:
+            objects = self.get_bucket(bucket)
+            if objects is None:
+                return
+            keys = sorted(key for key in objects if key.startswith(prefix) and key > start_after)
+            page = [(key, objects[key]) for key in keys[:MAX_KEYS]]
+        truncated = len(keys) > MAX_KEYS
+        contents = ''.join(
+            f'<Contents><Key>{escape(key)}</Key>'
+            f'<LastModified>{time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(mtime))}</LastModified>'
+            f'<ETag>"{hashlib.md5(data).hexdigest()}"</ETag><Size>{len(data)}</Size>'
+            f'<StorageClass>STANDARD</StorageClass></Contents>'
+            for key, (data, _, mtime) in page)
+        next_token = f'<NextContinuationToken>{escape(page[-1][0])}</NextContinuationToken>' if truncated else ''
+        body = (f'<?xml version="1.0" encoding="UTF-8"?><ListBucketResult xmlns="{S3_NAMESPACE}">'
+                f'<Name>{escape(bucket)}</Name><Prefix>{escape(prefix)}</Prefix><KeyCount>{len(page)}</KeyCount>'
+                f'<MaxKeys>{MAX_KEYS}</MaxKeys><IsTruncated>{"true" if truncated else "false"}</IsTruncated>'
+                f'{contents}{next_token}</ListBucketResult>')
+        self.send_body(200, body.encode('utf-8'))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='单机测试用的 S3 兼容服务器')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--bucket', action='append', default=[], help='启动时创建的桶，可重复指定')
+    arguments = parser.parse_args()
+    for name in arguments.bucket:
+        _buckets[name] = {}
+    server = ThreadingHTTPServer((arguments.host, arguments.port), S3RequestHandler)
+    print(f"mini_s3 listening on {arguments.host}:{arguments.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
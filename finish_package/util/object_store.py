@@ -0,0 +1,337 @@
+import io
+import os
+import shutil
+import tempfile
+import threading
+
+try:
+    import boto3
+    from botocore.config import Config as BotoConfig
+    from botocore.exceptions import ClientError
+except ImportError:  # 未安装 boto3 时只能使用目录作为对象存储
+    boto3 = None
+
+
+# S3 兼容存储的连接参数和客户端，由 configure_s3 设置，首次使用时创建客户端
+_s3_options = {}
+_s3_client = None
+_s3_lock = threading.Lock()
+
+# 每次批量删除的最大对象数（S3 DeleteObjects 的上限）
+S3_DELETE_BATCH = 1000
+
+
+def configure_s3(endpoint_url=None, region=None):
+    """
+    设置 S3 兼容存储的连接参数。访问密钥按 boto3 的规则从 AWS_ACCESS_KEY_ID/AWS_SECRET_ACCESS_KEY 环境变量或
+    ~/.aws/credentials 读取。
+
+    参数:
+        endpoint_url (str): MinIO 等 S3 兼容服务的地址，如 'http://127.0.0.1:9000'；为 None 时使用 AWS S3。
+        region (str): 区域。
+    """
+    global _s3_options, _s3_client
+    _s3_options = {'endpoint_url': endpoint_url, 'region_name': region}
+    _s3_client = None
+
+
+def get_s3_client():
+    """
+    返回:
+        botocore.client.S3: S3 客户端，各线程共用。
+
+    异常:
+        RuntimeError: 未安装 boto3 包。
+    """
+    global _s3_client
+    if boto3 is None:
+        raise RuntimeError("s3:// object stores require the boto3 package (pip install boto3)")
+    with _s3_lock:
+        if _s3_client is None:
+            # 自建的 S3 兼容服务通常不支持虚拟主机形式的桶地址
+            addressing_style = 'path' if _s3_options.get('endpoint_url') else 'auto'
+            _s3_client = boto3.session.Session().client(
+                's3', config=BotoConfig(s3={'addressing_style': addressing_style}, retries={'mode': 'standard'}),
+                **_s3_options)
+        return _s3_client
+
+
+def parse_s3_store(store):
+    """
+    解析 S3 对象存储地址。
+
+    参数:
+        store (str): 对象存储：目录，或 's3://<bucket>/<前缀>'。
+
+    返回:
+        tuple: (bucket, 键前缀)；store 为目录时返回 None。
+    """
+    if not store.startswith('s3://'):
+        return None
+    bucket, _, prefix = store[len('s3://'):].partition('/')
+    prefix = prefix.strip('/')
+    return bucket, prefix + '/' if prefix else ''
+
+
+def check_object_key(key):
+    """
+    检查对象键，避免访问对象存储以外的文件。
+
+    返回:
+        list: 对象键以 / 分隔的各部分。
+
+    异常:
+        ValueError: 对象键为空或包含 . 和 .. 等路径成分。
+    """
+    parts = key.split('/')
+    if not key or any(part in ('', '.', '..') or '\\' in part for part in parts):
+        raise ValueError(f"Invalid object key: {key}")
+    return parts
+
+
+def is_missing_object(error):
+    """
+    返回:
+        bool: S3 请求的错误是否表示对象不存在。
+    """
+    return error.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound')
+
+
+def get_object_path(store_dir, key):
+    """
+    获取对象键在对象存储目录中对应的文件路径。
+
+    参数:
+        store_dir (str): 对象存储目录（本地磁盘或各节点挂载的共享目录）。
+        key (str): 对象键，以 / 分隔，如 'outputs/<urlid>/<文件名>'。
+
+    返回:
+        str: 文件路径。
+
+    异常:
+        ValueError: 对象键为空或包含 . 和 .. 等路径成分。
+    """
+    return os.path.join(store_dir, *check_object_key(key))
+
+
+def copy_atomic(source, target_path, mtime_ns=None):
+    """
+    将已打开的源文件复制到目标路径，先写入临时文件再原子替换，其他进程和节点不会读到半成品。
+
+    参数:
+        source (file): 以二进制模式打开的源文件。
+        target_path (str): 目标文件路径。
+        mtime_ns (int): 目标文件的修改时间（纳秒），为 None 时为当前时间。
+    """
+    target_dir = os.path.dirname(target_path) or '.'
+    os.makedirs(target_dir, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=target_dir, prefix='.partial-')
+    try:
+        with os.fdopen(fd, 'wb') as target:
+            shutil.copyfileobj(source, target, 1024 * 1024)
+        os.chmod(temp_path, 0o644)
+        if mtime_ns is not None:
+            os.utime(temp_path, ns=(mtime_ns, mtime_ns))
+        os.replace(temp_path, target_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def put_object(store, key, source_path):
+    """
+    将文件存入对象存储，保留源文件的修改时间（S3 中保存在对象的 mtime-ns 元数据中）。
+
+    参数:
+        store (str): 对象存储：目录，或 's3://<bucket>/<前缀>'。
+        key (str): 对象键。
+        source_path (str): 源文件路径。
+    """
+    s3_store = parse_s3_store(store)
+    with open(source_path, 'rb') as source:
+        mtime_ns = os.fstat(source.fileno()).st_mtime_ns
+        if s3_store is None:
+            copy_atomic(source, get_object_path(store, key), mtime_ns)
+            return
+        check_object_key(key)
+        bucket, prefix = s3_store
+        get_s3_client().put_object(Bucket=bucket, Key=prefix + key, Body=source, Metadata={'mtime-ns': str(mtime_ns)})
+
+
+def get_object(store, key, target_path):
+    """
+    从对象存储取出文件，目标文件的修改时间与对象相同。
+
+    参数:
+        store (str): 对象存储。
+        key (str): 对象键。
+        target_path (str): 目标文件路径。
+
+    返回:
+        bool: 对象是否存在。
+    """
+    s3_store = parse_s3_store(store)
+    if s3_store is None:
+        try:
+            source = open(get_object_path(store, key), 'rb')
+        except FileNotFoundError:
+            return False
+        with source:
+            copy_atomic(source, target_path, os.fstat(source.fileno()).st_mtime_ns)
+        return True
+
+    check_object_key(key)
+    bucket, prefix = s3_store
+    client = get_s3_client()
+    try:
+        response = client.get_object(Bucket=bucket, Key=prefix + key)
+    except ClientError as e:
+        if is_missing_object(e):
+            return False
+        raise
+    with response['Body'] as source:
+        copy_atomic(source, target_path, get_s3_mtime_ns(response))
+    return True
+
+
+def get_s3_mtime_ns(response):
+    """
+    返回:
+        int: GetObject/HeadObject 响应中对象的修改时间（纳秒），优先使用上传时保存的源文件修改时间。
+    """
+    mtime_ns = response.get('Metadata', {}).get('mtime-ns')
+    if mtime_ns is not None:
+        return int(mtime_ns)
+    return int(response['LastModified'].timestamp() * 1e9)
+
+
+def put_bytes(store, key, data):
+    """
+    将一段内容存为对象。
+
+    参数:
+        store (str): 对象存储。
+        key (str): 对象键。
+        data (bytes): 对象内容。
+    """
+    s3_store = parse_s3_store(store)
+    if s3_store is None:
+        copy_atomic(io.BytesIO(data), get_object_path(store, key))
+        return
+    check_object_key(key)
+    bucket, prefix = s3_store
+    get_s3_client().put_object(Bucket=bucket, Key=prefix + key, Body=data)
+
+
+def get_bytes(store, key):
+    """
+    读取对象的内容。
+
+    返回:
+        bytes: 对象内容；对象不存在时返回 None。
+    """
+    s3_store = parse_s3_store(store)
+    if s3_store is None:
+        try:
+            with open(get_object_path(store, key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    check_object_key(key)
+    bucket, prefix = s3_store
+    client = get_s3_client()
+    try:
+        response = client.get_object(Bucket=bucket, Key=prefix + key)
+    except ClientError as e:
+        if is_missing_object(e):
+            return None
+        raise
+    with response['Body'] as body:
+        return body.read()
+
+
+def get_object_mtime(store, key):
+    """
+    返回:
+        float: 对象的修改时间（秒）；对象不存在时返回 None。
+    """
+    s3_store = parse_s3_store(store)
+    if s3_store is None:
+        try:
+            return os.path.getmtime(get_object_path(store, key))
+        except FileNotFoundError:
+            return None
+
+    check_object_key(key)
+    bucket, prefix = s3_store
+    client = get_s3_client()
+    try:
+        response = client.head_object(Bucket=bucket, Key=prefix + key)
+    except ClientError as e:
+        if is_missing_object(e):
+            return None
+        raise
+    return get_s3_mtime_ns(response) / 1e9
+
+
+def delete_objects(store, prefix):
+    """
+    删除对象键以 prefix 开头的所有对象。prefix 以 / 结尾时删除整个“目录”，否则删除同名对象及 prefix.* 对象。
+
+    参数:
+        store (str): 对象存储。
+        prefix (str): 对象键前缀，如 'outputs/<urlid>/' 或 'packages/<urlid>'。
+
+    返回:
+        int: 删除的对象数。
+    """
+    s3_store = parse_s3_store(store)
+    if s3_store is not None:
+        return delete_s3_objects(s3_store, prefix)
+
+    if prefix.endswith('/'):
+        directory = get_object_path(store, prefix.rstrip('/'))
+        count = sum(len(files) for _, _, files in os.walk(directory))
+        shutil.rmtree(directory, ignore_errors=True)
+        return count
+    path = get_object_path(store, prefix)
+    directory, name = os.path.split(path)
+    if not os.path.isdir(directory):
+        return 0
+    count = 0
+    for entry in os.listdir(directory):
+        if entry == name or entry.startswith(name + '.'):
+            entry_path = os.path.join(directory, entry)
+            if os.path.isfile(entry_path):
+                os.remove(entry_path)
+                count += 1
+    return count
+
+
+def delete_s3_objects(s3_store, prefix):
+    """
+    删除 S3 兼容存储中对象键以 prefix 开头的对象，规则与 delete_objects 相同。
+
+    参数:
+        s3_store (tuple): parse_s3_store 返回的 (bucket, 键前缀)。
+        prefix (str): 对象键前缀。
+
+    返回:
+        int: 删除的对象数。
+    """
+    check_object_key(prefix.rstrip('/'))
+    bucket, store_prefix = s3_store
+    full_prefix = store_prefix + prefix
+    client = get_s3_client()
+    keys = []
+    for page in client.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=full_prefix):
+        for item in page.get('Contents', []):
+            name = item['Key']
+            if prefix.endswith('/') or name == full_prefix or name.startswith(full_prefix + '.'):
+                keys.append(name)
+    for index in range(0, len(keys), S3_DELETE_BATCH):
+        batch = keys[index:index + S3_DELETE_BATCH]
+        client.delete_objects(Bucket=bucket, Delete={'Objects': [{'Key': name} for name in batch], 'Quiet': True})
+    return len(keys)
@@ -0,0 +1,377 @@
+import asyncio
+import contextvars
+import functools
+import os
+import resource
+import signal
+import subprocess
+import threading
+from collections import namedtuple
+from util.tracing import span
+from util.profiling import run_profiled
+
+
+# 前四项与 subprocess.CompletedProcess 字段一致，便于替换原来的 subprocess.run；rusage 为 os.wait4 返回的资源使用情况
+ProcessResult = namedtuple('ProcessResult', ['args', 'returncode', 'stdout', 'stderr', 'rusage'])
+
+# 终止进程组时，SIGTERM 之后等待子进程退出的时间（秒），超时后发送 SIGKILL
+TERMINATE_GRACE_SECONDS = 2
+
+# 读取子进程输出时单行的最大长度
+STREAM_LIMIT = 1024 * 1024
+
+# RLIMIT_CPU 软限制到达时发送 SIGXCPU，再超出该秒数后由内核发送 SIGKILL
+CPU_HARD_LIMIT_MARGIN = 5
+
+# 子进程因内存不足退出时输出中的特征文本
+OUT_OF_MEMORY_MARKERS = ('Heap exhausted', 'memory exhausted', 'out of memory', 'Cannot allocate memory')
+
+_loop = None
+_loop_lock = threading.Lock()
+
+# 当前转换作业累计的子进程资源使用，由作业在运行转换前设置，run_process 在每个子进程退出后累加
+process_usage = contextvars.ContextVar('process_usage', default=None)
+
+
+class ProcessLimitError(Exception):
+    """
+    子进程超出资源限制，已被终止。
+
+    属性:
+        command (list): 命令及参数。
+        limit (str): 超出的限制：'timeout'、'cpu' 或 'memory'。
+        value: 该限制的配置值。
+        stderr (str): 子进程已输出的 stderr。
+    """
+
+    def __init__(self, command, limit, value, stderr=''):
+        super().__init__(f"Command {command[0]} exceeded {limit} limit ({value})")
+        self.command = command
+        self.limit = limit
+        self.value = value
+        self.stderr = stderr
+
+    def to_dict(self):
+        """
+        返回:
+            dict: 可直接作为 JSON 响应的错误信息。
+        """
+        return {'stage': os.path.basename(self.command[0]), 'limit': self.limit, 'value': self.value}
+
+
+class ProcessTimeoutError(ProcessLimitError):
+    """
+    子进程运行超过超时时间，已被终止。
+    """
+
+    def __init__(self, command, timeout, stderr=''):
+        super().__init__(command, 'timeout', timeout, stderr)
+        self.timeout = timeout
+
+
+def get_process_loop():
+    """
+    获取在后台线程中运行的共享事件循环，所有子进程都由它统一监管。
+
+    返回:
+        asyncio.AbstractEventLoop: 事件循环。
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='process-loop', daemon=True).start()
+    return _loop
+
+
+def run_coroutine_sync(coroutine):
+    """
+    在共享事件循环中运行协程，并阻塞等待其结果，供同步代码调用。
+
+    参数:
+        coroutine: 协程对象。
+
+    返回:
+        协程的返回值。
+    """
+    return asyncio.run_coroutine_threadsafe(coroutine, get_process_loop()).result()
+
+
+async def run_in_thread(func, *args, **kwargs):
+    """
+    在默认线程池中运行阻塞函数（兼容没有 asyncio.to_thread 的 Python 3.8）。与 asyncio.to_thread 一样在调用方的
+    上下文副本中运行，函数中的 span 记入当前请求的时间线，当前请求被性能分析时运行函数的线程也被采样。
+
+    参数:
+        func (callable): 要运行的函数。
+        *args, **kwargs: 传给函数的参数。
+
+    返回:
+        函数的返回值。
+    """
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        None, functools.partial(context.run, run_profiled, func, *args, **kwargs))
+
+
+def new_usage():
+    """
+    返回:
+        dict: 空的资源使用记录：cpu_seconds（所有子进程用户态与内核态 CPU 时间之和）、
+            peak_memory_mb（单个子进程的最大常驻内存）、processes（已退出的子进程数）。
+    """
+    return {'cpu_seconds': 0.0, 'peak_memory_mb': 0.0, 'processes': 0}
+
+
+def record_usage(rusage):
+    """
+    将子进程的资源使用累加到当前作业的记录中，当前上下文没有记录时忽略。
+
+    参数:
+        rusage (resource.struct_rusage): os.wait4 返回的资源使用情况。
+    """
+    usage = process_usage.get()
+    if usage is None:
+        return
+    usage['cpu_seconds'] += rusage.ru_utime + rusage.ru_stime
+    usage['peak_memory_mb'] = max(usage['peak_memory_mb'], rusage.ru_maxrss / 1024)  # Linux 上单位为 KB
+    usage['processes'] += 1
+
+
+async def wait_process(pid, name=None):
+    """
+    等待子进程退出并回收，同时取得它的资源使用情况并累加到当前作业的记录中（包括超时或取消后被终止的子进程）。
+    当前请求有时间线时，子进程的运行时间、CPU 时间和最大常驻内存记为一个 span。
+
+    支持 pidfd 的 Linux 上由事件循环监听进程退出，否则在线程池中阻塞等待。
+
+    参数:
+        pid (int): 子进程 ID。
+        name (str): span 的名称，如命令名 pandoc、xelatex；为 None 时使用进程 ID。
+
+    返回:
+        tuple: (返回码, resource.struct_rusage)，返回码为负数时表示子进程被该信号终止。
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        pidfd = os.pidfd_open(pid)
+    except (AttributeError, OSError):
+        pidfd = None
+    with span(name or str(pid)) as record:
+        if pidfd is None:
+            _, status, rusage = await loop.run_in_executor(None, os.wait4, pid, 0)
+        else:
+            exited = loop.create_future()
+            loop.add_reader(pidfd, lambda: exited.done() or exited.set_result(None))
+            try:
+                await exited
+            finally:
+                loop.remove_reader(pidfd)
+                os.close(pidfd)
+            _, status, rusage = os.wait4(pid, 0)
+        returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+        record.update(returncode=returncode, cpu_seconds=round(rusage.ru_utime + rusage.ru_stime, 3),
+                      max_rss_mb=round(rusage.ru_maxrss / 1024, 1))
+    record_usage(rusage)
+    return returncode, rusage
+
+
+async def terminate_process_group(pid, exit_task):
+    """
+    终止子进程及其创建的所有进程（如 pandoc 启动的 xelatex）。
+
+    参数:
+        pid (int): 子进程 ID，也是其进程组 ID。
+        exit_task (asyncio.Task): 等待子进程退出的任务（wait_process）。
+    """
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(pid, sig)
+        except ProcessLookupError:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(exit_task), TERMINATE_GRACE_SECONDS)
+            return
+        except asyncio.TimeoutError:
+            continue
+
+
+def is_pandoc(command):
+    """
+    判断命令是否为 pandoc。
+
+    参数:
+        command (list): 命令及参数。
+
+    返回:
+        bool: 是否为 pandoc。
+    """
+    return os.path.splitext(os.path.basename(command[0]))[0] == 'pandoc'
+
+
+def make_limit_preexec(cpu_seconds=None, memory_mb=None, nice=None):
+    """
+    生成在子进程 exec 之前设置资源限制的函数，限制会被其创建的所有子进程继承。
+
+    参数:
+        cpu_seconds (int): RLIMIT_CPU（秒）。
+        memory_mb (int): RLIMIT_AS（MB）。
+        nice (int): 调度优先级的增量，越大优先级越低。
+
+    返回:
+        callable: 传给 preexec_fn 的函数；没有限制时返回 None。
+    """
+    rlimits = []
+    if cpu_seconds:
+        rlimits.append((resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + CPU_HARD_LIMIT_MARGIN)))
+    if memory_mb:
+        rlimits.append((resource.RLIMIT_AS, (memory_mb * 1024 * 1024,) * 2))
+    if not rlimits and not nice:
+        return None
+
+    def preexec():
+        for rlimit, values in rlimits:
+            resource.setrlimit(rlimit, values)
+        if nice:
+            os.nice(nice)
+
+    return preexec
+
+
+def apply_pandoc_heap_limit(command, heap_mb):
+    """
+    为 pandoc 命令加上 +RTS -M 堆上限参数。
+
+    参数:
+        command (list): 命令及参数。
+        heap_mb (int): 堆上限（MB），为 None 时不限制。
+
+    返回:
+        list: 新的命令。
+    """
+    if not heap_mb or not is_pandoc(command):
+        return command
+    return [command[0], '+RTS', f'-M{heap_mb}m', '-RTS'] + list(command[1:])
+
+
+def check_limits(result, limits):
+    """
+    根据返回码和输出判断子进程是否因资源限制退出。
+
+    参数:
+        result (ProcessResult): 运行结果。
+        limits (dict): 资源限制配置。
+
+    异常:
+        ProcessLimitError: 子进程超出 CPU 或内存限制。
+    """
+    limits = limits or {}
+    cpu_seconds = limits.get('cpu_seconds')
+    # 超出 RLIMIT_CPU 硬限制时内核发送 SIGKILL；OOM killer 等其他原因也会发送 SIGKILL，
+    # 只有 CPU 时间确实达到限制时才视为超出 CPU 限制，其余按普通失败处理
+    if cpu_seconds and (result.returncode == -signal.SIGXCPU or (
+            result.returncode == -signal.SIGKILL
+            and result.rusage.ru_utime + result.rusage.ru_stime >= cpu_seconds)):
+        raise ProcessLimitError(result.args, 'cpu', cpu_seconds, result.stderr)
+    if result.returncode != 0 and any(marker in result.stderr + result.stdout for marker in OUT_OF_MEMORY_MARKERS):
+        memory_limit = limits.get('pandoc_heap_mb') if is_pandoc(result.args) else limits.get('memory_mb')
+        raise ProcessLimitError(result.args, 'memory', memory_limit, result.stderr)
+
+
+async def run_process(command, cwd=None, env=None, timeout=None, on_stderr=None, limits=None):
+    """
+    异步运行外部命令，逐行读取 stderr，支持超时、取消和资源限制。
+
+    子进程在独立的进程组中运行，超时或协程被取消时整个进程组都会被终止。
+
+    参数:
+        command (list): 命令及参数。
+        cwd (str): 工作目录。
+        env (dict): 环境变量，为 None 时继承当前进程。
+        timeout (float): 超时时间（秒），为 None 时使用 limits 中的 timeout。
+        on_stderr (callable): 每读到一行 stderr 时调用，参数为该行文本。
+        limits (dict): 资源限制，可包含 timeout、cpu_seconds、memory_mb、pandoc_heap_mb、nice，
+            memory_mb 不用于 pandoc（GHC 运行时会预先保留大量虚拟地址空间）。
+
+    返回:
+        ProcessResult: 命令、返回码、stdout、stderr 和资源使用情况。
+
+    异常:
+        ProcessLimitError: 超出 CPU 或内存限制。
+        ProcessTimeoutError: 运行超时。
+        asyncio.CancelledError: 协程被取消。
+    """
+    limits = limits or {}
+    if timeout is None:
+        timeout = limits.get('timeout')
+    command = apply_pandoc_heap_limit(command, limits.get('pandoc_heap_mb'))
+    preexec = make_limit_preexec(limits.get('cpu_seconds'),
+                                 None if is_pandoc(command) else limits.get('memory_mb'),
+                                 limits.get('nice'))
+
+    loop = asyncio.get_running_loop()
+    # 由 os.wait4 回收子进程以取得其资源使用情况，因此不使用 asyncio.create_subprocess_exec
+    process = subprocess.Popen(
+        command,
+        cwd=cwd,
+        env=env,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        start_new_session=True,  # 独立进程组，便于一次终止所有子孙进程
+        preexec_fn=preexec,
+    )
+    exit_task = asyncio.ensure_future(wait_process(process.pid, os.path.basename(command[0])))
+    stdout_reader = asyncio.StreamReader(limit=STREAM_LIMIT)
+    stderr_reader = asyncio.StreamReader(limit=STREAM_LIMIT)
+    transports = []
+    for reader, pipe in ((stdout_reader, process.stdout), (stderr_reader, process.stderr)):
+        transport, _ = await loop.connect_read_pipe(lambda reader=reader: asyncio.StreamReaderProtocol(reader), pipe)
+        transports.append(transport)
+    stdout_chunks = []
+    stderr_lines = []
+
+    async def read_stdout():
+        while True:
+            chunk = await stdout_reader.read(65536)
+            if not chunk:
+                break
+            stdout_chunks.append(chunk)
+
+    async def read_stderr():
+        while True:
+            line = await stderr_reader.readline()
+            if not line:
+                break
+            text = line.decode('utf-8', errors='replace')
+            stderr_lines.append(text)
+            if on_stderr is not None:
+                on_stderr(text)
+
+    # shield 保证取消读取时不会取消回收子进程的任务
+    waiter = asyncio.gather(read_stdout(), read_stderr(), asyncio.shield(exit_task))
+    # 超时或取消后不再关心读取任务的结果，取出异常以免事件循环记录警告
+    waiter.add_done_callback(lambda future: future.cancelled() or future.exception())
+    try:
+        _, _, (returncode, rusage) = await asyncio.wait_for(waiter, timeout)
+    except asyncio.TimeoutError:
+        await terminate_process_group(process.pid, exit_task)
+        raise ProcessTimeoutError(command, timeout, ''.join(stderr_lines))
+    except asyncio.CancelledError:
+        await terminate_process_group(process.pid, exit_task)
+        raise
+    finally:
+        for transport in transports:
+            transport.close()
+    # 子进程已由 wait_process 回收，避免 Popen 再次等待
+    process.returncode = returncode
+
+    result = ProcessResult(
+        args=command,
+        returncode=returncode,
+        stdout=b''.join(stdout_chunks).decode('utf-8', errors='replace'),
+        stderr=''.join(stderr_lines),
+        rusage=rusage,
+    )
+    check_limits(result, limits)
+    return result
@@ -0,0 +1,285 @@
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+
+# 当前请求的性能分析记录，由 start_profile 设置；run_in_thread 在线程池中运行的函数继承调用方的上下文，
+# 这些线程在函数运行期间也被采样（DOCX 合并等 Python 计算主要在线程池中运行）
+_profile = contextvars.ContextVar('profile', default=None)
+
+# 同时进行的性能分析数：tracemalloc 对整个进程生效，第一个分析开始时启动，最后一个结束时停止
+_tracemalloc_users = 0
+_tracemalloc_lock = threading.Lock()
+
+# 采样开关状态文件的缓存：(修改时间, 状态)，多个工作进程共享同一个文件
+_state_cache = (None, {})
+
+# 内存分配最多的代码行数
+TOP_ALLOCATORS = 25
+
+# 已分配内存比上一次快照增长超过该比例时重新快照，分配最多的代码行取自内存最高时的快照
+SNAPSHOT_GROWTH = 0.1
+
+# 调用栈中缩短为相对路径的源文件目录：本项目和标准库
+SOURCE_ROOTS = (os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep,
+                os.path.dirname(os.path.abspath(os.__file__)) + os.sep)
+
+# 检查是否需要重新快照的间隔（秒）：快照耗时与已分配的内存块数成正比，不随每次采样进行
+SNAPSHOT_CHECK_SECONDS = 0.5
+
+
+def load_profiling_state(state_file):
+    """
+    读取采样开关：文件未修改时使用缓存，每个请求只需一次 stat。
+
+    参数:
+        state_file (str): 状态文件路径。
+
+    返回:
+        dict: sample_percent（采样的请求百分比）、until（自动关闭的时间，time.time()）、endpoints（采样的视图函数名）；
+            文件不存在时为空字典。
+    """
+    global _state_cache
+    try:
+        mtime = os.stat(state_file).st_mtime_ns
+    except FileNotFoundError:
+        return {}
+    if _state_cache[0] != mtime:
+        try:
+            with open(state_file, 'r', encoding='utf-8') as f:
+                _state_cache = (mtime, json.load(f))
+        except (OSError, ValueError):
+            return {}
+    return _state_cache[1]
+
+
+def save_profiling_state(state_file, state):
+    """
+    写入采样开关，先写临时文件再替换，其他进程不会读到写了一半的文件。
+    """
+    os.makedirs(os.path.dirname(state_file), exist_ok=True)
+    temp_file = f'{state_file}.{os.getpid()}.tmp'
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(temp_file, state_file)
+
+
+def should_profile(state, endpoint, chance):
+    """
+    判断是否对本请求进行性能分析。
+
+    参数:
+        state (dict): load_profiling_state 返回的采样开关。
+        endpoint (str): 处理请求的视图函数名。
+        chance (float): [0, 100) 之间的随机数。
+
+    返回:
+        bool: 采样开关未过期、视图函数在采样范围内且 chance 小于采样百分比时为 True。
+    """
+    return bool(state) and endpoint in state.get('endpoints', ()) and time.time() < state.get('until', 0) and \
+        chance < state.get('sample_percent', 0)
+
+
+def start_profile(interval):
+    """
+    开始对当前请求进行性能分析：后台线程每隔 interval 秒采样一次当前线程及本请求在线程池中运行的函数的调用栈，
+    按两次采样之间各线程实际消耗的 CPU 时间加权（等待子进程、锁和 I/O 的时间不计入）；
+    同时启动 tracemalloc 并在已分配内存增长时快照，结束时给出内存最高时分配最多的代码行。
+
+    参数:
+        interval (float): 采样间隔（秒）。
+
+    返回:
+        dict: 性能分析记录，传给 stop_profile。
+    """
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _tracemalloc_users += 1
+    profile = {
+        'threads': Counter({threading.get_ident(): 1}),
+        'stacks': Counter(),  # 折叠的调用栈 -> CPU 微秒数
+        'samples': 0,
+        'started': time.perf_counter(),
+        'baseline': tracemalloc.take_snapshot(),
+        'peak': None,
+        'peak_bytes': tracemalloc.get_traced_memory()[0],
+        'stop': threading.Event(),
+    }
+    profile['sampler'] = threading.Thread(target=sample_stacks, args=(profile, interval), daemon=True,
+                                          name='profile-sampler')
+    profile['sampler'].start()
+    _profile.set(profile)
+    return profile
+
+
+def stop_profile(profile):
+    """
+    结束性能分析。
+
+    参数:
+        profile (dict): start_profile 返回的记录。
+
+    返回:
+        dict: 结果：duration_ms、samples（采样次数）、cpu_ms（采样到的 CPU 时间）、stacks（折叠的调用栈 -> CPU 微秒数）、
+            peak_traced_mb（启动 tracemalloc 以来进程已分配内存的最高值）和
+            top_allocators（内存最高时比请求开始时多分配最多的代码行）。
+    """
+    global _tracemalloc_users
+    _profile.set(None)
+    profile['stop'].set()
+    profile['sampler'].join()
+    peak = profile['peak']
+    traced, peak_traced = tracemalloc.get_traced_memory()
+    if peak is None or traced > profile['peak_bytes']:
+        peak = tracemalloc.take_snapshot()
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0:
+            tracemalloc.stop()
+    top_allocators = [{
+        'file': format_path(stat.traceback[0].filename),
+        'line': stat.traceback[0].lineno,
+        'size_kb': round(stat.size_diff / 1024, 1),
+        'count': stat.count_diff,
+    } for stat in peak.compare_to(profile['baseline'], 'lineno')[:TOP_ALLOCATORS] if stat.size_diff > 0]
+    return {
+        'duration_ms': round((time.perf_counter() - profile['started']) * 1000, 1),
+        'samples': profile['samples'],
+        'cpu_ms': round(sum(profile['stacks'].values()) / 1000, 1),
+        'stacks': profile['stacks'],
+        'peak_traced_mb': round(peak_traced / 1024 / 1024, 1),
+        'top_allocators': top_allocators,
+    }
+
+
+@contextmanager
+def profile_thread():
+    """
+    在 with 语句块期间把当前线程加入当前请求的采样范围，由 run_in_thread 在线程池中调用；没有进行性能分析时不做任何事。
+    """
+    profile = _profile.get()
+    if profile is None:
+        yield
+        return
+    ident = threading.get_ident()
+    profile['threads'][ident] += 1
+    try:
+        yield
+    finally:
+        profile['threads'][ident] -= 1
+        if profile['threads'][ident] <= 0:
+            del profile['threads'][ident]
+
+
+def run_profiled(func, *args, **kwargs):
+    """
+    运行函数，期间当前线程计入当前请求的性能分析。
+    """
+    with profile_thread():
+        return func(*args, **kwargs)
+
+
+def sample_stacks(profile, interval):
+    """
+    采样线程：直到 profile['stop'] 被设置，每隔 interval 秒记录采样范围内各线程的调用栈和两次采样之间消耗的 CPU 时间。
+    """
+    cpu_times = {}
+    next_snapshot = time.monotonic() + SNAPSHOT_CHECK_SECONDS
+    while not profile['stop'].wait(interval):
+        frames = sys._current_frames()
+        if profile['stop'].is_set():
+            break  # 请求线程已在等待采样线程结束，不再采样
+        for ident in list(profile['threads']):
+            frame = frames.get(ident)
+            try:
+                cpu_time = time.clock_gettime(time.pthread_getcpuclockid(ident))
+            except (OSError, ValueError):
+                continue  # 线程已退出
+            # 线程第一次被采样时只记录 CPU 时间，之后按两次采样的差值计入
+            elapsed = cpu_time - cpu_times.get(ident, cpu_time)
+            cpu_times[ident] = cpu_time
+            if frame is None or elapsed <= 0:
+                continue
+            profile['stacks'][fold_stack(frame)] += int(elapsed * 1000000)
+        profile['samples'] += 1
+        if time.monotonic() >= next_snapshot:
+            next_snapshot = time.monotonic() + SNAPSHOT_CHECK_SECONDS
+            traced = tracemalloc.get_traced_memory()[0]
+            if traced > profile['peak_bytes'] * (1 + SNAPSHOT_GROWTH):
+                profile['peak'] = tracemalloc.take_snapshot()
+                profile['peak_bytes'] = traced
+
+
+def fold_stack(frame):
+    """
+    将调用栈转为火焰图工具（flamegraph.pl、speedscope）使用的折叠格式：从最外层到最内层，以分号分隔。
+
+    返回:
+        str: 如 'convert_file (app.py:752);run_coroutine_sync (util/process_operations.py:86)'。
+    """
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({format_path(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def format_path(filename):
+    """
+    缩短源文件路径：第三方库保留 site-packages 之后的部分，本项目和标准库的文件使用相对路径。
+    """
+    _, marker, rest = filename.rpartition('site-packages' + os.sep)
+    if marker:
+        return rest
+    for root in SOURCE_ROOTS:
+        if filename.startswith(root):
+            return filename[len(root):]
+    return filename
+
+
+def save_profile(directory, name, result, metadata, max_files):
+    """
+    保存性能分析结果：<name>.folded 为折叠的调用栈（每行为调用栈和 CPU 微秒数，可直接交给 flamegraph.pl 或
+    speedscope），<name>.json 为请求信息、耗时和分配内存最多的代码行。只保留最新的 max_files 个结果。
+
+    参数:
+        directory (str): 保存目录。
+        name (str): 文件名（不含扩展名）。
+        result (dict): stop_profile 的返回值。
+        metadata (dict): 请求信息，如 method、path、status。
+        max_files (int): 保留的结果数。
+    """
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, f'{name}.folded'), 'w', encoding='utf-8') as f:
+        for stack, micros in result['stacks'].most_common():
+            f.write(f'{stack} {micros}\n')
+    summary = dict(metadata, **{key: value for key, value in result.items() if key != 'stacks'})
+    with open(os.path.join(directory, f'{name}.json'), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    for old_name in list_profiles(directory)[max_files:]:
+        for suffix in ('.folded', '.json'):
+            try:
+                os.remove(os.path.join(directory, old_name + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles(directory):
+    """
+    返回:
+        list: 已保存的结果名，从新到旧排列。
+    """
+    try:
+        names = [name[:-len('.json')] for name in os.listdir(directory) if name.endswith('.json')]
+    except FileNotFoundError:
+        return []
+    return sorted(names, reverse=True)
@@ -0,0 +1,105 @@
+import time
+from util.utils import connect_sqlite
+
+
+# 令牌桶表：每个客户端的每种配额一行，记录上次更新时的令牌数
+CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS token_buckets (
+    client TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (client, bucket)
+)
+"""
+
+
+def update_tokens(db_path, client, bucket, rate, capacity, take=0.0, required=None):
+    """
+    在一个写事务中按经过的时间补充令牌，然后扣除 take 个令牌。
+
+    令牌数少于 required 时不扣除，返回需要等待的秒数。take 为负数时退还令牌，
+    令牌数可以因结算实际用量而变为负数，之后的请求需要等待令牌补回。
+
+    参数:
+        db_path (str): SQLite 数据库文件路径。
+        client (str): 客户端标识。
+        bucket (str): 配额名称，如 'upload_bytes'、'convert_cpu'。
+        rate (float): 每秒补充的令牌数。
+        capacity (float): 令牌桶容量。
+        take (float): 要扣除的令牌数。
+        required (float): 扣除前至少需要的令牌数，为 None 时不检查。
+
+    返回:
+        float: 需要等待的秒数；为 0 时已扣除。
+    """
+    now = time.time()
+    connection = connect_sqlite(db_path, CREATE_TABLE_SQL)
+    try:
+        connection.execute('BEGIN IMMEDIATE')  # 立即取得写锁，避免多个进程同时读到相同的令牌数
+        row = connection.execute('SELECT tokens, updated FROM token_buckets WHERE client = ? AND bucket = ?',
+                                 (client, bucket)).fetchone()
+        tokens = capacity if row is None else min(capacity, row[0] + max(0.0, now - row[1]) * rate)
+        if required is not None and tokens < required:
+            connection.execute('ROLLBACK')
+            return (required - tokens) / rate if rate > 0 else float('inf')
+        connection.execute('INSERT OR REPLACE INTO token_buckets (client, bucket, tokens, updated) VALUES (?, ?, ?, ?)',
+                           (client, bucket, min(capacity, tokens - take), now))
+        connection.execute('COMMIT')
+        return 0.0
+    finally:
+        connection.close()
+
+
+def consume_tokens(db_path, client, bucket, amount, rate, capacity):
+    """
+    尝试从客户端的令牌桶中扣除 amount 个令牌。
+
+    超过容量的请求只要求令牌桶是满的，避免大文件永远无法通过。
+
+    参数:
+        db_path (str): SQLite 数据库文件路径。
+        client (str): 客户端标识。
+        bucket (str): 配额名称。
+        amount (float): 要扣除的令牌数。
+        rate (float): 每秒补充的令牌数。
+        capacity (float): 令牌桶容量。
+
+    返回:
+        float: 需要等待的秒数；为 0 时已扣除。
+    """
+    return update_tokens(db_path, client, bucket, rate, capacity, take=amount, required=min(amount, capacity))
+
+
+def settle_tokens(db_path, client, bucket, delta, rate, capacity):
+    """
+    按实际用量结算预扣的令牌：delta 为正时退还，为负时补扣（可以欠费）。
+
+    参数:
+        db_path (str): SQLite 数据库文件路径。
+        client (str): 客户端标识。
+        bucket (str): 配额名称。
+        delta (float): 退还的令牌数。
+        rate (float): 每秒补充的令牌数。
+        capacity (float): 令牌桶容量。
+    """
+    update_tokens(db_path, client, bucket, rate, capacity, take=-delta)
+
+
+def prune_token_buckets(db_path, max_idle_seconds):
+    """
+    删除长时间没有更新的令牌桶，它们早已补满，删除后与新客户端相同。
+
+    参数:
+        db_path (str): SQLite 数据库文件路径。
+        max_idle_seconds (float): 最长空闲时间（秒）。
+
+    返回:
+        int: 删除的行数。
+    """
+    connection = connect_sqlite(db_path, CREATE_TABLE_SQL)
+    try:
+        cursor = connection.execute('DELETE FROM token_buckets WHERE updated < ?', (time.time() - max_idle_seconds,))
+        return cursor.rowcount
+    finally:
+        connection.close()
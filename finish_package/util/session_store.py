@@ -0,0 +1,270 @@
+import time
+from util.utils import connect_sqlite
+
+
+# 上传记录：urlid -> 解压出的 Markdown 文件名
+CREATE_UPLOADS_SQL = """
+CREATE TABLE IF NOT EXISTS uploads (
+    urlid TEXT PRIMARY KEY,
+    md_filename TEXT NOT NULL,
+    created REAL NOT NULL
+)
+"""
+
+# 已完成的转换：(urlid, 作业键) -> 输出文件对应的转换键摘要
+CREATE_CONVERSIONS_SQL = """
+CREATE TABLE IF NOT EXISTS conversions (
+    urlid TEXT NOT NULL,
+    job_key TEXT NOT NULL,
+    flight_hash TEXT NOT NULL,
+    PRIMARY KEY (urlid, job_key)
+)
+"""
+
+# 取消广播：每个工作进程轮询其他进程写入的新记录，终止自己进程中在该时间之前登记的作业；
+# job_key 为 NULL 时取消 urlid 的所有作业；flight_hash 为取代旧作业的新作业的转换键摘要，转换键相同的作业不取消
+CREATE_CANCELLATIONS_SQL = """
+CREATE TABLE IF NOT EXISTS cancellations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    urlid TEXT NOT NULL,
+    job_key TEXT,
+    flight_hash TEXT,
+    origin INTEGER NOT NULL,
+    cancelled_at REAL NOT NULL
+)
+"""
+
+# 会话过期索引：本节点每个 urlid 的目录大小、最后访问时间和过期时间，后台任务按过期时间删除过期的会话，
+# 超出磁盘预算时按最后访问时间删除最近最少使用的会话
+CREATE_SESSIONS_SQL = """
+CREATE TABLE IF NOT EXISTS sessions (
+    urlid TEXT PRIMARY KEY,
+    size_bytes INTEGER NOT NULL,
+    last_access REAL NOT NULL,
+    expires_at REAL NOT NULL
+)
+"""
+CREATE_SESSIONS_EXPIRES_INDEX_SQL = 'CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)'
+CREATE_SESSIONS_ACCESS_INDEX_SQL = 'CREATE INDEX IF NOT EXISTS sessions_last_access ON sessions (last_access)'
+
+SCHEMA = (CREATE_UPLOADS_SQL, CREATE_CONVERSIONS_SQL, CREATE_CANCELLATIONS_SQL, CREATE_SESSIONS_SQL,
+          CREATE_SESSIONS_EXPIRES_INDEX_SQL, CREATE_SESSIONS_ACCESS_INDEX_SQL)
+
+
+def execute(db_path, sql, parameters=()):
+    """
+    在共享数据库中执行一条语句。
+
+    参数:
+        db_path (str): SQLite 数据库文件路径。
+        sql (str): SQL 语句。
+        parameters (tuple): 语句参数。
+
+    返回:
+        list: 查询结果的所有行；非查询语句返回空列表。
+    """
+    connection = connect_sqlite(db_path, *SCHEMA)
+    try:
+        return connection.execute(sql, parameters).fetchall()
+    finally:
+        connection.close()
+
+
+def record_upload(db_path, urlid, md_filename):
+    """
+    记录上传解压出的 Markdown 文件名，重新上传时覆盖，并清除旧文件的转换记录。
+
+    参数:
+        db_path (str): SQLite 数据库文件路径。
+        urlid (str): 上传文件的唯一标识符。
+        md_filename (str): Markdown 文件名。
+    """
+    connection = connect_sqlite(db_path, *SCHEMA)
+    try:
+        connection.execute('BEGIN IMMEDIATE')
+        connection.execute('INSERT OR REPLACE INTO uploads (urlid, md_filename, created) VALUES (?, ?, ?)',
+                           (urlid, md_filename, time.time()))
+        connection.execute('DELETE FROM conversions WHERE urlid = ?', (urlid,))
+        connection.execute('COMMIT')
+    finally:
+        connection.close()
+
+
+def get_upload(db_path, urlid):
+    """
+    参数:
+        db_path (str): SQLite 数据库文件路径。
+        urlid (str): 上传文件的唯一标识符。
+
+    返回:
+        str: Markdown 文件名；没有上传记录时返回 None。
+    """
+    rows = execute(db_path, 'SELECT md_filename FROM uploads WHERE urlid = ?', (urlid,))
+    return rows[0][0] if rows else None
+
+
+def delete_upload(db_path, urlid):
+    """
+    删除 urlid 的上传记录、转换记录和过期索引。
+
+    参数:
+        db_path (str): SQLite 数据库文件路径。
+        urlid (str): 上传文件的唯一标识符。
+    """
+    connection = connect_sqlite(db_path, *SCHEMA)
+    try:
+        connection.execute('BEGIN IMMEDIATE')
+        connection.execute('DELETE FROM uploads WHERE urlid = ?', (urlid,))
+        connection.execute('DELETE FROM conversions WHERE urlid = ?', (urlid,))
+        connection.execute('DELETE FROM sessions WHERE urlid = ?', (urlid,))
+        connection.execute('COMMIT')
+    finally:
+        connection.close()
+
+
+def record_session_access(db_path, urlid, ttl, size_bytes=None):
+    """
+    记录会话被访问：最后访问时间更新为当前时间，过期时间顺延为 ttl 秒后。
+
+    参数:
+        db_path (str): SQLite 数据库文件路径。
+        urlid (str): 上传文件的唯一标识符。
+        ttl (float): 会话在最后一次访问后的保留时间（秒）。
+        size_bytes (int): 会话目录的总大小；为 None 时保留原来的值。
+    """
+    now = time.time()
+    execute(db_path, 'INSERT INTO sessions (urlid, size_bytes, last_access, expires_at) VALUES (?, ?, ?, ?) '
+                     'ON CONFLICT (urlid) DO UPDATE SET size_bytes = COALESCE(?, size_bytes), '
+                     'last_access = excluded.last_access, expires_at = excluded.expires_at',
+            (urlid, size_bytes or 0, now, now + ttl, size_bytes))
+
+
+def get_expired_sessions(db_path, limit):
+    """
+    参数:
+        db_path (str): SQLite 数据库文件路径。
+        limit (int): 最多返回的会话数。
+
+    返回:
+        list: 已过期的 urlid，最早过期的在前。
+    """
+    rows = execute(db_path, 'SELECT urlid FROM sessions WHERE expires_at <= ? ORDER BY expires_at LIMIT ?',
+                   (time.time(), limit))
+    return [row[0] for row in rows]
+
+
+def get_session_usage(db_path):
+    """
+    返回:
+        int: 过期索引中所有会话目录的总大小（字节）。
+    """
+    return execute(db_path, 'SELECT COALESCE(SUM(size_bytes), 0) FROM sessions')[0][0]
+
+
+def get_least_recent_sessions(db_path, idle_seconds, limit):
+    """
+    参数:
+        db_path (str): SQLite 数据库文件路径。
+        idle_seconds (float): 只返回超过该时间未访问的会话，正在使用的会话不被淘汰。
+        limit (int): 最多返回的会话数。
+
+    返回:
+        list: [(urlid, 目录大小, 最后访问时间), ...]，最久未访问的在前。
+    """
+    return execute(db_path, 'SELECT urlid, size_bytes, last_access FROM sessions WHERE last_access < ? '
+                            'ORDER BY last_access LIMIT ?', (time.time() - idle_seconds, limit))
+
+
+def mark_conversion_completed(db_path, urlid, job_key, flight_hash):
+    """
+    记录 urlid 的输出文件已是该转换的结果。
+
+    参数:
+        db_path (str): SQLite 数据库文件路径。
+        urlid (str): 上传文件的唯一标识符。
+        job_key (str): 作业键，如输出格式。
+        flight_hash (str): 转换键摘要。
+    """
+    execute(db_path, 'INSERT OR REPLACE INTO conversions (urlid, job_key, flight_hash) VALUES (?, ?, ?)',
+            (urlid, job_key, flight_hash))
+
+
+def get_completed_conversion(db_path, urlid, job_key):
+    """
+    参数:
+        db_path (str): SQLite 数据库文件路径。
+        urlid (str): 上传文件的唯一标识符。
+        job_key (str): 作业键。
+
+    返回:
+        str: 输出文件对应的转换键摘要；没有已完成的转换时返回 None。
+    """
+    rows = execute(db_path, 'SELECT flight_hash FROM conversions WHERE urlid = ? AND job_key = ?', (urlid, job_key))
+    return rows[0][0] if rows else None
+
+
+def record_cancellation(db_path, urlid, job_key, flight_hash, origin):
+    """
+    广播取消 urlid 的转换：清除其转换记录，并通知其他工作进程。
+
+    参数:
+        db_path (str): SQLite 数据库文件路径。
+        urlid (str): 上传文件的唯一标识符。
+        job_key (str): 作业键；为 None 时取消 urlid 的所有作业。
+        flight_hash (str): 取代旧作业的新作业的转换键摘要，为 None 时取消所有匹配的作业。
+        origin (int): 发起取消的进程 ID，该进程已自行取消，不再处理这条记录。
+    """
+    connection = connect_sqlite(db_path, *SCHEMA)
+    try:
+        connection.execute('BEGIN IMMEDIATE')
+        if job_key is None:
+            connection.execute('DELETE FROM conversions WHERE urlid = ?', (urlid,))
+        else:
+            connection.execute('DELETE FROM conversions WHERE urlid = ? AND job_key = ?', (urlid, job_key))
+        connection.execute('INSERT INTO cancellations (urlid, job_key, flight_hash, origin, cancelled_at) '
+                           'VALUES (?, ?, ?, ?, ?)', (urlid, job_key, flight_hash, origin, time.time()))
+        connection.execute('COMMIT')
+    finally:
+        connection.close()
+
+
+def get_cancellations(db_path, after_id, origin):
+    """
+    参数:
+        db_path (str): SQLite 数据库文件路径。
+        after_id (int): 上次读到的最大记录 ID；为 None 时只返回当前的最大记录 ID，不返回历史记录。
+        origin (int): 当前进程 ID，不返回该进程自己写入的记录。
+
+    返回:
+        tuple: (最大记录 ID, [(urlid, 作业键, 转换键摘要, 取消时间), ...])。
+    """
+    if after_id is None:
+        rows = execute(db_path, 'SELECT COALESCE(MAX(id), 0) FROM cancellations')
+        return rows[0][0], []
+    rows = execute(db_path, 'SELECT id, urlid, job_key, flight_hash, origin, cancelled_at FROM cancellations '
+                            'WHERE id > ? ORDER BY id', (after_id,))
+    if not rows:
+        return after_id, []
+    return rows[-1][0], [row[1:4] + row[5:] for row in rows if row[4] != origin]
+
+
+def prune_session_store(db_path, upload_max_age, cancellation_max_age):
+    """
+    删除过期的上传记录（不在过期索引中、其目录已被删除）和已被所有进程处理过的取消记录。
+
+    参数:
+        db_path (str): SQLite 数据库文件路径。
+        upload_max_age (float): 不在过期索引中的上传记录的保留时间（秒）。
+        cancellation_max_age (float): 取消记录的保留时间（秒）。
+    """
+    now = time.time()
+    connection = connect_sqlite(db_path, *SCHEMA)
+    try:
+        connection.execute('BEGIN IMMEDIATE')
+        expired_uploads = 'SELECT urlid FROM uploads WHERE created < ? AND urlid NOT IN (SELECT urlid FROM sessions)'
+        connection.execute(f'DELETE FROM conversions WHERE urlid IN ({expired_uploads})', (now - upload_max_age,))
+        connection.execute(f'DELETE FROM uploads WHERE urlid IN ({expired_uploads})', (now - upload_max_age,))
+        connection.execute('DELETE FROM cancellations WHERE cancelled_at < ?', (now - cancellation_max_age,))
+        connection.execute('COMMIT')
+    finally:
+        connection.close()
@@ -0,0 +1,94 @@
+import mimetypes
+import os
+import re
+import shutil
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from util.utils import compute_file_hash
+from util.compress_operations import precompress_file, PRECOMPRESSED_ENCODINGS
+
+
+# 构建工具生成的带内容哈希的资源文件名，例如 index-Cbo31Pn8.js
+HASHED_ASSET_PATTERN = re.compile(r'[A-Za-z0-9_.-]+-[A-Za-z0-9_-]{8}\.(?:js|css|png|jpe?g|gif|svg|ico|ttf|otf|woff2?|json)')
+
+# 值得预压缩的文本类资源，图片和 woff/woff2 字体本身已经压缩过
+COMPRESSIBLE_EXTENSIONS = {'.js', '.css', '.svg', '.ttf', '.otf', '.json', '.ico'}
+
+
+def find_referenced_assets(index_path, assets_dir):
+    """
+    从 index.html 出发，查找页面实际引用到的全部资源文件（包括 JS/CSS 中间接引用的资源）。
+
+    旧版本构建留下的、已不再被引用的资源文件不会出现在结果中。
+
+    参数:
+        index_path (str): index.html 文件路径。
+        assets_dir (str): 静态资源目录。
+
+    返回:
+        list: 相对于 assets_dir 的资源路径列表。
+    """
+    # 带哈希的文件名全局唯一，用文件名即可定位资源
+    assets_by_name = {}
+    for root, _, files in os.walk(assets_dir):
+        for name in files:
+            assets_by_name[name] = os.path.relpath(os.path.join(root, name), assets_dir).replace(os.sep, '/')
+
+    with open(index_path, 'r', encoding='utf-8') as f:
+        pending = deque(HASHED_ASSET_PATTERN.findall(f.read()))
+
+    referenced = []
+    while pending:
+        name = pending.popleft()
+        relative_path = assets_by_name.get(name)
+        if relative_path is None or relative_path in referenced:
+            continue
+        referenced.append(relative_path)
+        if os.path.splitext(name)[1] in ('.js', '.css'):
+            with open(os.path.join(assets_dir, relative_path), 'r', encoding='utf-8', errors='ignore') as f:
+                pending.extend(HASHED_ASSET_PATTERN.findall(f.read()))
+    return referenced
+
+
+def build_static_manifest(index_path, assets_dir, cache_dir):
+    """
+    启动时为页面引用的静态资源生成清单，并将文本类资源预压缩为 .gz/.br 存入缓存目录。
+
+    参数:
+        index_path (str): index.html 文件路径。
+        assets_dir (str): 静态资源目录。
+        cache_dir (str): 预压缩文件缓存目录。
+
+    返回:
+        dict: 资源相对路径到资源信息的映射，资源信息包含 path、etag、mimetype 和
+            encodings（编码名称到预压缩文件路径的映射）。
+    """
+    def build_entry(relative_path):
+        source_path = os.path.join(assets_dir, relative_path)
+        entry = {
+            'path': source_path,
+            'etag': compute_file_hash(source_path),
+            'mimetype': mimetypes.guess_type(source_path)[0] or 'application/octet-stream',
+            'encodings': {},
+        }
+
+        if os.path.splitext(relative_path)[1] in COMPRESSIBLE_EXTENSIONS:
+            # 缓存目录中的副本按内容哈希命名，资源未变化时直接复用上次的压缩结果
+            cached_path = os.path.join(cache_dir, entry['etag'] + os.path.splitext(relative_path)[1])
+            if not os.path.exists(cached_path):
+                os.makedirs(cache_dir, exist_ok=True)
+                temp_path = f"{cached_path}.{os.getpid()}.tmp"
+                shutil.copyfile(source_path, temp_path)
+                precompress_file(temp_path)
+                for _, suffix in PRECOMPRESSED_ENCODINGS:
+                    if os.path.exists(temp_path + suffix):
+                        os.replace(temp_path + suffix, cached_path + suffix)
+                os.replace(temp_path, cached_path)
+            for encoding, suffix in PRECOMPRESSED_ENCODINGS:
+                if os.path.exists(cached_path + suffix):
+                    entry['encodings'][encoding] = cached_path + suffix
+        return entry
+
+    relative_paths = find_referenced_assets(index_path, assets_dir)
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as executor:
+        return dict(zip(relative_paths, executor.map(build_entry, relative_paths)))
@@ -0,0 +1,323 @@
+import hashlib
+import os
+import re
+import shutil
+import time
+import uuid
+
+
+# 内存文件系统的挂载点，SCRATCH_DIR 或 OUTPUT_DIR 为 'tmpfs' 时在其下创建本应用的目录
+TMPFS_ROOT = '/dev/shm'
+
+# 解压目录、模板目录和临时文件的根目录（scratch），以及转换输出目录的根目录，由 configure_storage 设置；
+# 未设置时为工作目录
+_scratch_root = None
+_output_root = None
+
+# 会话目录按 <根目录>/<日期>/<分片>/<urlid> 存放：日期取自 urlid 的 YYYYMMDD 前缀，过期时整个日期目录一次删除；
+# 分片为 urlid 摘要的前 SHARD_HEX_DIGITS 位十六进制数，每个目录中的条目数保持在几百以内
+SHARD_HEX_DIGITS = 2
+DATE_DIR_PATTERN = re.compile(r'\d{8}$')
+URLID_PATTERN = re.compile(r'[0-9A-Za-z-]{1,100}$')
+
+# 不以日期开头的 urlid（由客户端指定）所在的目录，其中的会话按修改时间过期
+UNDATED_DIR = 'undated'
+
+# 待删除的目录先改名移入其根目录下的 TRASH_DIR，请求立即返回，再由 reap_trash 在后台限速删除；
+# 同一文件系统内的改名是原子的，耗时与目录大小无关
+TRASH_DIR = 'trash'
+
+# reap_trash 每删除一批条目后休眠一次，每秒唤醒约 REAP_WAKEUPS_PER_SECOND 次
+REAP_WAKEUPS_PER_SECOND = 10
+
+
+def resolve_storage_root(setting):
+    """
+    将存储位置配置解析为绝对路径。
+
+    参数:
+        setting (str): '' 为工作目录；'tmpfs' 为 TMPFS_ROOT 下按工作目录区分的目录，没有 TMPFS_ROOT 时（如 macOS、Windows）
+            退回工作目录；其他值为目录路径（相对路径相对于工作目录）。
+
+    返回:
+        str: 根目录的绝对路径。
+    """
+    if setting == 'tmpfs':
+        if not os.path.isdir(TMPFS_ROOT):
+            return os.getcwd()
+        # 同一台主机上的多套部署各用一个目录
+        return os.path.join(TMPFS_ROOT, 'md2doc-' + hashlib.sha256(os.getcwd().encode('utf-8')).hexdigest()[:12])
+    return os.path.abspath(setting or os.getcwd())
+
+
+def configure_storage(scratch_dir='', output_dir=''):
+    """
+    设置解压、模板、临时文件和转换输出所在的根目录，并创建这些目录。
+
+    参数:
+        scratch_dir (str): 解压目录、模板目录和临时文件的根目录，取值见 resolve_storage_root。
+        output_dir (str): 转换输出目录的根目录，取值见 resolve_storage_root。
+
+    返回:
+        tuple: (scratch 根目录, 输出根目录) 的绝对路径。
+    """
+    global _scratch_root, _output_root
+    _scratch_root = resolve_storage_root(scratch_dir)
+    _output_root = resolve_storage_root(output_dir)
+    for root in (_scratch_root, _output_root):
+        os.makedirs(root, exist_ok=True)
+    return _scratch_root, _output_root
+
+
+def get_scratch_root():
+    """
+    返回:
+        str: 解压目录、模板目录和临时文件的根目录。
+    """
+    return _scratch_root or os.getcwd()
+
+
+def get_output_root():
+    """
+    返回:
+        str: 转换输出目录的根目录。
+    """
+    return _output_root or os.getcwd()
+
+
+def get_storage_roots():
+    """
+    返回:
+        list: 存放 urlid 目录的所有根目录（去重），定时清理时逐个检查。
+    """
+    return list(dict.fromkeys([get_scratch_root(), get_output_root()]))
+
+
+def is_valid_urlid(urlid):
+    """
+    返回:
+        bool: urlid 是否只包含字母、数字和 -，可以作为目录名。
+    """
+    return bool(urlid) and URLID_PATTERN.match(urlid) is not None
+
+
+def get_session_dir(root, urlid):
+    """
+    获取 urlid 在根目录下的会话目录：<根目录>/<日期>/<分片>/<urlid>。
+
+    参数:
+        root (str): 根目录。
+        urlid (str): 上传文件的唯一标识符。
+
+    返回:
+        str: 会话目录。
+
+    异常:
+        ValueError: urlid 不能作为目录名。
+    """
+    if not is_valid_urlid(urlid):
+        raise ValueError(f"Invalid urlid: {urlid}")
+    date = urlid[:8] if DATE_DIR_PATTERN.match(urlid[:8]) and urlid[8:9] in ('', '-') else UNDATED_DIR
+    shard = hashlib.sha256(urlid.encode('utf-8')).hexdigest()[:SHARD_HEX_DIGITS]
+    return os.path.join(root, date, shard, urlid)
+
+
+def get_upload_dir(urlid):
+    """
+    返回:
+        str: 上传压缩包的解压目录。
+    """
+    return os.path.join(get_session_dir(get_scratch_root(), urlid), 'upload')
+
+
+def get_template_dir(urlid):
+    """
+    返回:
+        str: 页眉模板、Logo、文档特征等转换中间文件所在的模板目录。
+    """
+    return os.path.join(get_session_dir(get_scratch_root(), urlid), 'template')
+
+
+def get_output_dir(urlid):
+    """
+    返回:
+        str: 转换输出目录。
+    """
+    return os.path.join(get_session_dir(get_output_root(), urlid), 'out')
+
+
+def get_temp_dir():
+    """
+    返回:
+        str: 保存上传中的压缩包等临时文件的目录，已创建。
+    """
+    temp_dir = os.path.join(get_scratch_root(), 'temp')
+    os.makedirs(temp_dir, exist_ok=True)
+    return temp_dir
+
+
+def get_session_size(urlid):
+    """
+    返回:
+        int: urlid 的解压、输出和模板目录中所有文件的总大小（字节）。
+    """
+    size = 0
+    for root in get_storage_roots():
+        for directory, _, files in os.walk(get_session_dir(root, urlid)):
+            for name in files:
+                try:
+                    size += os.lstat(os.path.join(directory, name)).st_size
+                except OSError:
+                    pass  # 文件在统计期间被删除
+    return size
+
+
+def move_to_trash(path, root):
+    """
+    将目录改名移入 root 下的 TRASH_DIR，由 reap_trash 在后台删除。不能改名（如 path 位于另一个文件系统）时直接删除。
+
+    参数:
+        path (str): 要删除的目录。
+        root (str): path 所在的根目录，回收目录位于其下。
+
+    返回:
+        bool: path 存在并已移走或删除时为 True，不存在时为 False。
+    """
+    trash_dir = os.path.join(root, TRASH_DIR)
+    os.makedirs(trash_dir, exist_ok=True)
+    try:
+        os.rename(path, os.path.join(trash_dir, f'{uuid.uuid4().hex}-{os.path.basename(path)}'))
+    except FileNotFoundError:
+        return False
+    except OSError:
+        shutil.rmtree(path, ignore_errors=True)
+    return True
+
+
+def reap_trash(roots, stop_event, entries_per_second):
+    """
+    删除各根目录下 TRASH_DIR 中的所有文件和目录，每秒最多删除 entries_per_second 个条目，使删除产生的磁盘 I/O
+    平摊到较长的时间内。
+
+    参数:
+        roots (list): 根目录。
+        stop_event (threading.Event): 停止事件，设置后立即返回。
+        entries_per_second (float): 每秒最多删除的文件和目录数。
+
+    返回:
+        int: 删除的条目数。
+    """
+    batch = max(1, int(entries_per_second / REAP_WAKEUPS_PER_SECOND))
+    deleted = 0
+    for root in roots:
+        trash_dir = os.path.join(root, TRASH_DIR)
+        if not os.path.isdir(trash_dir):
+            continue
+        for directory, dirs, files in os.walk(trash_dir, topdown=False):
+            for name in files + dirs:
+                path = os.path.join(directory, name)
+                try:
+                    if name in dirs and not os.path.islink(path):
+                        os.rmdir(path)
+                    else:
+                        os.unlink(path)
+                except OSError:
+                    continue  # 已被其他进程删除
+                deleted += 1
+                if deleted % batch == 0 and stop_event.wait(batch / entries_per_second):
+                    return deleted
+    return deleted
+
+
+def delete_urlid_dirs(urlid):
+    """
+    删除 urlid 的解压、输出和模板目录（移入回收目录），以及因此变空的分片和日期目录。
+    """
+    for root in get_storage_roots():
+        session_dir = get_session_dir(root, urlid)
+        move_to_trash(session_dir, root)
+        shard_dir = os.path.dirname(session_dir)
+        for directory in (shard_dir, os.path.dirname(shard_dir)):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                break  # 目录不为空或已被删除
+
+
+def delete_expired_sessions(before_date, max_age):
+    """
+    删除（移入回收目录）超过最长保留时间的会话目录：日期早于 before_date 的整个日期目录，以及 UNDATED_DIR 中超过 max_age 秒未修改的会话。
+    只列出各根目录下的日期目录和 UNDATED_DIR 的分片，不逐个检查日期目录中的会话。用于兜底清理过期索引中没有登记的目录。
+
+    参数:
+        before_date (str): 日期（YYYYMMDD），早于该日期的会话过期。
+        max_age (float): 不以日期开头的会话的最长保留时间（秒）。
+
+    返回:
+        list: 已删除的目录。
+    """
+    deleted = []
+    cutoff = time.time() - max_age
+    for root in get_storage_roots():
+        for entry in os.scandir(root):
+            if entry.is_dir() and DATE_DIR_PATTERN.match(entry.name) and entry.name < before_date:
+                move_to_trash(entry.path, root)
+                deleted.append(entry.path)
+        undated_dir = os.path.join(root, UNDATED_DIR)
+        if not os.path.isdir(undated_dir):
+            continue
+        for shard in os.scandir(undated_dir):
+            for session in os.scandir(shard.path):
+                if session.is_dir() and session.stat().st_mtime < cutoff:
+                    move_to_trash(session.path, root)
+                    deleted.append(session.path)
+    return deleted
+
+
+def scan_cache_entries(directories):
+    """
+    列出缓存目录（图片缓存、linked 模式的共享资源目录）中的所有文件。
+
+    参数:
+        directories (list): 缓存目录，不存在的目录被跳过。
+
+    返回:
+        list: [(最后使用时间, 大小, 路径), ...]，最久未使用的在前；最后使用时间为访问时间和修改时间中较晚的一个。
+    """
+    entries = []
+    for cache_dir in directories:
+        for directory, _, files in os.walk(cache_dir):
+            for name in files:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.lstat(path)
+                except OSError:
+                    continue  # 文件在扫描期间被删除
+                entries.append((max(stat.st_atime, stat.st_mtime), stat.st_size, path))
+    entries.sort()
+    return entries
+
+
+def delete_cache_entries(entries, stop_event, entries_per_second):
+    """
+    删除缓存文件，每秒最多 entries_per_second 个。分片目录保留（最多 256 个），避免与正在写入缓存的转换冲突。
+
+    参数:
+        entries (list): scan_cache_entries 返回的条目。
+        stop_event (threading.Event): 停止事件，设置后立即返回。
+        entries_per_second (float): 每秒最多删除的文件数。
+
+    返回:
+        int: 删除的文件总大小（字节）。
+    """
+    batch = max(1, int(entries_per_second / REAP_WAKEUPS_PER_SECOND))
+    freed = 0
+    for index, (_, size, path) in enumerate(entries, 1):
+        try:
+            os.unlink(path)
+        except OSError:
+            continue  # 已被其他进程删除
+        freed += size
+        if index % batch == 0 and stop_event.wait(batch / entries_per_second):
+            break
+    return freed
@@ -0,0 +1,147 @@
+import contextvars
+import json
+import time
+from contextlib import contextmanager
+
+
+# 当前请求的时间线，由 start_timeline 设置；为 None 时 span 不做任何记录。
+# 协程和 run_in_thread 中的函数继承调用方的上下文，转换中的各步骤都记入发起转换的请求
+_timeline = contextvars.ContextVar('timeline', default=None)
+
+# 当前所在 span 在时间线中的序号，新的 span 以它为父节点
+_parent = contextvars.ContextVar('span_parent', default=None)
+
+# Server-Timing 响应头中最多包含的 span 数，避免响应头过长
+SERVER_TIMING_MAX_SPANS = 64
+
+
+def start_timeline():
+    """
+    为当前请求（或工作节点上的作业）开始一条新的时间线。
+
+    返回:
+        dict: 时间线：started（time.perf_counter() 起点）、started_at（对应的 time.time()）和 spans（span 列表）。
+    """
+    timeline = {'started': time.perf_counter(), 'started_at': time.time(), 'spans': []}
+    _timeline.set(timeline)
+    _parent.set(None)
+    return timeline
+
+
+def clear_timeline():
+    """
+    结束当前时间线，之后的 span 不再记录（如请求结束后仍在后台运行的预渲染）。
+    """
+    _timeline.set(None)
+    _parent.set(None)
+
+
+def get_timeline():
+    """
+    返回:
+        dict: 当前时间线；没有时返回 None。
+    """
+    return _timeline.get()
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    在当前时间线中记录 with 语句块的开始时间和耗时，嵌套的 span 记为子节点。没有时间线时不做任何记录。
+
+    参数:
+        name (str): 名称，如被调用的函数名或子进程的命令名。
+        **attributes: 附加的属性。
+
+    返回:
+        dict: span 记录，语句块中可以添加属性（如子进程的 cpu_seconds、max_rss_mb）；抛出异常时记录 error。
+    """
+    timeline = _timeline.get()
+    if timeline is None:
+        yield {}
+        return
+    start = time.perf_counter()
+    record = dict(attributes, name=name, start=start - timeline['started'], duration=None, parent=_parent.get())
+    timeline['spans'].append(record)  # list.append 是原子的，线程池中的步骤可以同时追加
+    token = _parent.set(len(timeline['spans']) - 1)
+    try:
+        yield record
+    except BaseException as e:
+        record['error'] = type(e).__name__
+        raise
+    finally:
+        record['duration'] = time.perf_counter() - start
+        _parent.reset(token)
+
+
+def add_spans(spans, started_at):
+    """
+    把其他进程（如分布式模式下的工作节点）记录的 span 作为当前 span 的子节点加入当前时间线。
+
+    参数:
+        spans (list): export_spans 导出的 span。
+        started_at (float): 这些 span 所在时间线的起点（time.time()），用于换算开始时间；各主机的时钟需要同步。
+    """
+    timeline = _timeline.get()
+    if timeline is None or not spans:
+        return
+    base = len(timeline['spans'])
+    offset = (started_at - timeline['started_at']) * 1000
+    for record in spans:
+        record = dict(record, start_ms=round(record['start_ms'] + offset, 1))
+        record['parent'] = _parent.get() if record.get('parent') is None else record['parent'] + base
+        timeline['spans'].append(record)
+
+
+def export_spans(timeline):
+    """
+    将时间线中的 span 转为可序列化为 JSON 的列表，时间单位为毫秒。
+
+    返回:
+        list: 每个 span 为 name、start_ms、duration_ms、parent（父节点序号）及其他属性，按开始顺序排列。
+    """
+    exported = []
+    for record in timeline['spans']:
+        if 'start_ms' in record:  # 由 add_spans 加入的 span 已经是导出格式
+            exported.append(record)
+            continue
+        record = dict(record)
+        start = record.pop('start')
+        duration = record.pop('duration')
+        record['start_ms'] = round(start * 1000, 1)
+        record['duration_ms'] = None if duration is None else round(duration * 1000, 1)
+        exported.append(record)
+    return exported
+
+
+def summarize_timeline(timeline):
+    """
+    返回:
+        dict: 时间线中所有子进程的 CPU 秒数之和（cpu_seconds）和最大常驻内存（max_rss_mb）。
+    """
+    processes = [record for record in timeline['spans'] if 'cpu_seconds' in record]
+    return {
+        'cpu_seconds': round(sum(record['cpu_seconds'] for record in processes), 3),
+        'max_rss_mb': max((record['max_rss_mb'] for record in processes), default=0.0),
+    }
+
+
+def format_server_timing(spans):
+    """
+    将 span 格式化为 Server-Timing 响应头，浏览器开发者工具的 Timing 面板可直接查看。
+
+    参数:
+        spans (list): export_spans 导出的 span。
+
+    返回:
+        str: 响应头的值，如 'pandoc;dur=1520.3;desc="@12.5ms cpu=1.41s rss=96.2MB"'。
+    """
+    entries = []
+    for record in spans[:SERVER_TIMING_MAX_SPANS]:
+        description = f"@{record['start_ms']}ms"
+        if 'cpu_seconds' in record:
+            description += f" cpu={record['cpu_seconds']}s rss={record['max_rss_mb']}MB"
+        if 'error' in record:
+            description += f" error={record['error']}"
+        entries.append(f"{record['name']};dur={record['duration_ms'] or 0};desc={json.dumps(description)}")
+    return ', '.join(entries)
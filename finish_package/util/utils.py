@@ -1,11 +1,100 @@
-import uuid
-from datetime import datetime
-
-def generate_unique_urlid():
-    """
-    生成一个独一无二的urlid，前面加上当前的日期（格式：YYYYMMDD）。
-    """
-    current_date = datetime.now().strftime('%Y%m%d')
-    unique_id = str(uuid.uuid4())
-    return f"{current_date}-{unique_id}"
-
+import hashlib
+import os
+import sqlite3
+import time
+import uuid
+from datetime import datetime
+
+def generate_unique_urlid():
+    """
+    生成一个独一无二的urlid，前面加上当前的日期（格式：YYYYMMDD）。
+    """
+    current_date = datetime.now().strftime('%Y%m%d')
+    unique_id = str(uuid.uuid4())
+    return f"{current_date}-{unique_id}"
+
+
+def compute_file_hash(file_path, chunk_size=1024 * 1024):
+    """
+    计算文件内容的 SHA-256 摘要。
+
+    参数:
+        file_path (str): 文件路径。
+        chunk_size (int): 每次读取的字节数。
+
+    返回:
+        str: 十六进制摘要字符串。
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_cached_file_hash(file_path):
+    """
+    获取文件内容的 SHA-256 摘要，结果缓存在同名的 .sha256 文件中。
+
+    缓存记录了文件的修改时间和大小，文件变化后会重新计算。
+
+    参数:
+        file_path (str): 文件路径。
+
+    返回:
+        str: 十六进制摘要字符串。
+    """
+    stat = os.stat(file_path)
+    signature = f"{stat.st_mtime_ns} {stat.st_size}"
+    cache_path = file_path + '.sha256'
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cached_hash, _, cached_signature = f.read().partition(' ')
+        if cached_signature == signature:
+            return cached_hash
+    except (OSError, ValueError):
+        pass
+
+    file_hash = compute_file_hash(file_path)
+    temp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(f"{file_hash} {signature}")
+        os.replace(temp_path, cache_path)
+    except OSError:
+        pass
+    return file_hash
+
+
+def touch_access_time(path):
+    """
+    将缓存文件的访问时间更新为当前时间（修改时间不变），后台清理按访问时间淘汰最近最少使用的文件。
+    显式更新，不依赖文件系统的 noatime、relatime 挂载选项。文件已被删除时忽略。
+
+    参数:
+        path (str): 文件路径。
+    """
+    try:
+        os.utime(path, (time.time(), os.stat(path).st_mtime))
+    except OSError:
+        pass
+
+
+def connect_sqlite(db_path, *schema, timeout=5):
+    """
+    打开多个工作进程共享的 SQLite 数据库，不存在时创建，并执行建表语句。
+
+    参数:
+        db_path (str): 数据库文件路径。
+        *schema (str): CREATE TABLE IF NOT EXISTS 等建表语句。
+        timeout (float): 等待其他进程释放写锁的最长时间（秒）。
+
+    返回:
+        sqlite3.Connection: 自动提交模式的连接，事务由调用方显式开始。
+    """
+    os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+    connection = sqlite3.connect(db_path, timeout=timeout, isolation_level=None)
+    connection.execute('PRAGMA journal_mode=WAL')  # 读写互不阻塞
+    for statement in schema:
+        connection.execute(statement)
+    return connection
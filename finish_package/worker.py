@@ -0,0 +1,163 @@
+# 分布式模式的工作节点：python worker.py
+# 从共享队列取出转换作业，在本节点转换后将输出存入对象存储；工作目录和 templates/config.py 与 Web 节点相同，
+# 可以与 Web 节点部署在同一台主机上，也可以单独部署。收到 SIGTERM 或 Ctrl+C 后完成正在进行的转换再退出
+import base64
+import os
+import signal
+import threading
+import time
+from templates import config
+from app import app, plan_conversion, ensure_local_package, publish_conversion_outputs, start_scheduler, \
+    touch_session
+from util.distributed_queue import pop_job, get_cancelled_jobs, finish_job, requeue_stale_jobs, LEASE_SECONDS
+from util.job_operations import run_conversion, cancel_flight, hash_flight_key, ConversionCancelledError
+from util.process_operations import ProcessLimitError
+from util.metrics import observe_stage, start_metrics_server
+from util.tracing import start_timeline, clear_timeline, export_spans
+from util.log_operations import clear_log_context
+
+# 取出作业时队列为空的最长等待时间（秒），之后检查是否需要退出
+POP_TIMEOUT_SECONDS = 1
+
+# 检查取消和续约租约的间隔（秒）
+WATCH_SECONDS = 1
+
+# 本节点正在运行的作业：作业 ID -> (作业内容, 本节点的转换键摘要)
+_running = {}
+_running_lock = threading.Lock()
+
+
+def run_job(payload):
+    """
+    在本节点运行一个作业：按需取回压缩包，按作业中的参数重新生成转换计划并转换，成功后将输出存入对象存储。
+
+    参数:
+        payload (dict): 作业内容。
+
+    返回:
+        dict: 作业结果，status 为 done、failed、cancelled 或 limit；usage 为子进程实测的资源使用。
+    """
+    urlid = payload['urlid']
+    output_format = payload['output_format']
+    usage = {}
+
+    def on_measured(measured, succeeded):
+        # 成本模型由提交作业的 Web 节点根据结果中的实测值修正
+        usage.update(measured)
+
+    try:
+        if get_cancelled_jobs([payload]):
+            return {'status': 'cancelled'}
+        if not ensure_local_package(urlid):
+            return {'status': 'failed', 'error': 'package not found'}
+        logo_data = base64.b64decode(payload['logo']) if payload['logo'] else None
+        plan = plan_conversion(urlid, output_format, payload['options'], logo_data, payload['asset_url_prefix'])
+        if plan is None:
+            return {'status': 'failed', 'error': 'markdown file not found'}
+        output_file, flight_key, prepare_conversion, _, _ = plan
+        with _running_lock:
+            _running[payload['job_id']] = (payload, hash_flight_key(flight_key))
+        run_conversion(urlid, output_format, flight_key, output_file, prepare_conversion,
+                       estimate=payload['estimate'], on_measured=on_measured, client=payload['client'],
+                       weight=payload['weight'])
+        if not os.path.exists(output_file):
+            return {'status': 'failed', 'error': 'output file not created', 'usage': usage or None}
+        publish_conversion_outputs(urlid, output_file, payload['asset_url_prefix'])
+        touch_session(urlid, measure=True)  # 本节点的输出计入会话目录的大小
+        return {'status': 'done', 'output_name': os.path.basename(output_file), 'usage': usage or None}
+    except ConversionCancelledError:
+        return {'status': 'cancelled', 'usage': usage or None}
+    except ProcessLimitError as e:
+        return {'status': 'limit', 'usage': usage or None, **e.to_dict()}
+    except Exception as e:
+        app.logger.error(f"Distributed conversion {output_format} for {urlid} failed: {e}")
+        return {'status': 'failed', 'error': str(e), 'usage': usage or None}
+    finally:
+        with _running_lock:
+            _running.pop(payload['job_id'], None)
+
+
+def process_jobs(stop_event):
+    """
+    作业线程：反复取出并运行作业，直到 stop_event 被设置。
+    """
+    while not stop_event.is_set():
+        try:
+            payload = pop_job(POP_TIMEOUT_SECONDS)
+        except Exception as e:
+            app.logger.error(f"Failed to pop job: {e}")
+            stop_event.wait(POP_TIMEOUT_SECONDS)
+            continue
+        if payload is None:
+            continue
+        # 从提交到被本节点取出的时间（各主机的时钟需要同步）
+        observe_stage('distributed_queue_wait', payload['output_format'], max(time.time() - payload['submitted_at'], 0))
+        started = time.monotonic()
+        clear_log_context(job_id=payload['job_id'], urlid=payload['urlid'], output_format=payload['output_format'])
+        # 作业的时间线随结果返回，提交作业的 Web 节点将其并入请求的时间线
+        timeline = start_timeline()
+        result = run_job(payload)
+        clear_timeline()
+        result.update(timeline=export_spans(timeline), started_at=timeline['started_at'])
+        try:
+            finish_job(payload, result)
+        except Exception as e:
+            app.logger.error(f"Failed to report result of job {payload['job_id']}: {e}")
+        app.logger.info(f"Job {payload['output_format']} for {payload['urlid']} {result['status']} "
+                        f"in {time.monotonic() - started:.1f}s")
+
+
+def watch_jobs(stop_event):
+    """
+    监视线程：每秒续约本节点正在运行的作业，终止已被取消的作业；每隔一个租约时间将其他节点遗留的作业重新排队。
+    """
+    last_requeue = time.monotonic()
+    while not stop_event.wait(WATCH_SECONDS):
+        try:
+            with _running_lock:
+                running = dict(_running)
+            for job_id in get_cancelled_jobs([payload for payload, _ in running.values()]):
+                cancel_flight(running[job_id][1])
+            if time.monotonic() - last_requeue >= LEASE_SECONDS:
+                last_requeue = time.monotonic()
+                requeued = requeue_stale_jobs()
+                if requeued:
+                    app.logger.warning(f"Requeued {requeued} jobs whose worker stopped renewing its lease")
+        except Exception as e:
+            app.logger.error(f"Failed to watch running jobs: {e}")
+
+
+if __name__ == '__main__':
+    if not config.DISTRIBUTED_MODE:
+        raise SystemExit("worker.py requires DISTRIBUTED_MODE = True in templates/config.py")
+
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+
+    # 本节点的解压和输出目录同样按过期索引和磁盘预算清理
+    scheduler_thread = start_scheduler(stop_event)
+
+    if config.WORKER_METRICS_PORT:
+        start_metrics_server(config.WORKER_METRICS_PORT)  # 没有 Web 节点的主机单独提供指标
+
+    # 每个作业线程同时运行一个作业，线程数与本节点的并发转换数相同
+    job_threads = [threading.Thread(target=process_jobs, args=(stop_event,), name=f'job-{index}', daemon=True)
+                   for index in range(config.CONVERSION_WORKERS)]
+    for thread in job_threads:
+        thread.start()
+    # 退出时等作业线程都结束后再停止续约，避免正在完成的作业被其他节点重新排队
+    watch_stop_event = threading.Event()
+    watch_thread = threading.Thread(target=watch_jobs, args=(watch_stop_event,), name='watch-jobs', daemon=True)
+    watch_thread.start()
+    app.logger.info(f"Worker started with {config.CONVERSION_WORKERS} job threads")
+
+    try:
+        while not stop_event.wait(1):
+            pass
+    except KeyboardInterrupt:
+        stop_event.set()
+    for thread in job_threads:
+        thread.join()
+    watch_stop_event.set()
+    watch_thread.join()
+    scheduler_thread.join()
@@ -0,0 +1,7 @@
+# 生产环境入口：gunicorn -c gunicorn.conf.py wsgi:app
+# 每个工作进程导入本模块并尝试运行定时任务，只有取得锁的一个进程真正运行
+import threading
+from app import app, start_scheduler
+
+stop_event = threading.Event()
+start_scheduler(stop_event)
@@ -1,6 +1,11 @@
 import os
 import zipfile
 import shutil
+import uuid
+
+
+# 待删除的目录先改名移入工作目录下的 TRASH_DIR，请求立即返回，再由 reap_trash 在后台限速删除
+TRASH_DIR = 'trash'
 
 
 # def clear_directory(directory):
@@ -75,14 +80,58 @@ def get_all_subdirs(directory):
 
 def clear_directory(directory_path):
     """
-    清空指定目录的所有内容。
+    清空指定目录的所有内容：将目录移入回收目录后重新创建，旧内容由 reap_trash 在后台删除。
+    """
+    move_to_trash(directory_path)
+    os.makedirs(directory_path, exist_ok=True)
+
+
+def move_to_trash(path):
+    """
+    将目录改名移入工作目录下的 TRASH_DIR，耗时与目录大小无关。不能改名（如 path 位于另一个文件系统）时直接删除。
+
+    参数:
+        path (str): 要删除的目录。
+
+    返回:
+        bool: path 存在并已移走或删除时为 True，不存在时为 False。
+    """
+    trash_dir = os.path.join(os.getcwd(), TRASH_DIR)
+    os.makedirs(trash_dir, exist_ok=True)
+    try:
+        os.rename(path, os.path.join(trash_dir, f'{uuid.uuid4().hex}-{os.path.basename(path)}'))
+    except FileNotFoundError:
+        return False
+    except OSError:
+        shutil.rmtree(path, ignore_errors=True)
+    return True
+
+
+def reap_trash(stop_event, entries_per_second=1000, interval=5):
+    """
+    回收线程：每 interval 秒删除一次 TRASH_DIR 中的文件和目录，每秒最多删除 entries_per_second 个，
+    直到 stop_event 被设置。
+
+    参数:
+        stop_event (threading.Event): 停止事件。
+        entries_per_second (float): 每秒最多删除的文件和目录数。
+        interval (float): 两次检查之间的间隔（秒）。
     """
-    for filename in os.listdir(directory_path):
-        file_path = os.path.join(directory_path, filename)
-        try:
-            if os.path.isfile(file_path) or os.path.islink(file_path):
-                os.unlink(file_path)
-            elif os.path.isdir(file_path):
-                shutil.rmtree(file_path)
-        except Exception as e:
-            print(f'Failed to delete {file_path}. Reason: {e}')
+    batch = max(1, int(entries_per_second / 10))  # 每秒约唤醒 10 次
+    deleted = 0
+    while not stop_event.is_set():
+        for directory, dirs, files in os.walk(os.path.join(os.getcwd(), TRASH_DIR), topdown=False):
+            for name in files + dirs:
+                path = os.path.join(directory, name)
+                try:
+                    if name in dirs and not os.path.islink(path):
+                        os.rmdir(path)
+                    else:
+                        os.unlink(path)
+                except OSError as e:
+                    print(f'Failed to delete {path}. Reason: {e}')
+                    continue
+                deleted += 1
+                if deleted % batch == 0 and stop_event.wait(batch / entries_per_second):
+                    return
+        stop_event.wait(interval)